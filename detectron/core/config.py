@@ -104,6 +104,16 @@ __C.TRAIN.BG_THRESH_LO = 0.0
 # Use horizontally-flipped images during training?
 __C.TRAIN.USE_FLIPPED = True
 
+# Create the horizontally-flipped training examples on demand: the flipped
+# roidb entries share the data of the original entries and their boxes, segms
+# and keypoints are flipped when a minibatch is made from them (see
+# datasets.roidb.get_minibatch_entry) instead of when the roidb is loaded
+__C.TRAIN.FLIP_ON_DEMAND = False
+
+# Number of flipped entries created on demand that are kept in an LRU cache
+# (0 to disable the cache)
+__C.TRAIN.FLIP_ON_DEMAND_CACHE_SIZE = 0
+
 # Overlap required between an RoI and a ground-truth box in order for that
 # (RoI, gt box) pair to be used as a bounding-box regression training example
 __C.TRAIN.BBOX_THRESH = 0.5
@@ -126,6 +136,14 @@ __C.TRAIN.PROPOSAL_FILES = ()
 # faster)
 __C.TRAIN.ASPECT_GROUPING = True
 
+# Number of buckets of TRAIN.ASPECT_GROUPING. If > 0, the images are grouped by
+# the (height, width) shape that they are scaled to into buckets of similar
+# aspect ratio with the same number of images (see utils.blob.get_shape_buckets)
+# instead of only horizontal / vertical groups, which reduces the padding of the
+# minibatch blobs (the padding ratio is logged as 'padding' in the training
+# stats)
+__C.TRAIN.ASPECT_BUCKETS = 0
+
 # ---------------------------------------------------------------------------- #
 # RPN training options
 # ---------------------------------------------------------------------------- #
@@ -153,6 +171,10 @@ __C.TRAIN.RPN_NMS_THRESH = 0.7
 # When FPN is used, this is *per FPN level* (not total)
 __C.TRAIN.RPN_PRE_NMS_TOP_N = 12000
 
+# Number of top scoring RPN proposals to keep before applying NMS, selected
+# jointly over all the FPN levels (only used with FPN.RPN_JOINT_PROPOSALS)
+__C.TRAIN.RPN_JOINT_PRE_NMS_TOP_N = 4000
+
 # Number of top scoring RPN proposals to keep after applying NMS
 # This is the total number of RPN proposals produced (for both FPN and non-FPN
 # cases)
@@ -181,6 +203,60 @@ __C.TRAIN.FREEZE_CONV_BODY = False
 # output directory
 __C.TRAIN.AUTO_RESUME = True
 
+# Cache the training roidb built by datasets.roidb.combined_roidb_for_training
+# in ROIDB_CACHE_DIR and load it from there in later runs. Snapshots are keyed
+# by the content of the annotation and proposal files and by the config options
+# used to build the roidb, so they are rebuilt when any of them changes
+__C.TRAIN.ROIDB_CACHE = False
+
+# Directory of the training roidb snapshots (see TRAIN.ROIDB_CACHE)
+__C.TRAIN.ROIDB_CACHE_DIR = b'/tmp/detectron-roidb-cache'
+
+# Store the training roidb as a few flat arrays per field with per-entry offset
+# tables instead of a list of dicts (see datasets/packed_roidb.py), which takes
+# less memory and is not copied page by page by forked processes
+__C.TRAIN.PACKED_ROIDB = False
+
+# If not empty, the packed roidb (see TRAIN.PACKED_ROIDB) is saved to this file
+# and used through a read-only memory mapping of it, which is shared by all the
+# processes that use the same file (use a file in /dev/shm to place it in shared
+# memory)
+__C.TRAIN.PACKED_ROIDB_FILE = b''
+
+
+# ---------------------------------------------------------------------------- #
+# Cache of the pre-resized training images
+# ---------------------------------------------------------------------------- #
+__C.TRAIN.IMAGE_CACHE = AttrDict()
+
+# Read the training images from a cache of the images resized to the largest of
+# TRAIN.SCALES (or to each of them, see PER_SCALE) instead of decoding the full
+# resolution image and resizing it for every minibatch (see
+# roi_data/image_cache.py). Images are added to the cache on local disk the
+# first time they are read and the most recently used ones are also kept decoded
+# in memory. The image scales are still relative to the original images, but a
+# cached image is resized again in uint8 to the sampled scale unless PER_SCALE
+# is True, so the blobs differ slightly from the ones built without the cache
+__C.TRAIN.IMAGE_CACHE.ENABLED = False
+
+# Directory of the cache (can be shared by several runs and processes)
+__C.TRAIN.IMAGE_CACHE.DIR = b'/tmp/detectron-image-cache'
+
+# Cache the images resized to each of TRAIN.SCALES so that they are used as is;
+# takes up to len(TRAIN.SCALES) times more space
+__C.TRAIN.IMAGE_CACHE.PER_SCALE = False
+
+# Format of the cached images: 'npy' (uncompressed, the fastest to read) or
+# 'jpg' (lossy, see JPEG_QUALITY, but several times smaller)
+__C.TRAIN.IMAGE_CACHE.FORMAT = b'npy'
+
+# Quality of the images cached in the 'jpg' format
+__C.TRAIN.IMAGE_CACHE.JPEG_QUALITY = 95
+
+# Maximum size in GB of the decoded images kept in memory by each process; the
+# least recently used ones are evicted above that size
+__C.TRAIN.IMAGE_CACHE.MEMORY_SIZE_GB = 4.
+
 
 # ---------------------------------------------------------------------------- #
 # Data loader options (see detectron/roi_data/loader.py for more info)
@@ -198,6 +274,59 @@ __C.DATA_LOADER.MINIBATCH_QUEUE_SIZE = 64
 # Capacity of the per GPU blobs queue
 __C.DATA_LOADER.BLOBS_QUEUE_CAPACITY = 8
 
+# Adapt the number of loader threads (starting from NUM_THREADS) and the size of
+# the minibatch queue (starting from MINIBATCH_QUEUE_SIZE, its maximum) every
+# ADAPT_PERIOD seconds of training, from the occupancy of the minibatch queue
+# and the rate at which training consumes minibatches: threads are added when
+# training waits for data and removed, and then the queue shrunk, when the
+# loaders are ahead (see roi_data/loader_controller.py). The capacity of the
+# per GPU blobs queues does not change
+__C.DATA_LOADER.ADAPTIVE = False
+
+# Bounds of the number of loader threads with DATA_LOADER.ADAPTIVE
+__C.DATA_LOADER.MIN_THREADS = 1
+__C.DATA_LOADER.MAX_THREADS = 8
+
+# Minimum size of the minibatch queue with DATA_LOADER.ADAPTIVE
+__C.DATA_LOADER.MIN_MINIBATCH_QUEUE_SIZE = 4
+
+# Period in seconds of the adaptation with DATA_LOADER.ADAPTIVE
+__C.DATA_LOADER.ADAPT_PERIOD = 30.
+
+# Number of worker processes that add the ground-truth annotations to the roidb
+# entries of a json dataset in parallel, each processing shards of the images
+# (see datasets.json_dataset.JsonDataset.get_roidb); 0 or 1 to add them in the
+# main process. Workers are forked from the main process and share its copy of
+# the loaded annotations
+__C.DATA_LOADER.NUM_ROIDB_WORKERS = 0
+
+# Time the stages of the training data pipeline (image decoding and resizing,
+# anchor and RoI targets, minibatch queue waits, ...; see roi_data/profiler.py)
+# and report per stage time statistics with the training stats every
+# LOG_PERIOD iterations, along with the stage that takes the most time
+__C.DATA_LOADER.PROFILE = False
+
+
+# ---------------------------------------------------------------------------- #
+# Image blob options (training and inference)
+# ---------------------------------------------------------------------------- #
+__C.IM_BLOB = AttrDict()
+
+# Resize uint8 images before converting them to float32 and subtracting the
+# pixel means, which is done while writing them into the NCHW blob (see
+# utils.blob.prep_im_for_blob); avoids a float32 copy of each full resolution
+# image and resizes 4x less data, but the outputs differ slightly from resizing
+# the float32 images
+__C.IM_BLOB.UINT8_RESIZE = False
+
+# Maximum number of image blob buffers kept for reuse, keyed by the padded blob
+# shape (see utils.blob.im_list_to_blob); a buffer is reused once nothing else
+# references it (e.g., once a minibatch has been fed to the workspace). The
+# buffers of the minibatches waiting in the data loader queues are counted, so
+# this should be larger than DATA_LOADER.MINIBATCH_QUEUE_SIZE to reuse buffers
+# during training. 0 to allocate a new blob each time
+__C.IM_BLOB.POOL_SIZE = 0
+
 
 # ---------------------------------------------------------------------------- #
 # Inference ('test') options
@@ -238,6 +367,10 @@ __C.TEST.RPN_NMS_THRESH = 0.7
 # When FPN is used, this is *per FPN level* (not total)
 __C.TEST.RPN_PRE_NMS_TOP_N = 12000
 
+# Number of top scoring RPN proposals to keep before applying NMS, selected
+# jointly over all the FPN levels (only used with FPN.RPN_JOINT_PROPOSALS)
+__C.TEST.RPN_JOINT_PRE_NMS_TOP_N = 2000
+
 # Number of top scoring RPN proposals to keep after applying NMS
 # This is the total number of RPN proposals produced (for both FPN and non-FPN
 # cases)
@@ -266,12 +399,78 @@ __C.TEST.COMPETITION_MODE = True
 # COCO API to get COCO style AP on PASCAL VOC)
 __C.TEST.FORCE_JSON_DATASET_EVAL = False
 
+# Run inference with a single fused CPU net (conv body, box head, in-graph box
+# post-processing and all enabled RoI heads) instead of the cascade of separate
+# nets driven from Python (see modeling.fused_net). Only supports end-to-end
+# Faster R-CNN style models without test-time augmentation or box voting
+__C.TEST.FUSED_NET = False
+
+# Run test-time augmentation (TEST.BBOX_AUG, TEST.MASK_AUG, TEST.KPS_AUG and
+# TEST.BODY_UV_AUG) with the batched engine: the augmented views of an image
+# are prepared up front, views with the same input shape are run as one batch
+# and the conv body features of each batch are shared by all RoI heads (see
+# core.test_aug)
+__C.TEST.BATCHED_AUG = False
+
+# With TEST.BATCHED_AUG, group the views of an image into about this many
+# batches by the shape of their rescaled images (see
+# utils.blob.get_shape_buckets) and pad the views of a batch to its largest
+# shape: fewer, larger net runs at the cost of some padding. If 0, only views
+# with the same input shape are batched together
+__C.TEST.AUG_BUCKETS = 0
+
 # [Inferred value; do not set directly in a config]
 # Indicates if precomputed proposals are used at test time
 # Not set for 1-stage models and 2-stage models with RPN subnetwork enabled
 __C.TEST.PRECOMPUTED_PROPOSALS = True
 
 
+# ---------------------------------------------------------------------------- #
+# Multi-process inference with a pool of persistent workers
+# ---------------------------------------------------------------------------- #
+__C.TEST.WORKER_POOL = AttrDict()
+
+# With --multi-gpu-testing, run inference in a pool of persistent worker
+# processes that pull images one at a time from a shared work queue and send
+# their results back over pipes (see utils.subprocess.WorkerPool) instead of
+# running one test_net subprocess per static range of images
+# Workers are forked from the parent process, which must not have used CUDA
+# (e.g., tools/test_net.py)
+__C.TEST.WORKER_POOL.ENABLED = False
+
+# Number of worker processes (0 means one worker per GPU, i.e., NUM_GPUS)
+# Workers are assigned to the GPUs round robin. If TEST.FUSED_NET is True the
+# workers run on CPU and NUM_GPUS is ignored
+__C.TEST.WORKER_POOL.NUM_WORKERS = 0
+
+
+# ---------------------------------------------------------------------------- #
+# Disk cache of the box detection stage of inference
+# ---------------------------------------------------------------------------- #
+__C.TEST.PROPOSAL_CACHE = AttrDict()
+
+# Cache the per-image outputs of the conv body, RPN and box head net (the class
+# scores and boxes of the proposals before NMS) on local disk and serve them in
+# later runs, e.g., when iterating on the box post-processing options or on the
+# RoI heads (mask, keypoint, body UV) test options. Entries are keyed by a hash
+# of the image, of the weights file and of the config options that affect the
+# box detection stage (see core.proposal_cache)
+# Not used with RetinaNet, TEST.FUSED_NET, TEST.BATCHED_AUG or TEST.BBOX_AUG
+__C.TEST.PROPOSAL_CACHE.ENABLED = False
+
+# Directory of the cache (can be shared by several runs and processes)
+__C.TEST.PROPOSAL_CACHE.DIR = b'/tmp/detectron-proposal-cache'
+
+# Maximum size of the cache in GB; the least recently used entries are evicted
+# above that size
+__C.TEST.PROPOSAL_CACHE.MAX_SIZE_GB = 20.
+
+# Also cache the conv body features used by the RoI heads. Without them, a
+# cache hit skips the RPN and box head but the conv body is still run when a
+# RoI head is enabled. Features take several MB per image
+__C.TEST.PROPOSAL_CACHE.FEATURES = False
+
+
 # ---------------------------------------------------------------------------- #
 # Test-time augmentations for bounding box detection
 # See configs/test_time_aug/e2e_mask_rcnn_R-50-FPN_2x.yaml for an example
@@ -383,6 +582,39 @@ __C.TEST.KPS_AUG.ASPECT_RATIOS = ()
 # Horizontal flip at each aspect ratio
 __C.TEST.KPS_AUG.ASPECT_RATIO_H_FLIP = False
 
+# ---------------------------------------------------------------------------- #
+# Test-time augmentations for body UV (DensePose) prediction
+# ---------------------------------------------------------------------------- #
+__C.TEST.BODY_UV_AUG = AttrDict()
+
+# Enable test-time augmentation for body UV prediction if True
+__C.TEST.BODY_UV_AUG.ENABLED = False
+
+# Heuristic used to combine the part segmentation (AnnIndex) and patch index
+# (Index_UV) predictions; the U and V estimates are always averaged
+#   Valid options: ('LOGIT_AVG', 'SOFT_AVG')
+__C.TEST.BODY_UV_AUG.HEUR = b'LOGIT_AVG'
+
+# Horizontal flip at the original scale (id transform)
+# The predictions on the flipped image are mapped back with the DensePose
+# symmetry tables (see utils.densepose_methods)
+__C.TEST.BODY_UV_AUG.H_FLIP = False
+
+# Each scale is the pixel size of an image's shortest side
+__C.TEST.BODY_UV_AUG.SCALES = ()
+
+# Max pixel size of the longer side
+__C.TEST.BODY_UV_AUG.MAX_SIZE = 4000
+
+# Horizontal flip at each scale
+__C.TEST.BODY_UV_AUG.SCALE_H_FLIP = False
+
+# Each aspect ratio is relative to image width
+__C.TEST.BODY_UV_AUG.ASPECT_RATIOS = ()
+
+# Horizontal flip at each aspect ratio
+__C.TEST.BODY_UV_AUG.ASPECT_RATIO_H_FLIP = False
+
 # ---------------------------------------------------------------------------- #
 # Soft NMS
 # ---------------------------------------------------------------------------- #
@@ -670,6 +902,14 @@ __C.RPN.STRIDE = 16
 # RPN anchor aspect ratios
 __C.RPN.ASPECT_RATIOS = (0.5, 1, 2)
 
+# Use the C++ CPU implementations of the proposal ops
+# (detectron/ops/generate_proposals_op.cc and
+# detectron/ops/collect_and_distribute_fpn_rpn_proposals_op.cc) instead of the
+# Python ops at inference (training always uses the Python ops); on GPU, they
+# run on the CPU through GPUFallbackOp (see the .cu files of the ops); requires
+# the custom ops library (see c2_utils.import_custom_ops)
+__C.RPN.NATIVE_PROPOSAL_OPS = False
+
 
 # ---------------------------------------------------------------------------- #
 # FPN options
@@ -715,6 +955,12 @@ __C.FPN.RPN_ASPECT_RATIOS = (0.5, 1, 2)
 # The anchor size doubled each level after that
 # With a default of 32 and levels 2 to 6, we get anchor sizes of 32 to 512
 __C.FPN.RPN_ANCHOR_START_SIZE = 32
+# Generate the proposals of all the FPN RPN levels with a single op that
+# selects the RPN_JOINT_PRE_NMS_TOP_N top scoring anchors jointly over the
+# levels before decoding them and applies NMS once (proposals of different
+# levels do not suppress each other, as with per level NMS), instead of
+# running GenerateProposals on each level (RPN_PRE_NMS_TOP_N per level)
+__C.FPN.RPN_JOINT_PROPOSALS = False
 # Use extra FPN levels, as done in the RetinaNet paper
 __C.FPN.EXTRA_CONV_LEVELS = False
 # Use GroupNorm in the FPN-specific layers (lateral, etc.)
@@ -769,6 +1015,10 @@ __C.MRCNN.WEIGHT_LOSS_MASK = 1.0
 # Binarization threshold for converting soft masks to hard masks
 __C.MRCNN.THRESH_BINARIZE = 0.5
 
+# Number of threads used at inference to paste the masks of an image in their
+# boxes and RLE encode them (1 means no thread pool; see core.test.segm_results)
+__C.MRCNN.RESULTS_NUM_THREADS = 1
+
 
 # ---------------------------------------------------------------------------- #
 # Keyoint Mask R-CNN options ("KRCNN" = Mask R-CNN with Keypoint support)
@@ -835,6 +1085,11 @@ __C.KRCNN.MIN_KEYPOINT_COUNT_FOR_VALID_MINIBATCH = 20
 # below this minimum size
 __C.KRCNN.INFERENCE_MIN_SIZE = 0
 
+# Infer the keypoint locations with utils.keypoints.heatmaps_to_keypoints_fast
+# (sub-pixel argmax of the heatmaps) instead of resizing the heatmaps to the
+# RoI size
+__C.KRCNN.FAST_HEATMAPS_TO_KEYPOINTS = False
+
 # Multi-task loss weight to use for keypoints
 # Recommended values:
 #   - use 1.0 if KRCNN.NORMALIZE_BY_VISIBLE_KEYPOINTS is True
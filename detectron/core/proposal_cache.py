@@ -0,0 +1,215 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Disk cache of the box detection stage of inference (see
+cfg.TEST.PROPOSAL_CACHE).
+
+Each entry holds the outputs of core.test.im_detect_bbox on one image (class
+scores and boxes of the proposals before NMS and the image scale) and,
+optionally, the conv body features used by the RoI heads. Entries are stored
+in one file per key and evicted in least recently used order (the modification
+time of an entry file is its last access time).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import cPickle as pickle
+import hashlib
+import logging
+import os
+
+from caffe2.python import workspace
+
+from detectron.core.config import cfg
+from detectron.utils.io import get_file_sha1sum
+from detectron.utils.io import save_object
+
+logger = logging.getLogger(__name__)
+
+# Config options that do not change the outputs of the conv body, RPN and box
+# head net (model.net) on an image; all other options are part of the key
+_CFG_KEYS_NOT_IN_KEY = [
+    'BODY_UV_RCNN',
+    'DOWNLOAD_CACHE',
+    'IM_BLOB.POOL_SIZE',
+    'KRCNN',
+    'MODEL.BODY_UV_ON',
+    'MODEL.KEYPOINTS_ON',
+    'MODEL.MASK_ON',
+    'MRCNN',
+    'NUM_GPUS',
+    'OUTPUT_DIR',
+    'TEST.BBOX_VOTE',
+    'TEST.BODY_UV_AUG',
+    'TEST.COMPETITION_MODE',
+    'TEST.DATASETS',
+    'TEST.DETECTIONS_PER_IM',
+    'TEST.FORCE_JSON_DATASET_EVAL',
+    'TEST.KPS_AUG',
+    'TEST.MASK_AUG',
+    'TEST.NMS',
+    'TEST.PROPOSAL_CACHE',
+    'TEST.PROPOSAL_FILES',  # The proposals themselves are part of the key
+    'TEST.SCORE_THRESH',
+    'TEST.SOFT_NMS',
+    'TEST.WEIGHTS',  # The content of the weights file is part of the key
+    'TEST.WORKER_POOL',
+    'VIS',
+    'VIS_TH',
+]
+
+
+class ProposalCache(object):
+    """LRU cache on local disk of the box detection stage of inference."""
+
+    def __init__(self, model, weights_file):
+        self._dir = cfg.TEST.PROPOSAL_CACHE.DIR
+        self._max_size = int(cfg.TEST.PROPOSAL_CACHE.MAX_SIZE_GB * 1024**3)
+        self._fingerprint = _get_fingerprint(weights_file)
+        self._feature_blobs = _get_feature_blob_names(model)
+        try:
+            os.makedirs(self._dir)
+        except OSError:
+            # Already created (possibly by another process)
+            assert os.path.isdir(self._dir), self._dir
+        self._size = self._evict()
+        logger.info(
+            'Proposal cache: {} ({:.2f} GB)'.format(
+                self._dir, self._size / 1024.**3
+            )
+        )
+
+    def get_key(self, im, box_proposals=None):
+        """Key of the entry of an image (and its precomputed proposals)."""
+        hash_obj = hashlib.sha1(self._fingerprint)
+        for arr in [im, box_proposals]:
+            if arr is not None:
+                hash_obj.update('{} {}'.format(arr.dtype, arr.shape).encode())
+                hash_obj.update(arr.tobytes())
+        return hash_obj.hexdigest()
+
+    def get(self, key):
+        """Return the cached entry (a dict) with the given key or None."""
+        file_name = self._get_file_name(key)
+        try:
+            with open(file_name, 'rb') as f:
+                entry = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            # Mark as recently used
+            os.utime(file_name, None)
+        except OSError:
+            # Evicted by another process
+            pass
+        return entry
+
+    def put(self, key, scores, boxes, im_scale):
+        """Add the outputs of im_detect_bbox on an image to the cache. The
+        features used by the RoI heads are fetched from the workspace if
+        cfg.TEST.PROPOSAL_CACHE.FEATURES is True.
+        """
+        entry = dict(scores=scores, boxes=boxes, im_scale=im_scale)
+        if cfg.TEST.PROPOSAL_CACHE.FEATURES:
+            entry['features'] = {
+                name: workspace.FetchBlob(name)
+                for name in self._feature_blobs
+            }
+        file_name = self._get_file_name(key)
+        # Write to a temporary file first so that concurrent readers never see
+        # a partial entry
+        tmp_file_name = '{}.{}.tmp'.format(file_name, os.getpid())
+        save_object(entry, tmp_file_name)
+        os.rename(tmp_file_name, file_name)
+        self._size += os.path.getsize(file_name)
+        if self._size > self._max_size:
+            self._size = self._evict()
+
+    def feed_features(self, entry):
+        """Feed the cached features used by the RoI heads into the workspace.
+        Returns False if the entry does not have all of them.
+        """
+        features = entry.get('features', {})
+        if any(name not in features for name in self._feature_blobs):
+            return False
+        for name in self._feature_blobs:
+            workspace.FeedBlob(name, features[name])
+        return True
+
+    def _get_file_name(self, key):
+        return os.path.join(self._dir, key + '.pkl')
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits in its
+        maximum size. Returns the size of the cache.
+        """
+        entries = []
+        for name in os.listdir(self._dir):
+            if not name.endswith('.pkl'):
+                continue
+            file_name = os.path.join(self._dir, name)
+            try:
+                st = os.stat(file_name)
+            except OSError:
+                # Evicted by another process
+                continue
+            entries.append((st.st_mtime, st.st_size, file_name))
+        size = sum(e[1] for e in entries)
+        for _, file_size, file_name in sorted(entries):
+            if size <= self._max_size:
+                break
+            try:
+                os.remove(file_name)
+            except OSError:
+                pass
+            size -= file_size
+        return size
+
+
+def _get_feature_blob_names(model):
+    """Names of the blobs computed by model.net that the RoI head nets use."""
+    head_nets = []
+    if cfg.MODEL.MASK_ON:
+        head_nets.append(model.mask_net)
+    if cfg.MODEL.KEYPOINTS_ON:
+        head_nets.append(model.keypoint_net)
+    if cfg.MODEL.BODY_UV_ON:
+        head_nets.append(model.body_uv_net)
+    if len(head_nets) == 0:
+        return []
+    net_outputs = {o for op in model.net.Proto().op for o in op.output}
+    return sorted({
+        blob for net in head_nets for blob in net.Proto().external_input
+        if blob in net_outputs
+    })
+
+
+def _get_fingerprint(weights_file):
+    """Hash of the weights file and of the config options that affect the box
+    detection stage.
+    """
+    hash_obj = hashlib.sha1(get_file_sha1sum(weights_file).encode())
+    for key, value in sorted(_flatten_cfg(cfg)):
+        if not any(
+            key == k or key.startswith(k + '.') for k in _CFG_KEYS_NOT_IN_KEY
+        ):
+            hash_obj.update('{}: {!r}\n'.format(key, value).encode('utf-8'))
+    return hash_obj.digest()
+
+
+def _flatten_cfg(cfg_dict, prefix=''):
+    """List the (full key, value) pairs of a config."""
+    items = []
+    for k, v in cfg_dict.items():
+        if isinstance(v, dict):
+            items.extend(_flatten_cfg(v, prefix + k + '.'))
+        else:
+            items.append((prefix + k, v))
+    return items
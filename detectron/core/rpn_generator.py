@@ -57,7 +57,11 @@ def generate_rpn_on_dataset(
     dataset = JsonDataset(dataset_name)
     test_timer = Timer()
     test_timer.tic()
-    if multi_gpu:
+    if multi_gpu and cfg.TEST.WORKER_POOL.ENABLED:
+        _boxes, _scores, _ids, rpn_file = worker_pool_generate_rpn_on_dataset(
+            weights_file, dataset_name, output_dir
+        )
+    elif multi_gpu:
         num_images = len(dataset.get_roidb())
         _boxes, _scores, _ids, rpn_file = multi_gpu_generate_rpn_on_dataset(
             weights_file, dataset_name, _proposal_file_ignored, num_images,
@@ -111,6 +115,62 @@ def multi_gpu_generate_rpn_on_dataset(
     return boxes, scores, ids, rpn_file
 
 
+def worker_pool_generate_rpn_on_dataset(
+    weights_file, dataset_name, output_dir
+):
+    """Multi-process inference on a dataset with a pool of persistent workers
+    (see cfg.TEST.WORKER_POOL).
+    """
+    assert not cfg.TEST.FUSED_NET, \
+        'RPN proposal generation does not support CPU workers'
+    roidb, _, _, _ = get_roidb(dataset_name, None)
+    pool = subprocess_utils.get_worker_pool(
+        'rpn_proposals', weights_file,
+        lambda worker_id: _init_pool_worker(weights_file, worker_id),
+        _im_proposals_in_pool_worker
+    )
+    num_images = len(roidb)
+    boxes = [[] for _ in range(num_images)]
+    scores = [[] for _ in range(num_images)]
+    ids = [entry['id'] for entry in roidb]
+    try:
+        for n, (i, results) in enumerate(
+            pool.imap_unordered([entry['image'] for entry in roidb])
+        ):
+            boxes[i], scores[i] = results
+            if n % 10 == 0:
+                logger.info(
+                    'rpn_generate (worker pool): {:d}/{:d}'.format(
+                        n + 1, num_images
+                    )
+                )
+    except Exception:
+        # Do not reuse a pool that may have a dead worker
+        subprocess_utils.close_worker_pool(
+            'rpn_proposals', weights_file, terminate=True
+        )
+        raise
+    rpn_file = os.path.join(output_dir, 'rpn_proposals.pkl')
+    cfg_yaml = yaml.dump(cfg)
+    save_object(
+        dict(boxes=boxes, scores=scores, ids=ids, cfg=cfg_yaml), rpn_file
+    )
+    logger.info('Wrote RPN proposals to {}'.format(os.path.abspath(rpn_file)))
+    return boxes, scores, ids, rpn_file
+
+
+def _init_pool_worker(weights_file, worker_id):
+    gpu_id = subprocess_utils.get_pool_worker_gpu_id(worker_id)
+    return initialize_model(weights_file, gpu_id=gpu_id), gpu_id
+
+
+def _im_proposals_in_pool_worker(state, im_file):
+    model, gpu_id = state
+    im = cv2.imread(im_file)
+    with c2_utils.NamedCudaScope(gpu_id):
+        return im_proposals(model, im)
+
+
 def generate_rpn_on_range(
     weights_file,
     dataset_name,
@@ -131,13 +191,7 @@ def generate_rpn_on_range(
         'Output will be saved to: {:s}'.format(os.path.abspath(output_dir))
     )
 
-    model = model_builder.create(cfg.MODEL.TYPE, train=False, gpu_id=gpu_id)
-    nu.initialize_gpu_from_weights_file(
-        model, weights_file, gpu_id=gpu_id,
-    )
-    model_builder.add_inference_inputs(model)
-    workspace.CreateNet(model.net)
-
+    model = initialize_model(weights_file, gpu_id=gpu_id)
     boxes, scores, ids = generate_proposals_on_roidb(
         model,
         roidb,
@@ -160,6 +214,18 @@ def generate_rpn_on_range(
     return boxes, scores, ids, rpn_file
 
 
+def initialize_model(weights_file, gpu_id=0):
+    """Create the RPN inference model from the global cfg and load its weights.
+    """
+    model = model_builder.create(cfg.MODEL.TYPE, train=False, gpu_id=gpu_id)
+    nu.initialize_gpu_from_weights_file(
+        model, weights_file, gpu_id=gpu_id,
+    )
+    model_builder.add_inference_inputs(model)
+    workspace.CreateNet(model.net)
+    return model
+
+
 def generate_proposals_on_roidb(
     model, roidb, start_ind=None, end_ind=None, total_num_images=None,
     gpu_id=0,
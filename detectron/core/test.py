@@ -23,23 +23,37 @@ from __future__ import unicode_literals
 from collections import defaultdict
 import cv2
 import logging
+from multiprocessing.pool import ThreadPool
 import numpy as np
 
+from caffe2.proto import caffe2_pb2
 from caffe2.python import core
 from caffe2.python import workspace
-import pycocotools.mask as mask_util
 
 from detectron.core.config import cfg
 from detectron.utils.timer import Timer
+import detectron.core.test_aug as test_aug
 import detectron.core.test_retinanet as test_retinanet
 import detectron.modeling.FPN as fpn
 import detectron.utils.blob as blob_utils
 import detectron.utils.boxes as box_utils
+import detectron.utils.densepose_methods as dp_utils
 import detectron.utils.image as image_utils
 import detectron.utils.keypoints as keypoint_utils
+import detectron.utils.segms as segm_utils
 
 logger = logging.getLogger(__name__)
 
+# Outputs of the body uv head net used at inference
+_BODY_UV_OUTPUT_BLOB_NAMES = [
+    'AnnIndex', 'Index_UV', 'U_estimated', 'V_estimated'
+]
+
+_densepose_methods = None
+
+# Thread pool of segm_results
+_results_thread_pool = None
+
 
 def im_detect_all(model, im, box_proposals, timers=None):
     if timers is None:
@@ -50,9 +64,19 @@ def im_detect_all(model, im, box_proposals, timers=None):
         cls_boxes = test_retinanet.im_detect_bbox(model, im, timers)
         return cls_boxes, None, None
 
+    if cfg.TEST.FUSED_NET:
+        return im_detect_all_fused(model, im, timers)
+
+    if cfg.TEST.BATCHED_AUG:
+        return im_detect_all_batched_aug(model, im, box_proposals, timers)
+
     timers['im_detect_bbox'].tic()
     if cfg.TEST.BBOX_AUG.ENABLED:
         scores, boxes, im_scale = im_detect_bbox_aug(model, im, box_proposals)
+    elif cfg.TEST.PROPOSAL_CACHE.ENABLED:
+        scores, boxes, im_scale = im_detect_bbox_cached(
+            model, im, box_proposals
+        )
     else:
         scores, boxes, im_scale = im_detect_bbox(
             model, im, cfg.TEST.SCALE, cfg.TEST.MAX_SIZE, boxes=box_proposals
@@ -99,15 +123,380 @@ def im_detect_all(model, im, box_proposals, timers=None):
 
     if cfg.MODEL.BODY_UV_ON and boxes.shape[0] > 0:
         timers['im_detect_body_uv'].tic()
-        cls_bodys = im_detect_body_uv(model, im_scale, boxes)
+        if cfg.TEST.BODY_UV_AUG.ENABLED:
+            # The features of the original image computed by im_detect_bbox
+            # are still in the workspace unless the mask or keypoint
+            # augmentations have overwritten them
+            features_reusable = not (
+                (cfg.MODEL.MASK_ON and cfg.TEST.MASK_AUG.ENABLED) or
+                (cfg.MODEL.KEYPOINTS_ON and cfg.TEST.KPS_AUG.ENABLED)
+            )
+            body_uv_preds = im_detect_body_uv_aug(
+                model, im, boxes, im_scale if features_reusable else None
+            )
+            cls_bodys = body_uv_results(*(body_uv_preds + [boxes]))
+        else:
+            cls_bodys = im_detect_body_uv(model, im_scale, boxes)
         timers['im_detect_body_uv'].toc()
-        
     else:
         cls_bodys = None
 
     return cls_boxes, cls_segms, cls_keyps, cls_bodys
 
 
+def im_detect_all_fused(model, im, timers=None):
+    """Runs all of detection, box post-processing and the enabled RoI heads
+    with a single call to `model.fused_net` (see modeling.fused_net). Returns
+    the same results as im_detect_all.
+    """
+    if timers is None:
+        timers = defaultdict(Timer)
+
+    timers['im_detect_fused'].tic()
+    inputs, im_scale = _get_blobs(im, None, cfg.TEST.SCALE, cfg.TEST.MAX_SIZE)
+    cpu_device = core.DeviceOption(caffe2_pb2.CPU)
+    for k, v in inputs.items():
+        workspace.FeedBlob(core.ScopedName(k), v, device_option=cpu_device)
+    workspace.RunNet(model.fused_net.Proto().name)
+    timers['im_detect_fused'].toc()
+
+    timers['misc_bbox'].tic()
+    scores = workspace.FetchBlob(core.ScopedName('score_nms'))
+    # unscale back to raw image space
+    boxes = workspace.FetchBlob(core.ScopedName('bbox_nms')) / im_scale
+    classes = workspace.FetchBlob(core.ScopedName('class_nms'))
+    num_classes = cfg.MODEL.NUM_CLASSES
+    cls_boxes = [[] for _ in range(num_classes)]
+    # BoxWithNMSLimit returns the detections grouped by class in increasing
+    # class order, which is the order expected by segm_results etc.
+    for j in range(1, num_classes):
+        inds = np.where(classes == j)[0]
+        cls_boxes[j] = np.hstack(
+            (boxes[inds, :], scores[inds, np.newaxis])
+        ).astype(np.float32, copy=False)
+    timers['misc_bbox'].toc()
+
+    cls_segms = None
+    if cfg.MODEL.MASK_ON and boxes.shape[0] > 0:
+        timers['misc_mask'].tic()
+        M = cfg.MRCNN.RESOLUTION
+        masks = workspace.FetchBlob(core.ScopedName('mask_fcn_probs'))
+        if cfg.MRCNN.CLS_SPECIFIC_MASK:
+            masks = masks.reshape([-1, num_classes, M, M])
+        else:
+            masks = masks.reshape([-1, 1, M, M])
+        cls_segms = segm_results(
+            cls_boxes, masks, boxes, im.shape[0], im.shape[1]
+        )
+        timers['misc_mask'].toc()
+
+    cls_keyps = None
+    if cfg.MODEL.KEYPOINTS_ON and boxes.shape[0] > 0:
+        timers['misc_keypoints'].tic()
+        M = cfg.KRCNN.HEATMAP_SIZE
+        heatmaps = workspace.FetchBlob(core.ScopedName('kps_score'))
+        heatmaps = heatmaps.reshape([-1, cfg.KRCNN.NUM_KEYPOINTS, M, M])
+        cls_keyps = keypoint_results(cls_boxes, heatmaps, boxes)
+        timers['misc_keypoints'].toc()
+
+    cls_bodys = None
+    if cfg.MODEL.BODY_UV_ON and boxes.shape[0] > 0:
+        timers['misc_body_uv'].tic()
+        cls_bodys = body_uv_results(
+            workspace.FetchBlob(core.ScopedName('AnnIndex')),
+            workspace.FetchBlob(core.ScopedName('Index_UV')),
+            workspace.FetchBlob(core.ScopedName('U_estimated')),
+            workspace.FetchBlob(core.ScopedName('V_estimated')),
+            boxes
+        )
+        timers['misc_body_uv'].toc()
+
+    return cls_boxes, cls_segms, cls_keyps, cls_bodys
+
+
+def im_detect_all_batched_aug(model, im, box_proposals, timers=None):
+    """Runs detection and the enabled RoI heads with the test-time
+    augmentations of TEST.BBOX_AUG, TEST.MASK_AUG, TEST.KPS_AUG and
+    TEST.BODY_UV_AUG (the heads without augmentation use the original image
+    only). All the views of the image are prepared up front and the views with
+    the same input shape are run as one batch (see core.test_aug). The conv
+    body features of a batch are shared by all RoI heads. Returns the same
+    results as im_detect_all.
+    """
+    if timers is None:
+        timers = defaultdict(Timer)
+    identity_view = test_aug.get_identity_view()
+
+    if cfg.TEST.BBOX_AUG.ENABLED:
+        check_bbox_aug_cfg()
+        bbox_views = test_aug.get_aug_views(
+            cfg.TEST.BBOX_AUG, identity_last=True
+        )
+    else:
+        bbox_views = [identity_view]
+    # (head name, net, RoI blob name, output blob names, views)
+    heads = []
+    if cfg.MODEL.MASK_ON:
+        if cfg.TEST.MASK_AUG.ENABLED:
+            assert not cfg.TEST.MASK_AUG.SCALE_SIZE_DEP, \
+                'Size dependent scaling not implemented'
+            mask_views = test_aug.get_aug_views(cfg.TEST.MASK_AUG)
+        else:
+            mask_views = [identity_view]
+        heads.append((
+            'mask', model.mask_net, 'mask_rois', ['mask_fcn_probs'],
+            mask_views
+        ))
+    if cfg.MODEL.KEYPOINTS_ON:
+        if cfg.TEST.KPS_AUG.ENABLED:
+            kps_views = test_aug.get_aug_views(cfg.TEST.KPS_AUG)
+        else:
+            kps_views = [identity_view]
+        heads.append((
+            'keypoints', model.keypoint_net, 'keypoint_rois', ['kps_score'],
+            kps_views
+        ))
+    if cfg.MODEL.BODY_UV_ON:
+        if cfg.TEST.BODY_UV_AUG.ENABLED:
+            body_uv_views = test_aug.get_aug_views(cfg.TEST.BODY_UV_AUG)
+        else:
+            body_uv_views = [identity_view]
+        heads.append((
+            'body_uv', model.body_uv_net, 'body_uv_rois',
+            _BODY_UV_OUTPUT_BLOB_NAMES, body_uv_views
+        ))
+    views = []
+    for view in bbox_views + [v for head in heads for v in head[4]]:
+        if view not in views:
+            views.append(view)
+    batches = test_aug.get_view_batches(im, views)
+
+    timers['im_detect_bbox'].tic()
+    scores, boxes, last_batch_ind = im_detect_bbox_batched_aug(
+        model, batches, bbox_views, box_proposals
+    )
+    timers['im_detect_bbox'].toc()
+
+    timers['misc_bbox'].tic()
+    scores, boxes, cls_boxes = box_results_with_nms_and_limit(scores, boxes)
+    timers['misc_bbox'].toc()
+
+    cls_segms = None
+    cls_keyps = None
+    cls_bodys = None
+    if boxes.shape[0] == 0:
+        return cls_boxes, cls_segms, cls_keyps, cls_bodys
+
+    head_outputs = im_detect_heads_batched_aug(
+        model, batches, last_batch_ind, heads, boxes, timers
+    )
+
+    if cfg.MODEL.MASK_ON:
+        timers['misc_mask'].tic()
+        M = cfg.MRCNN.RESOLUTION
+        num_mask_classes = (
+            cfg.MODEL.NUM_CLASSES if cfg.MRCNN.CLS_SPECIFIC_MASK else 1
+        )
+        masks_ts = []
+        for view in mask_views:
+            masks = head_outputs['mask'][view][0].reshape(
+                [-1, num_mask_classes, M, M]
+            )
+            if view.hflip:
+                masks = masks[:, :, :, ::-1]
+            masks_ts.append(masks)
+        if cfg.TEST.MASK_AUG.ENABLED:
+            masks = combine_mask_aug_preds(masks_ts)
+        else:
+            masks = masks_ts[0]
+        cls_segms = segm_results(
+            cls_boxes, masks, boxes, im.shape[0], im.shape[1]
+        )
+        timers['misc_mask'].toc()
+
+    if cfg.MODEL.KEYPOINTS_ON:
+        timers['misc_keypoints'].tic()
+        M = cfg.KRCNN.HEATMAP_SIZE
+        heatmaps_ts = []
+        for view in kps_views:
+            heatmaps = head_outputs['keypoints'][view][0].reshape(
+                [-1, cfg.KRCNN.NUM_KEYPOINTS, M, M]
+            )
+            if view.hflip:
+                heatmaps = keypoint_utils.flip_heatmaps(heatmaps)
+            heatmaps_ts.append(heatmaps)
+        if cfg.TEST.KPS_AUG.ENABLED:
+            # Tag heatmaps computed under downscaling and upscaling
+            ds_ts = [view.scale < cfg.TEST.SCALE for view in kps_views]
+            us_ts = [view.scale > cfg.TEST.SCALE for view in kps_views]
+            heatmaps = combine_keypoint_aug_preds(
+                heatmaps_ts, ds_ts, us_ts, boxes
+            )
+        else:
+            heatmaps = heatmaps_ts[0]
+        cls_keyps = keypoint_results(cls_boxes, heatmaps, boxes)
+        timers['misc_keypoints'].toc()
+
+    if cfg.MODEL.BODY_UV_ON:
+        timers['misc_body_uv'].tic()
+        body_uv_preds_ts = []
+        for view in body_uv_views:
+            body_uv_preds = head_outputs['body_uv'][view]
+            if view.hflip:
+                body_uv_preds = flip_body_uv_preds(body_uv_preds)
+            body_uv_preds_ts.append(body_uv_preds)
+        if cfg.TEST.BODY_UV_AUG.ENABLED:
+            body_uv_preds = combine_body_uv_aug_preds(body_uv_preds_ts)
+        else:
+            body_uv_preds = body_uv_preds_ts[0]
+        cls_bodys = body_uv_results(*(body_uv_preds + [boxes]))
+        timers['misc_body_uv'].toc()
+
+    return cls_boxes, cls_segms, cls_keyps, cls_bodys
+
+
+def im_detect_bbox_batched_aug(model, batches, bbox_views, box_proposals):
+    """Bounding box detection on the views bbox_views (with the original image
+    last) of an image prepared as a list of test_aug.ViewBatch. Returns the
+    combined scores and boxes (as im_detect_bbox_aug) and the index of the
+    batch whose conv body features are left in the workspace.
+    """
+    identity_view = test_aug.get_identity_view()
+    batch_inds = [
+        k for k, batch in enumerate(batches)
+        if any(view in bbox_views for view in batch.views)
+    ]
+    # Run the batch of the original image last: its features are used by all
+    # the RoI heads
+    batch_inds.sort(key=lambda k: identity_view in batches[k].views)
+    preds = {}
+    for k in batch_inds:
+        batch = batches[k]
+        inputs = {'data': batch.blob, 'im_info': batch.im_info}
+        if not cfg.MODEL.FASTER_RCNN:
+            proposals = [
+                test_aug.transform_boxes(box_proposals, view, im_shape)
+                for view, im_shape in zip(batch.views, batch.im_shapes)
+            ]
+            inputs['rois'] = _get_batched_rois_blob(
+                proposals, batch.im_scales, range(len(batch.views))
+            )
+            # Add multi-level rois for FPN
+            if cfg.FPN.MULTILEVEL_ROIS:
+                _add_multilevel_rois_for_test(inputs, 'rois')
+        for name, blob in inputs.items():
+            workspace.FeedBlob(core.ScopedName(name), blob)
+        workspace.RunNet(model.net.Proto().name)
+
+        if cfg.MODEL.FASTER_RCNN:
+            rois = workspace.FetchBlob(core.ScopedName('rois'))
+        else:
+            rois = inputs['rois']
+        scores = workspace.FetchBlob(core.ScopedName('cls_prob')).squeeze()
+        scores = scores.reshape([-1, scores.shape[-1]])
+        if cfg.TEST.BBOX_REG:
+            box_deltas = workspace.FetchBlob(
+                core.ScopedName('bbox_pred')
+            ).squeeze()
+            box_deltas = box_deltas.reshape([-1, box_deltas.shape[-1]])
+        for b, view in enumerate(batch.views):
+            if view not in bbox_views:
+                continue
+            # The first column of the rois is the index of the view in the
+            # batch
+            inds = np.where(rois[:, 0] == b)[0]
+            if cfg.MODEL.FASTER_RCNN:
+                # unscale back to the view image space
+                boxes = rois[inds, 1:5] / batch.im_scales[b]
+            else:
+                boxes = proposals[b]
+            if cfg.TEST.BBOX_REG:
+                pred_boxes = apply_bbox_deltas(
+                    boxes, box_deltas[inds, :], scores.shape[1],
+                    batch.im_shapes[b]
+                )
+            else:
+                pred_boxes = np.tile(boxes, (1, scores.shape[1]))
+            preds[view] = (
+                scores[inds, :],
+                test_aug.invert_transform_boxes(
+                    pred_boxes, view, batch.im_shapes[b]
+                )
+            )
+
+    if cfg.TEST.BBOX_AUG.ENABLED:
+        scores, boxes = combine_bbox_aug_preds(
+            [preds[view][0] for view in bbox_views],
+            [preds[view][1] for view in bbox_views]
+        )
+    else:
+        scores, boxes = preds[identity_view]
+    return scores, boxes, batch_inds[-1]
+
+
+def im_detect_heads_batched_aug(
+    model, batches, last_batch_ind, heads, boxes, timers
+):
+    """Run the RoI heads on the views of an image for the R x 4 detections
+    `boxes`. The conv body is run at most once per batch of views (and not at
+    all for batch last_batch_ind, whose features are already in the
+    workspace); all the views of a batch that a head needs are processed by a
+    single run of the head net. Returns a dict that maps each head name to a
+    dict mapping each of its views to the list of its output blobs (each with
+    R rows, before undoing the flip of the view).
+    """
+    head_outputs = {head[0]: {} for head in heads}
+    batch_inds = [last_batch_ind] + [
+        k for k in range(len(batches)) if k != last_batch_ind
+    ]
+    for k in batch_inds:
+        batch = batches[k]
+        batch_heads = [
+            (head, [view for view in head[4] if view in batch.views])
+            for head in heads
+        ]
+        batch_heads = [(head, views) for head, views in batch_heads if views]
+        if len(batch_heads) == 0:
+            continue
+        if k != last_batch_ind:
+            timers['im_conv_body'].tic()
+            workspace.FeedBlob(core.ScopedName('data'), batch.blob)
+            workspace.RunNet(model.conv_body_net.Proto().name)
+            timers['im_conv_body'].toc()
+        for head, views in batch_heads:
+            name, net, roi_blob_name, output_blob_names, _ = head
+            timers['im_detect_' + name].tic()
+            view_inds = [batch.views.index(view) for view in views]
+            inputs = {
+                roi_blob_name: _get_batched_rois_blob(
+                    [
+                        test_aug.transform_boxes(
+                            boxes, view, batch.im_shapes[b]
+                        ) for view, b in zip(views, view_inds)
+                    ],
+                    [batch.im_scales[b] for b in view_inds],
+                    view_inds
+                )
+            }
+            # Add multi-level rois for FPN
+            if cfg.FPN.MULTILEVEL_ROIS:
+                _add_multilevel_rois_for_test(inputs, roi_blob_name)
+            for blob_name, blob in inputs.items():
+                workspace.FeedBlob(core.ScopedName(blob_name), blob)
+            workspace.RunNet(net.Proto().name)
+            outputs = [
+                workspace.FetchBlob(core.ScopedName(blob_name))
+                for blob_name in output_blob_names
+            ]
+            R = boxes.shape[0]
+            for i, view in enumerate(views):
+                head_outputs[name][view] = [
+                    output[i * R:(i + 1) * R] for output in outputs
+                ]
+            timers['im_detect_' + name].toc()
+    return head_outputs
+
+
 def im_conv_body_only(model, im, target_scale, target_max_size):
     """Runs `model.conv_body_net` on the given image `im`."""
     im_blob, im_scale, _im_info = blob_utils.get_image_blob(
@@ -173,15 +562,9 @@ def im_detect_bbox(model, im, target_scale, target_max_size, boxes=None):
         box_deltas = workspace.FetchBlob(core.ScopedName('bbox_pred')).squeeze()
         # In case there is 1 proposal
         box_deltas = box_deltas.reshape([-1, box_deltas.shape[-1]])
-        if cfg.MODEL.CLS_AGNOSTIC_BBOX_REG:
-            # Remove predictions for bg class (compat with MSRA code)
-            box_deltas = box_deltas[:, -4:]
-        pred_boxes = box_utils.bbox_transform(
-            boxes, box_deltas, cfg.MODEL.BBOX_REG_WEIGHTS
+        pred_boxes = apply_bbox_deltas(
+            boxes, box_deltas, scores.shape[1], im.shape
         )
-        pred_boxes = box_utils.clip_tiled_boxes(pred_boxes, im.shape)
-        if cfg.MODEL.CLS_AGNOSTIC_BBOX_REG:
-            pred_boxes = np.tile(pred_boxes, (1, scores.shape[1]))
     else:
         # Simply repeat the boxes, once for each class
         pred_boxes = np.tile(boxes, (1, scores.shape[1]))
@@ -194,21 +577,49 @@ def im_detect_bbox(model, im, target_scale, target_max_size, boxes=None):
     return scores, pred_boxes, im_scale
 
 
+def im_detect_bbox_cached(model, im, box_proposals):
+    """im_detect_bbox served from the proposal cache of the model (see
+    cfg.TEST.PROPOSAL_CACHE) when it has an entry for the image. On a cache hit
+    the conv body features used by the RoI heads are fed from the cache or, if
+    the entry has none, computed by running only the conv body.
+    """
+    cache = model.proposal_cache
+    key = cache.get_key(im, box_proposals)
+    entry = cache.get(key)
+    if entry is None:
+        scores, boxes, im_scale = im_detect_bbox(
+            model, im, cfg.TEST.SCALE, cfg.TEST.MAX_SIZE, boxes=box_proposals
+        )
+        cache.put(key, scores, boxes, im_scale)
+        return scores, boxes, im_scale
+
+    if not cache.feed_features(entry):
+        im_conv_body_only(model, im, cfg.TEST.SCALE, cfg.TEST.MAX_SIZE)
+    return entry['scores'], entry['boxes'], entry['im_scale']
+
+
+def apply_bbox_deltas(boxes, box_deltas, num_classes, im_shape):
+    """Apply the bounding-box regression deltas predicted for the R x 4 array
+    `boxes` and clip the predicted boxes to the image. Returns an
+    R x 4 * num_classes array of boxes.
+    """
+    if cfg.MODEL.CLS_AGNOSTIC_BBOX_REG:
+        # Remove predictions for bg class (compat with MSRA code)
+        box_deltas = box_deltas[:, -4:]
+    pred_boxes = box_utils.bbox_transform(
+        boxes, box_deltas, cfg.MODEL.BBOX_REG_WEIGHTS
+    )
+    pred_boxes = box_utils.clip_tiled_boxes(pred_boxes, im_shape)
+    if cfg.MODEL.CLS_AGNOSTIC_BBOX_REG:
+        pred_boxes = np.tile(pred_boxes, (1, num_classes))
+    return pred_boxes
+
+
 def im_detect_bbox_aug(model, im, box_proposals=None):
     """Performs bbox detection with test-time augmentations.
     Function signature is the same as for im_detect_bbox.
     """
-    assert not cfg.TEST.BBOX_AUG.SCALE_SIZE_DEP, \
-        'Size dependent scaling not implemented'
-    assert not cfg.TEST.BBOX_AUG.SCORE_HEUR == 'UNION' or \
-        cfg.TEST.BBOX_AUG.COORD_HEUR == 'UNION', \
-        'Coord heuristic must be union whenever score heuristic is union'
-    assert not cfg.TEST.BBOX_AUG.COORD_HEUR == 'UNION' or \
-        cfg.TEST.BBOX_AUG.SCORE_HEUR == 'UNION', \
-        'Score heuristic must be union whenever coord heuristic is union'
-    assert not cfg.MODEL.FASTER_RCNN or \
-        cfg.TEST.BBOX_AUG.SCORE_HEUR == 'UNION', \
-        'Union heuristic must be used to combine Faster RCNN predictions'
+    check_bbox_aug_cfg()
 
     # Collect detections computed under different transformations
     scores_ts = []
@@ -264,6 +675,18 @@ def im_detect_bbox_aug(model, im, box_proposals=None):
     )
     add_preds_t(scores_i, boxes_i)
 
+    scores_c, boxes_c = combine_bbox_aug_preds(scores_ts, boxes_ts)
+    return scores_c, boxes_c, im_scale_i
+
+
+def combine_bbox_aug_preds(scores_ts, boxes_ts):
+    """Combine the box predictions computed under different transformations
+    with the TEST.BBOX_AUG heuristics. The predictions for the original image
+    (identity transform) come last.
+    """
+    scores_i = scores_ts[-1]
+    boxes_i = boxes_ts[-1]
+
     # Combine the predicted scores
     if cfg.TEST.BBOX_AUG.SCORE_HEUR == 'ID':
         scores_c = scores_i
@@ -288,7 +711,21 @@ def im_detect_bbox_aug(model, im, box_proposals=None):
             'Coord heur {} not supported'.format(cfg.TEST.BBOX_AUG.COORD_HEUR)
         )
 
-    return scores_c, boxes_c, im_scale_i
+    return scores_c, boxes_c
+
+
+def check_bbox_aug_cfg():
+    assert not cfg.TEST.BBOX_AUG.SCALE_SIZE_DEP, \
+        'Size dependent scaling not implemented'
+    assert not cfg.TEST.BBOX_AUG.SCORE_HEUR == 'UNION' or \
+        cfg.TEST.BBOX_AUG.COORD_HEUR == 'UNION', \
+        'Coord heuristic must be union whenever score heuristic is union'
+    assert not cfg.TEST.BBOX_AUG.COORD_HEUR == 'UNION' or \
+        cfg.TEST.BBOX_AUG.SCORE_HEUR == 'UNION', \
+        'Score heuristic must be union whenever coord heuristic is union'
+    assert not cfg.MODEL.FASTER_RCNN or \
+        cfg.TEST.BBOX_AUG.SCORE_HEUR == 'UNION', \
+        'Union heuristic must be used to combine Faster RCNN predictions'
 
 
 def im_detect_bbox_hflip(
@@ -465,6 +902,13 @@ def im_detect_mask_aug(model, im, boxes):
             )
             masks_ts.append(masks_ar_hf)
 
+    return combine_mask_aug_preds(masks_ts)
+
+
+def combine_mask_aug_preds(masks_ts):
+    """Combine the soft masks computed under different transformations with
+    the TEST.MASK_AUG heuristic.
+    """
     # Combine the predicted soft masks
     if cfg.TEST.MASK_AUG.HEUR == 'SOFT_AVG':
         masks_c = np.mean(masks_ts, axis=0)
@@ -641,6 +1085,14 @@ def im_detect_keypoints_aug(model, im, boxes):
             )
             add_heatmaps_t(heatmaps_ar_hf)
 
+    return combine_keypoint_aug_preds(heatmaps_ts, ds_ts, us_ts, boxes)
+
+
+def combine_keypoint_aug_preds(heatmaps_ts, ds_ts, us_ts, boxes):
+    """Combine the heatmaps computed under different transformations with the
+    TEST.KPS_AUG heuristic. ds_ts and us_ts tag the heatmaps computed under
+    downscaling and upscaling transformations.
+    """
     # Select the heuristic function for combining the heatmaps
     if cfg.TEST.KPS_AUG.HEUR == 'HM_AVG':
         np_f = np.mean
@@ -764,33 +1216,48 @@ def box_results_with_nms_and_limit(scores, boxes):
     cls_boxes = [[] for _ in range(num_classes)]
     # Apply threshold on detection probabilities and apply NMS
     # Skip j = 0, because it's the background class
-    for j in range(1, num_classes):
-        inds = np.where(scores[:, j] > cfg.TEST.SCORE_THRESH)[0]
-        scores_j = scores[inds, j]
-        boxes_j = boxes[inds, j * 4:(j + 1) * 4]
-        dets_j = np.hstack((boxes_j, scores_j[:, np.newaxis])).astype(
-            np.float32, copy=False
-        )
-        if cfg.TEST.SOFT_NMS.ENABLED:
+    if cfg.TEST.SOFT_NMS.ENABLED:
+        cls_dets = _get_cls_dets(scores, boxes)
+        for j in range(1, num_classes):
             nms_dets, _ = box_utils.soft_nms(
-                dets_j,
+                cls_dets[j],
                 sigma=cfg.TEST.SOFT_NMS.SIGMA,
                 overlap_thresh=cfg.TEST.NMS,
                 score_thresh=0.0001,
                 method=cfg.TEST.SOFT_NMS.METHOD
             )
-        else:
-            keep = box_utils.nms(dets_j, cfg.TEST.NMS)
-            nms_dets = dets_j[keep, :]
-        # Refine the post-NMS boxes using bounding-box voting
-        if cfg.TEST.BBOX_VOTE.ENABLED:
-            nms_dets = box_utils.box_voting(
-                nms_dets,
-                dets_j,
+            cls_boxes[j] = nms_dets
+    else:
+        # NMS of all classes in a single call (without the GIL)
+        cls_inds, inds = np.where(scores[:, 1:].T > cfg.TEST.SCORE_THRESH)
+        cls_inds += 1
+        dets = np.empty((len(inds), 5), dtype=np.float32)
+        dets[:, :4] = boxes[
+            inds[:, np.newaxis], 4 * cls_inds[:, np.newaxis] + np.arange(4)
+        ]
+        dets[:, 4] = scores[inds, cls_inds]
+        keep = np.array(
+            box_utils.batched_nms(dets, cls_inds, cfg.TEST.NMS),
+            dtype=np.int64
+        )
+        # The detections, hence the kept ones, are grouped by class
+        bounds = np.searchsorted(cls_inds, np.arange(num_classes + 1))
+        keep_bounds = np.searchsorted(
+            cls_inds[keep], np.arange(num_classes + 1)
+        )
+        cls_dets = [[] for _ in range(num_classes)]
+        for j in range(1, num_classes):
+            cls_dets[j] = dets[bounds[j]:bounds[j + 1], :]
+            cls_boxes[j] = dets[keep[keep_bounds[j]:keep_bounds[j + 1]], :]
+    # Refine the post-NMS boxes using bounding-box voting
+    if cfg.TEST.BBOX_VOTE.ENABLED:
+        for j in range(1, num_classes):
+            cls_boxes[j] = box_utils.box_voting(
+                cls_boxes[j],
+                cls_dets[j],
                 cfg.TEST.BBOX_VOTE.VOTE_TH,
                 scoring_method=cfg.TEST.BBOX_VOTE.SCORING_METHOD
             )
-        cls_boxes[j] = nms_dets
 
     # Limit to max_per_image detections **over all classes**
     if cfg.TEST.DETECTIONS_PER_IM > 0:
@@ -809,10 +1276,27 @@ def box_results_with_nms_and_limit(scores, boxes):
     return scores, boxes, cls_boxes
 
 
+def _get_cls_dets(scores, boxes):
+    """Per class [x1, y1, x2, y2, score] detections whose score is above
+    TEST.SCORE_THRESH.
+    """
+    num_classes = cfg.MODEL.NUM_CLASSES
+    cls_dets = [[] for _ in range(num_classes)]
+    for j in range(1, num_classes):
+        inds = np.where(scores[:, j] > cfg.TEST.SCORE_THRESH)[0]
+        scores_j = scores[inds, j]
+        boxes_j = boxes[inds, j * 4:(j + 1) * 4]
+        cls_dets[j] = np.hstack((boxes_j, scores_j[:, np.newaxis])).astype(
+            np.float32, copy=False
+        )
+    return cls_dets
+
+
 def segm_results(cls_boxes, masks, ref_boxes, im_h, im_w):
     num_classes = cfg.MODEL.NUM_CLASSES
     cls_segms = [[] for _ in range(num_classes)]
-    mask_ind = 0
+    num_masks = sum(cls_boxes[j].shape[0] for j in range(1, num_classes))
+    assert num_masks == masks.shape[0]
     # To work around an issue with cv2.resize (it seems to automatically pad
     # with repeated border values), we manually zero-pad the masks by 1 pixel
     # prior to resizing back to the original image resolution. This prevents
@@ -822,56 +1306,82 @@ def segm_results(cls_boxes, masks, ref_boxes, im_h, im_w):
     scale = (M + 2.0) / M
     ref_boxes = box_utils.expand_boxes(ref_boxes, scale)
     ref_boxes = ref_boxes.astype(np.int32)
-    padded_mask = np.zeros((M + 2, M + 2), dtype=np.float32)
+    padded_masks = np.zeros((num_masks, M + 2, M + 2), dtype=np.float32)
+    if cfg.MRCNN.CLS_SPECIFIC_MASK:
+        # skip j = 0, because it's the background class
+        mask_classes = np.hstack([
+            np.full(cls_boxes[j].shape[0], j, dtype=np.int64)
+            for j in range(1, num_classes)
+        ])
+        padded_masks[:, 1:-1, 1:-1] = masks[np.arange(num_masks), mask_classes]
+    else:
+        padded_masks[:, 1:-1, 1:-1] = masks[:, 0]
+
+    def mask_rle(mask_ind):
+        return _paste_mask_rle(
+            padded_masks[mask_ind], ref_boxes[mask_ind], im_h, im_w
+        )
+
+    if cfg.MRCNN.RESULTS_NUM_THREADS > 1:
+        rles = _get_results_thread_pool().map(mask_rle, range(num_masks))
+    else:
+        rles = [mask_rle(i) for i in range(num_masks)]
 
-    # skip j = 0, because it's the background class
+    mask_ind = 0
     for j in range(1, num_classes):
-        segms = []
-        for _ in range(cls_boxes[j].shape[0]):
-            if cfg.MRCNN.CLS_SPECIFIC_MASK:
-                padded_mask[1:-1, 1:-1] = masks[mask_ind, j, :, :]
-            else:
-                padded_mask[1:-1, 1:-1] = masks[mask_ind, 0, :, :]
-
-            ref_box = ref_boxes[mask_ind, :]
-            w = ref_box[2] - ref_box[0] + 1
-            h = ref_box[3] - ref_box[1] + 1
-            w = np.maximum(w, 1)
-            h = np.maximum(h, 1)
-
-            mask = cv2.resize(padded_mask, (w, h))
-            mask = np.array(mask > cfg.MRCNN.THRESH_BINARIZE, dtype=np.uint8)
-            im_mask = np.zeros((im_h, im_w), dtype=np.uint8)
-
-            x_0 = max(ref_box[0], 0)
-            x_1 = min(ref_box[2] + 1, im_w)
-            y_0 = max(ref_box[1], 0)
-            y_1 = min(ref_box[3] + 1, im_h)
-
-            im_mask[y_0:y_1, x_0:x_1] = mask[
-                (y_0 - ref_box[1]):(y_1 - ref_box[1]),
-                (x_0 - ref_box[0]):(x_1 - ref_box[0])
-            ]
+        num_cls_masks = cls_boxes[j].shape[0]
+        cls_segms[j] = rles[mask_ind:mask_ind + num_cls_masks]
+        mask_ind += num_cls_masks
+    return cls_segms
 
-            # Get RLE encoding used by the COCO evaluation API
-            rle = mask_util.encode(
-                np.array(im_mask[:, :, np.newaxis], order='F')
-            )[0]
-            segms.append(rle)
 
-            mask_ind += 1
+def _paste_mask_rle(padded_mask, ref_box, im_h, im_w):
+    """Resize a (padded) mask to its box, binarize it and return the RLE
+    encoding used by the COCO evaluation API of the im_h x im_w image in which
+    the mask is pasted. Only the part of the mask inside the image is
+    binarized and the full image is never built.
+    """
+    w = ref_box[2] - ref_box[0] + 1
+    h = ref_box[3] - ref_box[1] + 1
+    w = np.maximum(w, 1)
+    h = np.maximum(h, 1)
+
+    mask = cv2.resize(padded_mask, (w, h))
+
+    x_0 = max(ref_box[0], 0)
+    x_1 = max(min(ref_box[2] + 1, im_w), x_0)
+    y_0 = max(ref_box[1], 0)
+    y_1 = max(min(ref_box[3] + 1, im_h), y_0)
+
+    mask = np.array(
+        mask[
+            (y_0 - ref_box[1]):(y_1 - ref_box[1]),
+            (x_0 - ref_box[0]):(x_1 - ref_box[0])
+        ] > cfg.MRCNN.THRESH_BINARIZE,
+        dtype=np.uint8
+    )
+    return segm_utils.box_mask_to_rle(mask, x_0, y_0, im_h, im_w)
 
-        cls_segms[j] = segms
 
-    assert mask_ind == masks.shape[0]
-    return cls_segms
+def _get_results_thread_pool():
+    global _results_thread_pool
+    if _results_thread_pool is None:
+        _results_thread_pool = ThreadPool(cfg.MRCNN.RESULTS_NUM_THREADS)
+    return _results_thread_pool
 
 
 def keypoint_results(cls_boxes, pred_heatmaps, ref_boxes):
     num_classes = cfg.MODEL.NUM_CLASSES
     cls_keyps = [[] for _ in range(num_classes)]
     person_idx = keypoint_utils.get_person_class_index()
-    xy_preds = keypoint_utils.heatmaps_to_keypoints(pred_heatmaps, ref_boxes)
+    if cfg.KRCNN.FAST_HEATMAPS_TO_KEYPOINTS:
+        xy_preds = keypoint_utils.heatmaps_to_keypoints_fast(
+            pred_heatmaps, ref_boxes
+        )
+    else:
+        xy_preds = keypoint_utils.heatmaps_to_keypoints(
+            pred_heatmaps, ref_boxes
+        )
 
     # NMS OKS
     if cfg.KRCNN.NMS_OKS:
@@ -908,7 +1418,101 @@ def im_detect_body_uv(model, im_scale, boxes):
     Index_UV = workspace.FetchBlob(core.ScopedName('Index_UV')).squeeze()
     U_uv = workspace.FetchBlob(core.ScopedName('U_estimated')).squeeze()
     V_uv = workspace.FetchBlob(core.ScopedName('V_estimated')).squeeze()
+    return body_uv_results(AnnIndex, Index_UV, U_uv, V_uv, boxes)
 
+
+def im_detect_body_uv_aug(model, im, boxes, im_scale=None):
+    """Computes body uv predictions with test-time augmentations.
+
+    Arguments:
+        model (DetectionModelHelper): the detection model to use
+        im (ndarray): BGR image to test
+        boxes (ndarray): R x 4 array of bounding boxes
+        im_scale (float): scale of the original image if its conv body
+            features are in the workspace (they are then reused), else None
+
+    Returns:
+        body_uv_preds (list): [AnnIndex, Index_UV, U_uv, V_uv] combined body
+            uv head outputs (R x C x M x M arrays)
+    """
+    preds_ts = []
+    for view in test_aug.get_aug_views(cfg.TEST.BODY_UV_AUG):
+        im_view = test_aug.get_view_image(im, view)
+        if view == test_aug.get_identity_view() and im_scale is not None:
+            im_scale_view = im_scale
+        else:
+            im_scale_view = im_conv_body_only(
+                model, im_view, view.scale, view.max_size
+            )
+        inputs = {
+            'body_uv_rois': _get_rois_blob(
+                test_aug.transform_boxes(boxes, view, im_view.shape),
+                im_scale_view
+            )
+        }
+        if cfg.FPN.MULTILEVEL_ROIS:
+            _add_multilevel_rois_for_test(inputs, 'body_uv_rois')
+        for k, v in inputs.items():
+            workspace.FeedBlob(core.ScopedName(k), v)
+        workspace.RunNet(model.body_uv_net.Proto().name)
+        preds = [
+            workspace.FetchBlob(core.ScopedName(name))
+            for name in _BODY_UV_OUTPUT_BLOB_NAMES
+        ]
+        if view.hflip:
+            preds = flip_body_uv_preds(preds)
+        preds_ts.append(preds)
+    return combine_body_uv_aug_preds(preds_ts)
+
+
+def flip_body_uv_preds(body_uv_preds):
+    """Map the [AnnIndex, Index_UV, U_uv, V_uv] body uv head outputs computed
+    on a horizontally flipped image back to the image.
+    """
+    return list(
+        _get_densepose_methods().get_symmetric_body_uv_preds(*body_uv_preds)
+    )
+
+
+def combine_body_uv_aug_preds(body_uv_preds_ts):
+    """Combine the [AnnIndex, Index_UV, U_uv, V_uv] body uv head outputs
+    computed under different transformations with the TEST.BODY_UV_AUG
+    heuristic.
+    """
+    AnnIndex_ts, Index_UV_ts, U_uv_ts, V_uv_ts = zip(*body_uv_preds_ts)
+    if cfg.TEST.BODY_UV_AUG.HEUR == 'LOGIT_AVG':
+        AnnIndex = np.mean(AnnIndex_ts, axis=0)
+        Index_UV = np.mean(Index_UV_ts, axis=0)
+    elif cfg.TEST.BODY_UV_AUG.HEUR == 'SOFT_AVG':
+        AnnIndex = np.mean([_softmax(x) for x in AnnIndex_ts], axis=0)
+        Index_UV = np.mean([_softmax(x) for x in Index_UV_ts], axis=0)
+    else:
+        raise NotImplementedError(
+            'Heuristic {} not supported'.format(cfg.TEST.BODY_UV_AUG.HEUR)
+        )
+    return [
+        AnnIndex, Index_UV, np.mean(U_uv_ts, axis=0), np.mean(V_uv_ts, axis=0)
+    ]
+
+
+def _softmax(x):
+    """Softmax over the channels of an R x C x M x M blob."""
+    e = np.exp(x - np.max(x, axis=1, keepdims=True))
+    return e / np.sum(e, axis=1, keepdims=True)
+
+
+def _get_densepose_methods():
+    # The symmetry tables are only loaded if body uv flip augmentation is used
+    global _densepose_methods
+    if _densepose_methods is None:
+        _densepose_methods = dp_utils.DensePoseMethods()
+    return _densepose_methods
+
+
+def body_uv_results(AnnIndex, Index_UV, U_uv, V_uv, boxes):
+    """Convert the body uv head outputs for the R detections in `boxes` (in
+    the original image coordinate space) into per box IUV images.
+    """
     # In case of 1
     if AnnIndex.ndim == 3:
         AnnIndex = np.expand_dims(AnnIndex, axis=0)
@@ -984,6 +1588,21 @@ def _get_rois_blob(im_rois, im_scale):
     return rois_blob.astype(np.float32, copy=False)
 
 
+def _get_batched_rois_blob(im_rois_list, im_scales, batch_inds):
+    """Converts the RoIs of several images of a batch into one network input.
+    The first column of the returned RoIs is the index of the image of the RoI
+    in the batch (see _get_rois_blob for the other columns).
+    """
+    rois_blobs = []
+    for im_rois, im_scale, batch_ind in zip(
+        im_rois_list, im_scales, batch_inds
+    ):
+        rois_blob = _get_rois_blob(im_rois, im_scale)
+        rois_blob[:, 0] = batch_ind
+        rois_blobs.append(rois_blob)
+    return np.vstack(rois_blobs)
+
+
 def _project_im_rois(im_rois, scales):
     """Project image RoIs into the image pyramid built by _get_image_blob.
 
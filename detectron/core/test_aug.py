@@ -0,0 +1,168 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Augmented views of an image for batched test-time augmentation.
+
+A view is one of the image transformations of the TEST.*_AUG options: a
+width-relative aspect ratio change, an optional horizontal flip and a rescaling
+to a (scale, max size) target. With TEST.BATCHED_AUG, core.test builds all the
+views needed by the enabled heads up front and runs the views that have the
+same network input shape as a single batch (see get_view_batches), so that the
+conv body features of the views are computed once and shared by the box, mask,
+keypoint and body UV heads.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import namedtuple
+import numpy as np
+
+from detectron.core.config import cfg
+import detectron.utils.blob as blob_utils
+import detectron.utils.boxes as box_utils
+import detectron.utils.image as image_utils
+
+# The image is first transformed by aspect_ratio (width-relative, 1.0 means no
+# change), then flipped horizontally if hflip and finally rescaled to
+# (scale, max_size) as done by blob_utils.prep_im_for_blob
+AugView = namedtuple('AugView', ['scale', 'max_size', 'hflip', 'aspect_ratio'])
+
+
+class ViewBatch(object):
+    """Views of an image that are run as one network input batch."""
+
+    def __init__(self, views, im_shapes, im_scales, blob):
+        self.views = views
+        # Shape of the transformed (not rescaled) image of each view
+        self.im_shapes = im_shapes
+        self.im_scales = im_scales
+        self.blob = blob
+        height, width = blob.shape[2], blob.shape[3]
+        self.im_info = np.array(
+            [[height, width, im_scale] for im_scale in im_scales],
+            dtype=np.float32
+        )
+
+
+def get_identity_view():
+    return AugView(cfg.TEST.SCALE, cfg.TEST.MAX_SIZE, False, 1.0)
+
+
+def get_aug_views(aug_cfg, identity_last=False):
+    """Return the views of a test-time augmentation config (e.g.,
+    cfg.TEST.MASK_AUG) in the order in which their predictions are combined
+    by the corresponding core.test.im_detect_*_aug function.
+    """
+    views = []
+    if aug_cfg.H_FLIP:
+        views.append(AugView(cfg.TEST.SCALE, cfg.TEST.MAX_SIZE, True, 1.0))
+    for scale in aug_cfg.SCALES:
+        views.append(AugView(scale, aug_cfg.MAX_SIZE, False, 1.0))
+        if aug_cfg.SCALE_H_FLIP:
+            views.append(AugView(scale, aug_cfg.MAX_SIZE, True, 1.0))
+    for aspect_ratio in aug_cfg.ASPECT_RATIOS:
+        views.append(
+            AugView(cfg.TEST.SCALE, cfg.TEST.MAX_SIZE, False, aspect_ratio)
+        )
+        if aug_cfg.ASPECT_RATIO_H_FLIP:
+            views.append(
+                AugView(cfg.TEST.SCALE, cfg.TEST.MAX_SIZE, True, aspect_ratio)
+            )
+    if identity_last:
+        return views + [get_identity_view()]
+    return [get_identity_view()] + views
+
+
+def get_view_image(im, view):
+    """Apply the aspect ratio and flip transformations of a view to an image."""
+    if view.aspect_ratio != 1.0:
+        im = image_utils.aspect_ratio_rel(im, view.aspect_ratio)
+    if view.hflip:
+        im = im[:, ::-1, :]
+    return im
+
+
+def get_view_batches(im, views):
+    """Prepare the network inputs of the views of an image. Views whose
+    rescaled images have the same (padded) blob shape, or the same shape bucket
+    if cfg.TEST.AUG_BUCKETS > 0, are batched together. Returns a list of
+    ViewBatch in the order of first appearance in `views`.
+    """
+    im_views = []
+    processed_ims = []
+    im_scales = []
+    for view in views:
+        im_view = get_view_image(im, view)
+        processed_im, im_scale = blob_utils.prep_im_for_blob(
+            im_view, cfg.PIXEL_MEANS, view.scale, view.max_size
+        )
+        im_views.append(im_view)
+        processed_ims.append(processed_im)
+        im_scales.append(im_scale)
+    if cfg.TEST.AUG_BUCKETS > 0:
+        keys = [None] * len(views)
+        buckets = blob_utils.get_shape_buckets(
+            [processed_im.shape[:2] for processed_im in processed_ims],
+            cfg.TEST.AUG_BUCKETS
+        )
+        for bucket_ind, inds in enumerate(buckets):
+            for i in inds:
+                keys[i] = bucket_ind
+    else:
+        keys = [_get_blob_shape(p.shape) for p in processed_ims]
+    groups = []
+    group_inds = {}
+    for i, key in enumerate(keys):
+        if key not in group_inds:
+            group_inds[key] = len(groups)
+            groups.append(([], [], [], []))
+        group = groups[group_inds[key]]
+        group[0].append(views[i])
+        group[1].append(im_views[i].shape)
+        group[2].append(im_scales[i])
+        group[3].append(processed_ims[i])
+    return [
+        ViewBatch(views, im_shapes, im_scales, blob_utils.im_list_to_blob(ims))
+        for views, im_shapes, im_scales, ims in groups
+    ]
+
+
+def transform_boxes(boxes, view, im_view_shape):
+    """Map boxes from the original image to the transformed image of a view
+    whose shape is `im_view_shape` (boxes are not rescaled).
+    """
+    if view.aspect_ratio != 1.0:
+        boxes = box_utils.aspect_ratio(boxes, view.aspect_ratio)
+    if view.hflip:
+        boxes = box_utils.flip_boxes(boxes, im_view_shape[1])
+    return boxes
+
+
+def invert_transform_boxes(boxes, view, im_view_shape):
+    """Inverse of transform_boxes. Also supports boxes tiled per class
+    (R x 4K arrays).
+    """
+    if view.hflip:
+        boxes = box_utils.flip_boxes(boxes, im_view_shape[1])
+    if view.aspect_ratio != 1.0:
+        boxes = box_utils.aspect_ratio(boxes, 1.0 / view.aspect_ratio)
+    return boxes
+
+
+def _get_blob_shape(im_shape):
+    """Spatial shape of the blob of an image of shape im_shape after the padding
+    done by blob_utils.im_list_to_blob.
+    """
+    height, width = im_shape[0], im_shape[1]
+    if cfg.FPN.FPN_ON:
+        stride = float(cfg.FPN.COARSEST_STRIDE)
+        height = int(np.ceil(height / stride) * stride)
+        width = int(np.ceil(width / stride) * stride)
+    return height, width
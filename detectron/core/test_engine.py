@@ -18,20 +18,24 @@ import datetime
 import logging
 import numpy as np
 import os
+import time
 import yaml
 
 from caffe2.python import workspace
 
 from detectron.core.config import cfg
 from detectron.core.config import get_output_dir
+from detectron.core.proposal_cache import ProposalCache
 from detectron.core.rpn_generator import generate_rpn_on_dataset
 from detectron.core.rpn_generator import generate_rpn_on_range
 from detectron.core.test import im_detect_all
 from detectron.datasets import task_evaluation
 from detectron.datasets.json_dataset import JsonDataset
+from detectron.modeling import fused_net
 from detectron.modeling import model_builder
 from detectron.utils.io import save_object
 from detectron.utils.timer import Timer
+import detectron.utils.blob as blob_utils
 import detectron.utils.c2 as c2_utils
 import detectron.utils.env as envu
 import detectron.utils.net as net_utils
@@ -117,7 +121,11 @@ def run_inference(
                 gpu_id=gpu_id
             )
 
-    all_results = result_getter()
+    try:
+        all_results = result_getter()
+    finally:
+        # The worker pools (see cfg.TEST.WORKER_POOL) hold a model per worker
+        subprocess_utils.close_worker_pools()
     if check_expected_results and is_parent:
         task_evaluation.check_expected_results(
             all_results,
@@ -141,7 +149,12 @@ def test_net_on_dataset(
     dataset = JsonDataset(dataset_name)
     test_timer = Timer()
     test_timer.tic()
-    if multi_gpu:
+    if multi_gpu and cfg.TEST.WORKER_POOL.ENABLED:
+        all_boxes, all_segms, all_keyps, all_bodys = \
+            worker_pool_test_net_on_dataset(
+                weights_file, dataset_name, proposal_file, output_dir
+            )
+    elif multi_gpu:
         num_images = len(dataset.get_roidb())
         all_boxes, all_segms, all_keyps, all_bodys = \
             multi_gpu_test_net_on_dataset(
@@ -213,6 +226,94 @@ def multi_gpu_test_net_on_dataset(
     return all_boxes, all_segms, all_keyps, all_bodys
 
 
+def worker_pool_test_net_on_dataset(
+    weights_file, dataset_name, proposal_file, output_dir
+):
+    """Multi-process inference on a dataset with a pool of persistent workers
+    (see cfg.TEST.WORKER_POOL). Images are dispatched to the workers one at a
+    time, so a few slow images do not hold up the whole run.
+    """
+    roidb, _, _, _, num_images = get_roidb_and_dataset(
+        dataset_name, proposal_file, None
+    )
+    # Same image selection as in test_net
+    inds = []
+    items = []
+    for i, entry in enumerate(roidb):
+        if 'has_no_densepose' in entry.keys():
+            continue
+        if cfg.TEST.PRECOMPUTED_PROPOSALS:
+            box_proposals = entry['boxes'][entry['gt_classes'] == 0]
+            if len(box_proposals) == 0:
+                continue
+        else:
+            box_proposals = None
+        inds.append(i)
+        items.append((entry['image'], box_proposals))
+
+    pool = subprocess_utils.get_worker_pool(
+        'detection', weights_file,
+        lambda worker_id: _init_pool_worker(weights_file, worker_id),
+        _im_detect_in_pool_worker
+    )
+    all_boxes, all_segms, all_keyps, all_bodys = \
+        empty_results(cfg.MODEL.NUM_CLASSES, num_images)
+    start_time = time.time()
+    try:
+        for n, (j, results) in enumerate(pool.imap_unordered(items)):
+            i = inds[j]
+            cls_boxes_i, cls_segms_i, cls_keyps_i, cls_bodys_i = results
+            extend_results(i, all_boxes, cls_boxes_i)
+            if cls_segms_i is not None:
+                extend_results(i, all_segms, cls_segms_i)
+            if cls_keyps_i is not None:
+                extend_results(i, all_keyps, cls_keyps_i)
+            if cls_bodys_i is not None:
+                extend_results(i, all_bodys, cls_bodys_i)
+            if n % 10 == 0:  # Reduce log file size
+                ave_time = (time.time() - start_time) / (n + 1)
+                eta_seconds = ave_time * (len(items) - n - 1)
+                eta = str(datetime.timedelta(seconds=int(eta_seconds)))
+                logger.info(
+                    'im_detect (worker pool): {:d}/{:d} {:.3f}s (eta: {})'.
+                    format(n + 1, len(items), ave_time, eta)
+                )
+    except Exception:
+        # Do not reuse a pool that may have a dead worker
+        subprocess_utils.close_worker_pool(
+            'detection', weights_file, terminate=True
+        )
+        raise
+
+    det_file = os.path.join(output_dir, 'detections.pkl')
+    cfg_yaml = yaml.dump(cfg)
+    save_object(
+        dict(
+            all_boxes=all_boxes,
+            all_segms=all_segms,
+            all_keyps=all_keyps,
+            all_bodys=all_bodys,
+            cfg=cfg_yaml
+        ), det_file
+    )
+    logger.info('Wrote detections to: {}'.format(os.path.abspath(det_file)))
+    return all_boxes, all_segms, all_keyps, all_bodys
+
+
+def _init_pool_worker(weights_file, worker_id):
+    gpu_id = subprocess_utils.get_pool_worker_gpu_id(worker_id)
+    model = initialize_model_from_cfg(weights_file, gpu_id=gpu_id)
+    return model, gpu_id
+
+
+def _im_detect_in_pool_worker(state, item):
+    model, gpu_id = state
+    im_file, box_proposals = item
+    im = cv2.imread(im_file)
+    with c2_utils.NamedCudaScope(gpu_id):
+        return im_detect_all(model, im, box_proposals)
+
+
 def test_net(
     weights_file,
     dataset_name,
@@ -275,7 +376,9 @@ def test_net(
                 timers['im_detect_bbox'].average_time +
                 timers['im_detect_mask'].average_time +
                 timers['im_detect_keypoints'].average_time +
-                timers['im_detect_body_uv'].average_time
+                timers['im_detect_body_uv'].average_time +
+                timers['im_detect_fused'].average_time +
+                timers['im_conv_body'].average_time
             )
             misc_time = (
                 timers['misc_bbox'].average_time +
@@ -324,6 +427,11 @@ def test_net(
         ), det_file
     )
     logger.info('Wrote detections to: {}'.format(os.path.abspath(det_file)))
+    logger.info(
+        'Padding: {:.1%} of the input blob pixels'.format(
+            blob_utils.get_padding_ratio()
+        )
+    )
     return all_boxes, all_segms, all_keyps, all_bodys
 
 
@@ -332,10 +440,16 @@ def initialize_model_from_cfg(weights_file, gpu_id=0):
     creates the networks in the Caffe2 workspace.
     """
     model = model_builder.create(cfg.MODEL.TYPE, train=False, gpu_id=gpu_id)
+    # The fused net runs on CPU: no GPU is needed in that case
     net_utils.initialize_gpu_from_weights_file(
-        model, weights_file, gpu_id=gpu_id,
+        model, weights_file, gpu_id=gpu_id, cpu=cfg.TEST.FUSED_NET
     )
     model_builder.add_inference_inputs(model)
+    if cfg.TEST.FUSED_NET:
+        with c2_utils.NamedCudaScope(gpu_id):
+            model.fused_net = fused_net.build_fused_inference_net(model)
+        workspace.CreateNet(model.fused_net)
+        return model
     workspace.CreateNet(model.net)
     workspace.CreateNet(model.conv_body_net)
     if cfg.MODEL.MASK_ON:
@@ -344,6 +458,8 @@ def initialize_model_from_cfg(weights_file, gpu_id=0):
         workspace.CreateNet(model.keypoint_net)
     if cfg.MODEL.BODY_UV_ON:
         workspace.CreateNet(model.body_uv_net)
+    if cfg.TEST.PROPOSAL_CACHE.ENABLED:
+        model.proposal_cache = ProposalCache(model, weights_file)
     return model
 
 
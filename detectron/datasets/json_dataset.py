@@ -32,12 +32,17 @@ from pycocotools import mask as COCOmask
 from pycocotools.coco import COCO
 
 from detectron.core.config import cfg
+from detectron.utils.subprocess import WorkerPool
 from detectron.utils.timer import Timer
 import detectron.datasets.dataset_catalog as dataset_catalog
 import detectron.utils.boxes as box_utils
 
 logger = logging.getLogger(__name__)
 
+# Minimum number of images per worker when adding the ground-truth annotations
+# in parallel (see cfg.DATA_LOADER.NUM_ROIDB_WORKERS)
+_MIN_ROIDB_SHARD_SIZE = 100
+
 
 class JsonDataset(object):
     """A class representing a COCO json dataset."""
@@ -96,8 +101,15 @@ class JsonDataset(object):
         if gt:
             # Include ground-truth object annotations
             self.debug_timer.tic()
-            for entry in roidb:
-                self._add_gt_annotations(entry)
+            num_workers = min(
+                cfg.DATA_LOADER.NUM_ROIDB_WORKERS,
+                len(roidb) // _MIN_ROIDB_SHARD_SIZE
+            )
+            if num_workers <= 1 or not self._add_gt_annotations_parallel(
+                roidb, num_workers
+            ):
+                for entry in roidb:
+                    self._add_gt_annotations(entry)
             logger.debug(
                 '_add_gt_annotations took {:.3f}s'.
                 format(self.debug_timer.toc(average=False))
@@ -161,6 +173,51 @@ class JsonDataset(object):
             if k in entry:
                 del entry[k]
 
+    def _add_gt_annotations_parallel(self, roidb, num_workers):
+        """Add ground-truth annotations to the roidb entries in a pool of
+        forked worker processes (see cfg.DATA_LOADER.NUM_ROIDB_WORKERS). Returns
+        False if the pool failed, in which case the entries are unchanged.
+        """
+        def process_shard(_, inds):
+            entries = []
+            for i in inds:
+                entry = roidb[i]
+                self._add_gt_annotations(entry)
+                # The dataset is not sent back to the main process
+                entries.append(
+                    {k: v for k, v in entry.items() if k != 'dataset'}
+                )
+            return entries
+
+        # Several shards per worker to balance the load
+        num_shards = min(len(roidb), 4 * num_workers)
+        shards = [
+            range(i * len(roidb) // num_shards,
+                  (i + 1) * len(roidb) // num_shards)
+            for i in range(num_shards)
+        ]
+        results = [None] * num_shards
+        pool = None
+        try:
+            pool = WorkerPool(
+                'Roidb', num_workers, lambda worker_id: None, process_shard
+            )
+            for i, entries in pool.imap_unordered(shards):
+                results[i] = entries
+        except Exception:
+            logger.exception(
+                'Adding the ground-truth annotations with {} workers failed; '
+                'falling back to the main process'.format(num_workers)
+            )
+            if pool is not None:
+                pool.terminate()
+            return False
+        pool.close()
+        for inds, entries in zip(shards, results):
+            for i, entry in zip(inds, entries):
+                roidb[i].update(entry)
+        return True
+
     def _add_gt_annotations(self, entry):
         """Add ground truth annotation metadata to an roidb entry."""
         ann_ids = self.COCO.getAnnIds(imgIds=entry['id'], iscrowd=None)
@@ -409,15 +466,15 @@ def _merge_proposal_boxes_into_roidb(roidb, box_list):
         if len(gt_inds) > 0:
             gt_boxes = entry['boxes'][gt_inds, :]
             gt_classes = entry['gt_classes'][gt_inds]
-            proposal_to_gt_overlaps = box_utils.bbox_overlaps(
+            proposal_to_gt_overlaps = box_utils.sparse_bbox_overlaps(
                 boxes.astype(dtype=np.float32, copy=False),
                 gt_boxes.astype(dtype=np.float32, copy=False)
             )
             # Gt box that overlaps each input box the most
             # (ties are broken arbitrarily by class order)
-            argmaxes = proposal_to_gt_overlaps.argmax(axis=1)
+            argmaxes = proposal_to_gt_overlaps.argmax
             # Amount of that overlap
-            maxes = proposal_to_gt_overlaps.max(axis=1)
+            maxes = proposal_to_gt_overlaps.max_overlaps
             # Those boxes with non-zero overlap with gt boxes
             I = np.where(maxes > 0)[0]
             # Record max overlaps with the class of the appropriate gt box
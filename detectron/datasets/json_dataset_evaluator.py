@@ -274,27 +274,33 @@ def evaluate_box_proposals(
             continue
         if limit is not None and boxes.shape[0] > limit:
             boxes = boxes[:limit, :]
-        overlaps = box_utils.bbox_overlaps(
+        overlaps = box_utils.sparse_bbox_overlaps(
             boxes.astype(dtype=np.float32, copy=False),
             gt_boxes.astype(dtype=np.float32, copy=False))
         _gt_overlaps = np.zeros((gt_boxes.shape[0]))
-        for j in range(min(boxes.shape[0], gt_boxes.shape[0])):
-            # find which proposal box maximally covers each gt box
-            argmax_overlaps = overlaps.argmax(axis=0)
-            # and get the iou amount of coverage for each gt box
-            max_overlaps = overlaps.max(axis=0)
-            # find which gt box is 'best' covered (i.e. 'best' = most iou)
-            gt_ind = max_overlaps.argmax()
-            gt_ovr = max_overlaps.max()
-            assert gt_ovr >= 0
-            # find the proposal box that covers the best covered gt box
-            box_ind = argmax_overlaps[gt_ind]
+        # Greedily match the 'best' covered gt box (i.e. 'best' = most iou)
+        # with the proposal box that covers it by going through the
+        # overlapping pairs in order of decreasing iou (ties are broken by
+        # the lowest gt box index, then the lowest proposal box index); gt
+        # boxes that are left unmatched have an iou coverage of 0
+        order = np.lexsort(
+            (overlaps.inds, overlaps.query_inds, -overlaps.overlaps))
+        box_used = np.zeros((boxes.shape[0]), dtype=np.bool_)
+        gt_used = np.zeros((gt_boxes.shape[0]), dtype=np.bool_)
+        j = 0
+        for k in order:
+            box_ind = overlaps.inds[k]
+            gt_ind = overlaps.query_inds[k]
+            if box_used[box_ind] or gt_used[gt_ind]:
+                continue
             # record the iou coverage of this gt box
-            _gt_overlaps[j] = overlaps[box_ind, gt_ind]
-            assert _gt_overlaps[j] == gt_ovr
+            _gt_overlaps[j] = overlaps.overlaps[k]
+            j += 1
+            if j == len(_gt_overlaps):
+                break
             # mark the proposal box and the gt box as used
-            overlaps[box_ind, :] = -1
-            overlaps[:, gt_ind] = -1
+            box_used[box_ind] = True
+            gt_used[gt_ind] = True
         # append recorded iou coverage level
         gt_overlaps = np.hstack((gt_overlaps, _gt_overlaps))
 
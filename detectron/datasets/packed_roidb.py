@@ -0,0 +1,355 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Compact struct-of-arrays representation of a training roidb (see
+cfg.TRAIN.PACKED_ROIDB).
+
+Instead of one dict of small arrays and Python objects per entry, the values of
+each field of all entries are stored in a few flat arrays:
+
+  - ndarray fields (boxes, gt_classes, seg_areas, gt_keypoints, bbox_targets,
+    ...) are concatenated along their first axis
+  - sparse matrix fields (gt_overlaps) are stacked into one CSR matrix
+  - number and string fields (width, height, flipped, image, ...) are stored in
+    one array per field
+  - DensePose point fields (dp_x, dp_y, dp_I, dp_U, dp_V: one list of numbers
+    per object) are concatenated as float32 values with per-object offsets
+  - other fields (segms polygons and RLEs, dp_masks, ...) are stored as the
+    concatenated pickled bytes of the value of each entry
+
+together with per-entry [start, end) offset tables. Entries that share a value
+(e.g., the flipped entries created on demand, see cfg.TRAIN.FLIP_ON_DEMAND)
+share its data. PackedRoidb[i] is a read-only dict-like view of entry i that
+builds the value of a field when it is accessed.
+
+A packed roidb can be saved in the flat weights format (see
+utils.io.save_flat_weights) and loaded as read-only arrays backed by a memory
+mapping of the file, whose pages are shared by all the processes that load it
+(a file in /dev/shm places them in shared memory).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from six import text_type
+import cPickle as pickle
+import numbers
+import numpy as np
+import scipy.sparse
+
+from detectron.utils.collections import AttrDict
+from detectron.utils.io import load_flat_weights
+from detectron.utils.io import save_flat_weights
+
+# Kinds of fields
+_ARRAY = 'array'
+_SPARSE = 'sparse'
+_SCALAR = 'scalar'
+_STRING = 'string'
+_POINTS = 'points'
+_PICKLED = 'pickled'
+_SHARED = 'shared'
+
+# Fields whose values are objects shared by many entries; they are stored once
+# and referenced by index
+_SHARED_FIELDS = ('dataset', )
+
+# Name of the array with the pickled field kinds and shared values in a packed
+# roidb file
+_META_BLOB = '__meta__'
+
+
+class PackedRoidb(object):
+    """Sequence of the entries of a roidb stored as flat arrays."""
+
+    def __init__(self, arrays, fields, shared_values):
+        self._arrays = arrays
+        self._fields = fields
+        self._shared_values = shared_values
+        self._num_entries = (
+            len(arrays[next(iter(fields)) + '/present']) if fields else 0
+        )
+
+    def __len__(self):
+        return self._num_entries
+
+    def __getitem__(self, index):
+        index = int(index)
+        if index < 0:
+            index += self._num_entries
+        if index < 0 or index >= self._num_entries:
+            raise IndexError('roidb index out of range')
+        return PackedRoidbEntry(self, index)
+
+    def __iter__(self):
+        for i in range(self._num_entries):
+            yield PackedRoidbEntry(self, i)
+
+    @property
+    def nbytes(self):
+        """Size of the arrays of the packed roidb."""
+        return sum(a.nbytes for a in self._arrays.values())
+
+    def has_field(self, index, key):
+        return (
+            key in self._fields and
+            bool(self._arrays[key + '/present'][index])
+        )
+
+    def get_field(self, index, key):
+        """Value of field `key` of entry `index`."""
+        if not self.has_field(index, key):
+            raise KeyError(key)
+        kind = self._fields[key][0]
+        a = self._arrays
+        if kind == _SHARED:
+            return self._shared_values[key][a[key + '/index'][index]]
+        if kind == _SCALAR:
+            return a[key + '/data'][index].item()
+        start = a[key + '/start'][index]
+        end = a[key + '/end'][index]
+        if kind == _ARRAY:
+            return a[key + '/data'][start:end]
+        if kind == _SPARSE:
+            indptr = a[key + '/indptr'][start:end + 1]
+            return scipy.sparse.csr_matrix(
+                (
+                    a[key + '/data'][indptr[0]:indptr[-1]],
+                    a[key + '/indices'][indptr[0]:indptr[-1]],
+                    indptr - indptr[0]
+                ),
+                shape=(end - start, self._fields[key][2])
+            )
+        if kind == _STRING:
+            return a[key + '/data'][start:end].tobytes().decode('utf-8')
+        if kind == _POINTS:
+            data = a[key + '/data']
+            items = a[key + '/items']
+            return [data[items[i]:items[i + 1]] for i in range(start, end)]
+        assert kind == _PICKLED, kind
+        return pickle.loads(a[key + '/data'][start:end].tobytes())
+
+    def keys(self, index):
+        return [k for k in sorted(self._fields) if self.has_field(index, k)]
+
+    def save(self, file_name):
+        """Save the packed roidb in the flat weights format. The 'dataset' of
+        the entries is saved as an AttrDict with the attributes of the dataset
+        except its COCO API object.
+        """
+        shared_values = {
+            key: [_get_dataset_attrs(v) for v in values]
+            for key, values in self._shared_values.items()
+        }
+        meta = pickle.dumps(
+            dict(fields=self._fields, shared_values=shared_values),
+            pickle.HIGHEST_PROTOCOL
+        )
+        blobs = dict(self._arrays)
+        blobs[_META_BLOB] = np.frombuffer(meta, dtype=np.uint8)
+        save_flat_weights(blobs, file_name)
+
+
+class PackedRoidbEntry(object):
+    """Read-only dict-like view of an entry of a PackedRoidb."""
+
+    def __init__(self, packed_roidb, index):
+        self._packed_roidb = packed_roidb
+        self.index = index
+        # Identifies the entry across views (e.g., to cache data about it)
+        self.key = (id(packed_roidb), index)
+
+    def __getitem__(self, key):
+        return self._packed_roidb.get_field(self.index, key)
+
+    def __contains__(self, key):
+        return self._packed_roidb.has_field(self.index, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def keys(self):
+        return self._packed_roidb.keys(self.index)
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+
+def pack_roidb(roidb):
+    """Return a PackedRoidb with the entries of a roidb (a list of dicts)."""
+    fields = {}
+    for entry in roidb:
+        for key, value in entry.items():
+            kind = _get_field_kind(key, value)
+            if fields.get(key, kind) != kind:
+                kind = (_PICKLED, )
+            fields[key] = kind
+    arrays = {}
+    shared_values = {}
+    for key, kind in fields.items():
+        present = np.array([key in entry for entry in roidb], dtype=np.bool_)
+        values = [entry.get(key) for entry in roidb]
+        if kind[0] == _SHARED:
+            shared_values[key], field_arrays = _pack_shared(values, present)
+        elif kind[0] == _SCALAR:
+            field_arrays = _pack_scalars(values, present, kind[1])
+        else:
+            field_arrays = _pack_ranges(values, present, kind)
+        field_arrays['present'] = present
+        for name, array in field_arrays.items():
+            array.flags.writeable = False
+            arrays['{}/{}'.format(key, name)] = array
+    return PackedRoidb(arrays, fields, shared_values)
+
+
+def load_packed_roidb(file_name):
+    """Load a packed roidb saved with PackedRoidb.save. Its arrays are memory
+    mapped (see utils.io.load_flat_weights).
+    """
+    arrays = load_flat_weights(file_name)['blobs']
+    meta = pickle.loads(arrays.pop(_META_BLOB).tobytes())
+    return PackedRoidb(arrays, meta['fields'], meta['shared_values'])
+
+
+def _get_field_kind(key, value):
+    """Kind of a field given one of its values, as a tuple (kind, ...)."""
+    if key in _SHARED_FIELDS:
+        return (_SHARED, )
+    if isinstance(value, np.ndarray) and value.ndim > 0:
+        return (_ARRAY, value.dtype.str, value.shape[1:])
+    if scipy.sparse.isspmatrix_csr(value):
+        return (_SPARSE, value.dtype.str, value.shape[1])
+    if isinstance(value, (numbers.Real, np.bool_)):
+        return (_SCALAR, np.asarray(value).dtype.str)
+    if isinstance(value, text_type):
+        return (_STRING, )
+    if isinstance(value, list) and all(
+        isinstance(item, list) and
+        all(isinstance(x, numbers.Number) for x in item) for item in value
+    ):
+        return (_POINTS, )
+    return (_PICKLED, )
+
+
+def _pack_shared(values, present):
+    unique_values = []
+    value_inds = {}
+    index = np.zeros(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if present[i]:
+            if id(value) not in value_inds:
+                value_inds[id(value)] = len(unique_values)
+                unique_values.append(value)
+            index[i] = value_inds[id(value)]
+    return unique_values, {'index': index}
+
+
+def _pack_scalars(values, present, dtype):
+    data = np.zeros(len(values), dtype=np.dtype(str(dtype)))
+    for i, value in enumerate(values):
+        if present[i]:
+            data[i] = value
+    return {'data': data}
+
+
+def _pack_ranges(values, present, kind):
+    """Pack the values of a field whose values are stored as [start, end)
+    ranges of rows. Values that are the same object share their rows.
+    """
+    start = np.zeros(len(values), dtype=np.int64)
+    end = np.zeros(len(values), dtype=np.int64)
+    chunks = []
+    num_rows = 0
+    value_ranges = {}
+    for i, value in enumerate(values):
+        if not present[i]:
+            continue
+        if id(value) not in value_ranges:
+            chunk = _to_chunk(value, kind)
+            value_ranges[id(value)] = (num_rows, num_rows + _len(chunk))
+            chunks.append(chunk)
+            num_rows += _len(chunk)
+        start[i], end[i] = value_ranges[id(value)]
+    field_arrays = _concat_chunks(chunks, kind)
+    field_arrays['start'] = start
+    field_arrays['end'] = end
+    return field_arrays
+
+
+def _to_chunk(value, kind):
+    if kind[0] == _STRING:
+        return np.frombuffer(value.encode('utf-8'), dtype=np.uint8)
+    if kind[0] == _PICKLED:
+        return np.frombuffer(
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL), dtype=np.uint8
+        )
+    if kind[0] == _POINTS:
+        return [np.array(item, dtype=np.float32) for item in value]
+    return value
+
+
+def _len(chunk):
+    return chunk.shape[0] if hasattr(chunk, 'shape') else len(chunk)
+
+
+def _concat_chunks(chunks, kind):
+    if kind[0] == _ARRAY:
+        dtype, shape = np.dtype(str(kind[1])), tuple(kind[2])
+        return {'data': _concat(chunks, dtype, shape)}
+    if kind[0] == _SPARSE:
+        # The stacked rows of the matrices
+        dtype = np.dtype(str(kind[1]))
+        nnz = np.cumsum([0] + [m.nnz for m in chunks])
+        indptr = [np.zeros(1, dtype=np.int64)] + [
+            m.indptr[1:].astype(np.int64) + offset
+            for m, offset in zip(chunks, nnz[:-1])
+        ]
+        return {
+            'data': _concat([m.data for m in chunks], dtype),
+            'indices': _concat(
+                [m.indices.astype(np.int32) for m in chunks], np.int32
+            ),
+            'indptr': np.concatenate(indptr),
+        }
+    if kind[0] == _POINTS:
+        items = [item for chunk in chunks for item in chunk]
+        return {
+            'data': _concat(items, np.float32),
+            'items': np.cumsum(
+                [0] + [len(item) for item in items], dtype=np.int64
+            ),
+        }
+    return {'data': _concat(chunks, np.uint8)}
+
+
+def _concat(arrays, dtype, shape=()):
+    if len(arrays) == 0:
+        return np.zeros((0, ) + shape, dtype=dtype)
+    return np.ascontiguousarray(np.concatenate(arrays).astype(dtype))
+
+
+def _get_dataset_attrs(dataset):
+    """Attributes of a dataset except its COCO API object as an AttrDict."""
+    if isinstance(dataset, AttrDict):
+        return dataset
+    return AttrDict({
+        k: v for k, v in vars(dataset).items()
+        if k not in ('COCO', 'debug_timer')
+    })
@@ -12,18 +12,56 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from collections import OrderedDict
 from past.builtins import basestring
+import cPickle as pickle
+import hashlib
 import logging
 import numpy as np
+import os
+import threading
 
 from detectron.core.config import cfg
 from detectron.datasets.json_dataset import JsonDataset
+from detectron.datasets.packed_roidb import load_packed_roidb
+from detectron.datasets.packed_roidb import pack_roidb
+from detectron.datasets.packed_roidb import PackedRoidbEntry
+from detectron.utils.collections import AttrDict
+from detectron.utils.io import get_file_sha1sum
+from detectron.utils.io import save_object
+from detectron.utils.timer import Timer
+import detectron.datasets.dataset_catalog as dataset_catalog
 import detectron.utils.boxes as box_utils
 import detectron.utils.keypoints as keypoint_utils
 import detectron.utils.segms as segm_utils
 
 logger = logging.getLogger(__name__)
 
+# LRU cache of the entries flipped on demand (see get_minibatch_entry)
+_flipped_entry_cache = OrderedDict()
+_flipped_entry_cache_lock = threading.Lock()
+
+# Version of the training roidb snapshots (see TRAIN.ROIDB_CACHE); increment it
+# when the roidb building code changes to invalidate the existing snapshots
+_ROIDB_CACHE_VERSION = 1
+
+# Config options used to build the training roidb (part of the snapshot key)
+_ROIDB_CACHE_CFG_KEYS = [
+    'BODY_UV_RCNN.BODY_UV_IMS',
+    'MODEL.BBOX_REG_WEIGHTS',
+    'MODEL.BODY_UV_ON',
+    'MODEL.CLS_AGNOSTIC_BBOX_REG',
+    'MODEL.KEYPOINTS_ON',
+    'TRAIN.BBOX_THRESH',
+    'TRAIN.BG_THRESH_HI',
+    'TRAIN.BG_THRESH_LO',
+    'TRAIN.CROWD_FILTER_THRESH',
+    'TRAIN.FG_THRESH',
+    'TRAIN.FLIP_ON_DEMAND',
+    'TRAIN.GT_MIN_AREA',
+    'TRAIN.USE_FLIPPED',
+]
+
 
 def combined_roidb_for_training(dataset_names, proposal_files):
     """Load and concatenate roidbs for one or more datasets, along with optional
@@ -50,6 +88,15 @@ def combined_roidb_for_training(dataset_names, proposal_files):
     if len(proposal_files) == 0:
         proposal_files = (None, ) * len(dataset_names)
     assert len(dataset_names) == len(proposal_files)
+    if cfg.TRAIN.ROIDB_CACHE:
+        cache_file = _get_roidb_cache_file(dataset_names, proposal_files)
+        if os.path.exists(cache_file):
+            roidb = _load_roidb_cache(cache_file)
+            _compute_and_log_stats(roidb)
+            if cfg.TRAIN.PACKED_ROIDB:
+                roidb = _pack_roidb(roidb)
+            return roidb
+
     roidbs = [get_roidb(*args) for args in zip(dataset_names, proposal_files)]
     roidb = roidbs[0]
     for r in roidbs[1:]:
@@ -60,8 +107,14 @@ def combined_roidb_for_training(dataset_names, proposal_files):
     add_bbox_regression_targets(roidb)
     logger.info('done')
 
+    if cfg.TRAIN.ROIDB_CACHE:
+        _save_roidb_cache(roidb, cache_file)
+
     _compute_and_log_stats(roidb)
 
+    if cfg.TRAIN.PACKED_ROIDB:
+        roidb = _pack_roidb(roidb)
+
     return roidb
 
 
@@ -71,35 +124,86 @@ def extend_with_flipped_entries(roidb, dataset):
 
     "Flipping" an entry means that that image and associated metadata (e.g.,
     ground truth boxes and object proposals) are horizontally flipped.
+
+    If cfg.TRAIN.FLIP_ON_DEMAND is True, the flipped entries share the data of
+    the original entries and are marked with 'flip_on_demand': their metadata
+    is flipped by get_minibatch_entry.
     """
     flipped_roidb = []
     for entry in roidb:
-        width = entry['width']
-        boxes = entry['boxes'].copy()
-        oldx1 = boxes[:, 0].copy()
-        oldx2 = boxes[:, 2].copy()
-        boxes[:, 0] = width - oldx2 - 1
-        boxes[:, 2] = width - oldx1 - 1
-        assert (boxes[:, 2] >= boxes[:, 0]).all()
-        flipped_entry = {}
-        dont_copy = ('boxes', 'segms', 'gt_keypoints', 'flipped')
-        for k, v in entry.items():
-            if k not in dont_copy:
-                flipped_entry[k] = v
-        flipped_entry['boxes'] = boxes
-        flipped_entry['segms'] = segm_utils.flip_segms(
-            entry['segms'], entry['height'], entry['width']
-        )
-        if dataset.keypoints is not None:
-            flipped_entry['gt_keypoints'] = keypoint_utils.flip_keypoints(
-                dataset.keypoints, dataset.keypoint_flip_map,
-                entry['gt_keypoints'], entry['width']
-            )
-        flipped_entry['flipped'] = True
+        if cfg.TRAIN.FLIP_ON_DEMAND:
+            flipped_entry = dict(entry)
+            flipped_entry['flip_on_demand'] = True
+            flipped_entry['flipped'] = True
+        else:
+            flipped_entry = _flip_entry(entry)
         flipped_roidb.append(flipped_entry)
     roidb.extend(flipped_roidb)
 
 
+def get_minibatch_entry(entry):
+    """Return the roidb entry to make a minibatch from: the flipped entry if
+    `entry` is to be flipped on demand (see extend_with_flipped_entries), or
+    `entry` itself.
+    """
+    if not entry.get('flip_on_demand', False):
+        return entry
+    cache_size = cfg.TRAIN.FLIP_ON_DEMAND_CACHE_SIZE
+    if cache_size <= 0:
+        return _flip_entry(entry)
+    # The entries of a packed roidb are views created on each access
+    key = entry.key if isinstance(entry, PackedRoidbEntry) else id(entry)
+    with _flipped_entry_cache_lock:
+        flipped_entry = _flipped_entry_cache.pop(key, None)
+        if flipped_entry is not None:
+            # Move to the most recently used position
+            _flipped_entry_cache[key] = flipped_entry
+            return flipped_entry
+    flipped_entry = _flip_entry(entry)
+    with _flipped_entry_cache_lock:
+        _flipped_entry_cache[key] = flipped_entry
+        while len(_flipped_entry_cache) > cache_size:
+            _flipped_entry_cache.popitem(last=False)
+    return flipped_entry
+
+
+def _flip_entry(entry):
+    """Return a horizontally flipped copy of an (unflipped) roidb entry."""
+    width = entry['width']
+    boxes = entry['boxes'].copy()
+    oldx1 = boxes[:, 0].copy()
+    oldx2 = boxes[:, 2].copy()
+    boxes[:, 0] = width - oldx2 - 1
+    boxes[:, 2] = width - oldx1 - 1
+    assert (boxes[:, 2] >= boxes[:, 0]).all()
+    flipped_entry = {}
+    dont_copy = (
+        'boxes', 'segms', 'gt_keypoints', 'bbox_targets', 'flipped',
+        'flip_on_demand'
+    )
+    for k, v in entry.items():
+        if k not in dont_copy:
+            flipped_entry[k] = v
+    flipped_entry['boxes'] = boxes
+    flipped_entry['segms'] = segm_utils.flip_segms(
+        entry['segms'], entry['height'], entry['width']
+    )
+    dataset = entry['dataset']
+    if dataset.keypoints is not None:
+        flipped_entry['gt_keypoints'] = keypoint_utils.flip_keypoints(
+            dataset.keypoints, dataset.keypoint_flip_map,
+            entry['gt_keypoints'], entry['width']
+        )
+    if 'bbox_targets' in entry:
+        # Flipping negates the x offset between the box centers (the other
+        # targets are unchanged)
+        bbox_targets = entry['bbox_targets'].copy()
+        bbox_targets[:, 1] = -bbox_targets[:, 1]
+        flipped_entry['bbox_targets'] = bbox_targets
+    flipped_entry['flipped'] = True
+    return flipped_entry
+
+
 def filter_for_training(roidb):
     """Remove roidb entries that have no usable RoIs based on config settings.
     """
@@ -133,8 +237,14 @@ def filter_for_training(roidb):
 
 def add_bbox_regression_targets(roidb):
     """Add information needed to train bounding-box regressors."""
+    # Entries flipped on demand share the boxes, and hence the targets, of
+    # their original entry (the targets are flipped with the entry)
+    targets_of_boxes = {}
     for entry in roidb:
-        entry['bbox_targets'] = compute_bbox_regression_targets(entry)
+        key = id(entry['boxes'])
+        if key not in targets_of_boxes:
+            targets_of_boxes[key] = compute_bbox_regression_targets(entry)
+        entry['bbox_targets'] = targets_of_boxes[key]
 
 
 def compute_bbox_regression_targets(entry):
@@ -153,14 +263,11 @@ def compute_bbox_regression_targets(entry):
     # Indices of examples for which we try to make predictions
     ex_inds = np.where(overlaps >= cfg.TRAIN.BBOX_THRESH)[0]
 
-    # Get IoU overlap between each ex ROI and gt ROI
-    ex_gt_overlaps = box_utils.bbox_overlaps(
-        rois[ex_inds, :].astype(dtype=np.float32, copy=False),
-        rois[gt_inds, :].astype(dtype=np.float32, copy=False))
-
     # Find which gt ROI each ex ROI has max overlap with:
     # this will be the ex ROI's gt target
-    gt_assignment = ex_gt_overlaps.argmax(axis=1)
+    gt_assignment = box_utils.sparse_bbox_overlaps(
+        rois[ex_inds, :].astype(dtype=np.float32, copy=False),
+        rois[gt_inds, :].astype(dtype=np.float32, copy=False)).argmax
     gt_rois = rois[gt_inds[gt_assignment], :]
     ex_rois = rois[ex_inds, :]
     # Use class "1" for all boxes if using class_agnostic_bbox_reg
@@ -171,6 +278,103 @@ def compute_bbox_regression_targets(entry):
     return targets
 
 
+def _get_roidb_cache_file(dataset_names, proposal_files):
+    """Path of the training roidb snapshot of the given datasets and proposal
+    files with the current config.
+    """
+    hash_obj = hashlib.sha1('{}'.format(_ROIDB_CACHE_VERSION).encode())
+    for dataset_name, proposal_file in zip(dataset_names, proposal_files):
+        hash_obj.update(
+            '{} {} {}'.format(
+                dataset_name, dataset_catalog.get_im_dir(dataset_name),
+                dataset_catalog.get_im_prefix(dataset_name)
+            ).encode('utf-8')
+        )
+        hash_obj.update(
+            get_file_sha1sum(dataset_catalog.get_ann_fn(dataset_name)).encode()
+        )
+        if proposal_file is not None:
+            hash_obj.update(get_file_sha1sum(proposal_file).encode())
+    for key in _ROIDB_CACHE_CFG_KEYS:
+        value = cfg
+        for k in key.split('.'):
+            value = value[k]
+        hash_obj.update('{}: {!r}\n'.format(key, value).encode('utf-8'))
+    return os.path.join(
+        cfg.TRAIN.ROIDB_CACHE_DIR, 'roidb_{}.pkl'.format(hash_obj.hexdigest())
+    )
+
+
+def _save_roidb_cache(roidb, cache_file):
+    """Save a training roidb snapshot. The 'dataset' field of the entries is
+    replaced by the dataset name and the attributes of each dataset except its
+    COCO API object are saved once.
+    """
+    datasets = {}
+    entries = []
+    for entry in roidb:
+        ds = entry['dataset']
+        if ds.name not in datasets:
+            datasets[ds.name] = {
+                k: v for k, v in vars(ds).items()
+                if k not in ('COCO', 'debug_timer')
+            }
+        entry = dict(entry)
+        entry['dataset'] = ds.name
+        entries.append(entry)
+    if not os.path.exists(cfg.TRAIN.ROIDB_CACHE_DIR):
+        os.makedirs(cfg.TRAIN.ROIDB_CACHE_DIR)
+    # Write to a temporary file first so that a concurrent or interrupted run
+    # never leaves a partial snapshot
+    tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+    save_object(dict(datasets=datasets, roidb=entries), tmp_file)
+    os.rename(tmp_file, cache_file)
+    logger.info('Saved roidb snapshot: {}'.format(cache_file))
+
+
+def _load_roidb_cache(cache_file):
+    """Load a training roidb snapshot. The 'dataset' field of the entries is an
+    AttrDict with the attributes of the JsonDataset except its COCO API object.
+    """
+    timer = Timer()
+    timer.tic()
+    with open(cache_file, 'rb') as f:
+        snapshot = pickle.load(f)
+    datasets = {
+        name: AttrDict(attrs) for name, attrs in snapshot['datasets'].items()
+    }
+    roidb = snapshot['roidb']
+    for entry in roidb:
+        entry['dataset'] = datasets[entry['dataset']]
+    logger.info(
+        'Loaded roidb snapshot: {} ({:d} entries in {:.2f}s)'.format(
+            cache_file, len(roidb), timer.toc(average=False)
+        )
+    )
+    return roidb
+
+
+def _pack_roidb(roidb):
+    """Return the packed version of a training roidb (see
+    cfg.TRAIN.PACKED_ROIDB).
+    """
+    timer = Timer()
+    timer.tic()
+    packed = pack_roidb(roidb)
+    logger.info(
+        'Packed roidb: {:d} entries, {:.2f} MB in {:.2f}s'.format(
+            len(packed), packed.nbytes / 1024.**2, timer.toc(average=False)
+        )
+    )
+    if cfg.TRAIN.PACKED_ROIDB_FILE:
+        packed.save(cfg.TRAIN.PACKED_ROIDB_FILE)
+        packed = load_packed_roidb(cfg.TRAIN.PACKED_ROIDB_FILE)
+        logger.info(
+            'Memory mapped packed roidb: {}'.format(cfg.TRAIN.PACKED_ROIDB_FILE)
+        )
+    return packed
+
+
 def _compute_and_log_stats(roidb):
     classes = roidb[0]['dataset'].classes
     char_len = np.max([len(c) for c in classes])
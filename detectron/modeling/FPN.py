@@ -320,6 +320,8 @@ def add_fpn_rpn_outputs(model, blobs_in, dim_in, spatial_scales):
     k_max = cfg.FPN.RPN_MAX_LEVEL  # coarsest level of pyramid
     k_min = cfg.FPN.RPN_MIN_LEVEL  # finest level of pyramid
     assert len(blobs_in) == k_max - k_min + 1
+    # Inputs of the GenerateJointFpnProposals op (FPN.RPN_JOINT_PROPOSALS)
+    joint_proposals_inputs = []
     for lvl in range(k_min, k_max + 1):
         bl_in = blobs_in[k_max - lvl]  # blobs_in is in reversed order
         sc = spatial_scales[k_max - lvl]  # in reversed order
@@ -421,12 +423,28 @@ def add_fpn_rpn_outputs(model, blobs_in, dim_in, spatial_scales):
             rpn_cls_probs_fpn = model.net.Sigmoid(
                 rpn_cls_logits_fpn, 'rpn_cls_probs_fpn' + slvl
             )
-            model.GenerateProposals(
-                [rpn_cls_probs_fpn, rpn_bbox_pred_fpn, 'im_info'],
-                ['rpn_rois_fpn' + slvl, 'rpn_roi_probs_fpn' + slvl],
-                anchors=lvl_anchors,
-                spatial_scale=sc
-            )
+            if cfg.FPN.RPN_JOINT_PROPOSALS:
+                joint_proposals_inputs.append(
+                    (rpn_cls_probs_fpn, rpn_bbox_pred_fpn, lvl_anchors, sc)
+                )
+            else:
+                model.GenerateProposals(
+                    [rpn_cls_probs_fpn, rpn_bbox_pred_fpn, 'im_info'],
+                    ['rpn_rois_fpn' + slvl, 'rpn_roi_probs_fpn' + slvl],
+                    anchors=lvl_anchors,
+                    spatial_scale=sc
+                )
+
+    if len(joint_proposals_inputs) > 0:
+        cls_probs, bbox_preds, anchors, scales = zip(*joint_proposals_inputs)
+        lvls = [str(lvl) for lvl in range(k_min, k_max + 1)]
+        model.GenerateJointFpnProposals(
+            list(cls_probs) + list(bbox_preds) + ['im_info'],
+            ['rpn_rois_fpn' + slvl for slvl in lvls] +
+            ['rpn_roi_probs_fpn' + slvl for slvl in lvls],
+            anchors=list(anchors),
+            spatial_scales=list(scales)
+        )
 
 
 def add_fpn_rpn_losses(model):
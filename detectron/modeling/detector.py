@@ -25,6 +25,7 @@ from detectron.core.config import cfg
 from detectron.ops.collect_and_distribute_fpn_rpn_proposals \
     import CollectAndDistributeFpnRpnProposalsOp
 from detectron.ops.generate_proposal_labels import GenerateProposalLabelsOp
+from detectron.ops.generate_proposals import GenerateJointFpnProposalsOp
 from detectron.ops.generate_proposals import GenerateProposalsOp
 import detectron.roi_data.fast_rcnn as fast_rcnn_roi_data
 import detectron.utils.c2 as c2_utils
@@ -122,6 +123,20 @@ class DetectionModelHelper(cnn.CNNModelHelper):
           - 'rpn_roi_probs': 1D tensor of objectness probability scores
             (extracted from rpn_cls_probs; see above).
         """
+        if cfg.RPN.NATIVE_PROPOSAL_OPS and not self.train:
+            # Inference only, like DetectronCollectAndDistributeFpnRpnProposals
+            self.net.DetectronGenerateProposals(
+                blobs_in,
+                blobs_out,
+                anchors=anchors.astype(np.float32).ravel().tolist(),
+                spatial_scale=spatial_scale,
+                pre_nms_topN=cfg.TEST.RPN_PRE_NMS_TOP_N,
+                post_nms_topN=cfg.TEST.RPN_POST_NMS_TOP_N,
+                nms_thresh=cfg.TEST.RPN_NMS_THRESH,
+                min_size=float(cfg.TEST.RPN_MIN_SIZE),
+                bbox_xform_clip=float(cfg.BBOX_XFORM_CLIP)
+            )
+            return blobs_out
         name = 'GenerateProposalsOp:' + ','.join([str(b) for b in blobs_in])
         # spatial_scale passed to the Python op is only used in convert_pkl_to_pb
         self.net.Python(
@@ -129,6 +144,35 @@ class DetectionModelHelper(cnn.CNNModelHelper):
         )(blobs_in, blobs_out, name=name, spatial_scale=spatial_scale)
         return blobs_out
 
+    def GenerateJointFpnProposals(
+        self, blobs_in, blobs_out, anchors, spatial_scales
+    ):
+        """Op for generating the RPN proposals of all the FPN levels at once
+        (see FPN.RPN_JOINT_PROPOSALS).
+
+        blobs_in: [rpn_cls_probs_fpn<min>, ..., rpn_cls_probs_fpn<max>,
+                   rpn_bbox_pred_fpn<min>, ..., rpn_bbox_pred_fpn<max>,
+                   im_info]
+          - see GenerateProposals for the documentation of each blob.
+
+        blobs_out: [rpn_rois_fpn<min>, ..., rpn_rois_fpn<max>,
+                    rpn_roi_probs_fpn<min>, ..., rpn_roi_probs_fpn<max>]
+          - the proposals generated from the anchors of each level and their
+            scores; see rpn_rois and rpn_roi_probs in GenerateProposals.
+
+        anchors and spatial_scales are lists with the anchors and the spatial
+        scale of each level.
+        """
+        name = 'GenerateJointFpnProposalsOp:' + ','.join(
+            [str(b) for b in blobs_in]
+        )
+        self.net.Python(
+            GenerateJointFpnProposalsOp(
+                anchors, spatial_scales, self.train
+            ).forward
+        )(blobs_in, blobs_out, name=name)
+        return blobs_out
+
     def GenerateProposalLabels(self, blobs_in):
         """Op for generating training labels for RPN proposals. This is used
         when training RPN jointly with Fast/Mask R-CNN (as in end-to-end
@@ -211,6 +255,19 @@ class DetectionModelHelper(cnn.CNNModelHelper):
         )
         blobs_out = [core.ScopedBlobReference(b) for b in blobs_out]
 
+        if cfg.RPN.NATIVE_PROPOSAL_OPS and not self.train:
+            # The training path labels the proposals using the data loader
+            # code and is only available as a Python op
+            return self.net.DetectronCollectAndDistributeFpnRpnProposals(
+                blobs_in,
+                blobs_out,
+                roi_canonical_scale=cfg.FPN.ROI_CANONICAL_SCALE,
+                roi_canonical_level=cfg.FPN.ROI_CANONICAL_LEVEL,
+                roi_max_level=cfg.FPN.ROI_MAX_LEVEL,
+                roi_min_level=cfg.FPN.ROI_MIN_LEVEL,
+                rpn_post_nms_topN=cfg.TEST.RPN_POST_NMS_TOP_N
+            )
+
         outputs = self.net.Python(
             CollectAndDistributeFpnRpnProposalsOp(self.train).forward
         )(blobs_in, blobs_out, name=name)
@@ -0,0 +1,184 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Build a single fused inference net for a DensePose/Mask/Keypoint R-CNN model.
+
+At inference time model_builder splits a model into a cascade of nets
+(`model.net`, `model.mask_net`, `model.keypoint_net`, `model.body_uv_net`) and
+core.test moves the detections between them through Python, post-processing
+the boxes (NMS, detections per image limit) with numpy in between. The fused net
+instead chains everything in one graph:
+
+    data, im_info
+      -> conv body + RPN + box head                        (model.net)
+      -> BBoxTransform + BoxWithNMSLimit                   (box post-processing)
+      -> DistributeHeadRois + RoI head, for each RoI head  (model.*_net)
+      -> score_nms, bbox_nms, class_nms, <head outputs>
+
+so that a single RunNet call is needed per image. The fused net runs on CPU.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import copy
+
+from caffe2.proto import caffe2_pb2
+from caffe2.python import core
+
+from detectron.core.config import cfg
+from detectron.ops.distribute_head_rois import DistributeHeadRoisOp
+from detectron.ops.distribute_head_rois import get_head_rois_blob_names
+
+# Outputs of the in-graph box post-processing. 'bbox_nms' is in the coordinate
+# space of the network input (i.e., it must be divided by im_scale to be mapped
+# back to the original image)
+BOX_OUTPUT_BLOB_NAMES = ['score_nms', 'bbox_nms', 'class_nms']
+
+
+def check_fused_net_supported():
+    """Assert that the current config can be expressed as a fused net."""
+    assert cfg.MODEL.FASTER_RCNN, \
+        'Fused inference net requires RPN proposals (MODEL.FASTER_RCNN)'
+    assert not cfg.RETINANET.RETINANET_ON, \
+        'Fused inference net is not implemented for RetinaNet'
+    assert cfg.TEST.BBOX_REG and not cfg.MODEL.CLS_AGNOSTIC_BBOX_REG, \
+        'Fused inference net requires class specific bbox regression'
+    assert not cfg.TEST.BBOX_VOTE.ENABLED, \
+        'Box voting is not supported by the fused inference net'
+    assert not (
+        cfg.TEST.BBOX_AUG.ENABLED or cfg.TEST.MASK_AUG.ENABLED or
+        cfg.TEST.KPS_AUG.ENABLED or cfg.TEST.BODY_UV_AUG.ENABLED
+    ), 'Test-time augmentation is not supported by the fused inference net'
+
+
+def get_head_nets(model):
+    """Return the (roi blob name, head net) pairs of the enabled RoI heads in
+    the order in which they are added to the fused net.
+    """
+    head_nets = []
+    if cfg.MODEL.MASK_ON:
+        head_nets.append(('mask_rois', model.mask_net))
+    if cfg.MODEL.KEYPOINTS_ON:
+        head_nets.append(('keypoint_rois', model.keypoint_net))
+    if cfg.MODEL.BODY_UV_ON:
+        head_nets.append(('body_uv_rois', model.body_uv_net))
+    return head_nets
+
+
+def build_fused_inference_net(model, name='fused_net'):
+    """Create the fused inference net (see module docstring) from an inference
+    model created by model_builder.create(..., train=False). Must be called
+    under the same name scope as the one used to build the model (e.g.,
+    c2_utils.NamedCudaScope(gpu_id)).
+    """
+    check_fused_net_supported()
+    net = core.Net(name)
+    net.Proto().op.extend(copy.deepcopy(model.net.Proto().op))
+    add_box_postprocessing(net)
+    for roi_blob_name, head_net in get_head_nets(model):
+        add_head_rois(net, roi_blob_name)
+        net.Proto().op.extend(copy.deepcopy(head_net.Proto().op))
+        net.Proto().external_output.extend(head_net.Proto().external_output)
+    # All ops run on CPU; in particular BBoxTransform and BoxWithNMSLimit do
+    # not have CUDA implementations
+    for op in net.Proto().op:
+        op.device_option.CopyFrom(core.DeviceOption(caffe2_pb2.CPU))
+    _set_external_inputs(net)
+    return net
+
+
+def add_box_postprocessing(net):
+    """Add the in-graph equivalent of core.test.im_detect_bbox (box decoding
+    and clipping) followed by core.test.box_results_with_nms_and_limit.
+    """
+    rois, bbox_pred, im_info, cls_prob, pred_bbox = [
+        core.ScopedName(b) for b in
+        ['rois', 'bbox_pred', 'im_info', 'cls_prob', 'pred_bbox']
+    ]
+    net.Proto().op.extend([
+        core.CreateOperator(
+            'BBoxTransform',
+            [rois, bbox_pred, im_info],
+            [pred_bbox],
+            weights=cfg.MODEL.BBOX_REG_WEIGHTS,
+            # Keep the boxes in the network input coordinate space so that they
+            # can be consumed directly by the RoI heads
+            apply_scale=False,
+            correct_transform_coords=True
+        ),
+        core.CreateOperator(
+            'BoxWithNMSLimit',
+            [cls_prob, pred_bbox],
+            [core.ScopedName(b) for b in BOX_OUTPUT_BLOB_NAMES],
+            score_thresh=cfg.TEST.SCORE_THRESH,
+            nms=cfg.TEST.NMS,
+            detections_per_im=cfg.TEST.DETECTIONS_PER_IM,
+            soft_nms_enabled=cfg.TEST.SOFT_NMS.ENABLED,
+            soft_nms_method=cfg.TEST.SOFT_NMS.METHOD,
+            soft_nms_sigma=cfg.TEST.SOFT_NMS.SIGMA,
+            soft_nms_min_score_thres=0.0001
+        ),
+    ])
+    net.Proto().external_output.extend(
+        [core.ScopedName(b) for b in BOX_OUTPUT_BLOB_NAMES]
+    )
+
+
+def add_head_rois(net, roi_blob_name):
+    """Generate the RoI input blobs of a RoI head from the post-NMS detections.
+
+    Input blobs: [bbox_nms]
+      - bbox_nms: R x 4 detections produced by BoxWithNMSLimit
+
+    Output blobs: [<roi_blob_name>] and, if FPN.MULTILEVEL_ROIS, also
+                  [<roi_blob_name>_fpn<min>, ..., <roi_blob_name>_fpn<max>,
+                   <roi_blob_name>_idx_restore_int32]
+      - these are the same blobs that core.test feeds to the RoI head nets
+    """
+    blobs_in = [core.ScopedName('bbox_nms')]
+    blobs_out = [
+        core.ScopedName(b) for b in get_head_rois_blob_names(roi_blob_name)
+    ]
+    name = 'DistributeHeadRoisOp:' + roi_blob_name
+    net.Python(DistributeHeadRoisOp(roi_blob_name).forward)(
+        blobs_in, blobs_out, name=name
+    )
+
+
+def get_head_op_inds(net, model, roi_blob_name):
+    """Return the indices of the ops of the RoI head whose RoI input is named
+    `roi_blob_name` (e.g., 'body_uv_rois') in the fused net.
+    """
+    head_nets = dict(get_head_nets(model))
+    assert roi_blob_name in head_nets, \
+        'No RoI head with RoI input {}'.format(roi_blob_name)
+    distribute_op_name = 'DistributeHeadRoisOp:' + roi_blob_name
+    start = [
+        i for i, op in enumerate(net.Proto().op)
+        if op.name == distribute_op_name
+    ]
+    assert len(start) == 1
+    num_head_ops = len(head_nets[roi_blob_name].Proto().op)
+    return list(range(start[0] + 1, start[0] + 1 + num_head_ops))
+
+
+def _set_external_inputs(net):
+    """Treat any blob that is not produced by an earlier op as external input
+    (input image blobs and parameters).
+    """
+    defined = set()
+    external_inputs = []
+    for op in net.Proto().op:
+        for blob_in in op.input:
+            if blob_in not in defined and blob_in not in external_inputs:
+                external_inputs.append(blob_in)
+        defined.update(op.output)
+    del net.Proto().external_input[:]
+    net.Proto().external_input.extend(external_inputs)
@@ -419,7 +419,8 @@ def add_training_inputs(model, roidb=None):
             roidb,
             num_loaders=cfg.DATA_LOADER.NUM_THREADS,
             minibatch_queue_size=cfg.DATA_LOADER.MINIBATCH_QUEUE_SIZE,
-            blobs_queue_capacity=cfg.DATA_LOADER.BLOBS_QUEUE_CAPACITY
+            blobs_queue_capacity=cfg.DATA_LOADER.BLOBS_QUEUE_CAPACITY,
+            adaptive=cfg.DATA_LOADER.ADAPTIVE
         )
     orig_num_op = len(model.net._net.op)
     blob_names = roi_data_minibatch.get_minibatch_blob_names(is_training=True)
@@ -75,7 +75,17 @@ def collect(inputs, is_training):
     # Combine predictions across all levels and retain the top scoring
     rois = np.concatenate([blob.data for blob in roi_inputs])
     scores = np.concatenate([blob.data for blob in score_inputs]).squeeze()
-    inds = np.argsort(-scores)[:post_nms_topN]
+    inds = np.argsort(-scores)
+    if is_training or len(inds) == 0:
+        inds = inds[:post_nms_topN]
+    else:
+        # At inference a batch holds views of the same image (batched test-time
+        # augmentation, see core.test_aug): the limit applies to each view
+        batch_inds = rois[inds, 0]
+        inds = np.concatenate([
+            inds[batch_inds == i][:post_nms_topN]
+            for i in np.unique(batch_inds)
+        ])
     rois = rois[inds, :]
     return rois
 
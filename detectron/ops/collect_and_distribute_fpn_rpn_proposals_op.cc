@@ -0,0 +1,138 @@
+/**
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+ */
+
+#include <algorithm>
+#include <cmath>
+#include <numeric>
+#include <vector>
+
+#include "collect_and_distribute_fpn_rpn_proposals_op.h"
+
+namespace caffe2 {
+
+template <>
+bool DetectronCollectAndDistributeFpnRpnProposalsOp<float, CPUContext>::
+    RunOnDevice() {
+  // Inputs are [rpn_rois_fpn<min>, ..., rpn_rois_fpn<max>,
+  //             rpn_roi_probs_fpn<min>, ..., rpn_roi_probs_fpn<max>]
+  CAFFE_ENFORCE_EQ(InputSize() % 2, 0);
+  const int num_rpn_lvls = InputSize() / 2;
+  const int num_roi_lvls = roi_max_level_ - roi_min_level_ + 1;
+  // Outputs are [rois, rois_fpn<min>, ..., rois_fpn<max>, rois_idx_restore]
+  CAFFE_ENFORCE_EQ(OutputSize(), num_roi_lvls + 2);
+
+  // Combine predictions across all levels
+  std::vector<float> all_rois;
+  std::vector<float> all_scores;
+  for (int i = 0; i < num_rpn_lvls; ++i) {
+    const auto& rois = Input(i);
+    const auto& scores = Input(num_rpn_lvls + i);
+    CAFFE_ENFORCE_EQ(rois.ndim(), 2);
+    CAFFE_ENFORCE_EQ(rois.dim32(1), 5);
+    CAFFE_ENFORCE_EQ(scores.size(), rois.dim32(0));
+    all_rois.insert(
+        all_rois.end(), rois.data<float>(), rois.data<float>() + rois.size());
+    all_scores.insert(
+        all_scores.end(),
+        scores.data<float>(),
+        scores.data<float>() + scores.size());
+  }
+
+  // Retain the top scoring proposals of each image of the batch (the images
+  // are in increasing batch index order)
+  std::vector<int> order(all_scores.size());
+  std::iota(order.begin(), order.end(), 0);
+  std::stable_sort(
+      order.begin(), order.end(), [&all_rois, &all_scores](int i, int j) {
+        const float batch_i = all_rois[5 * i];
+        const float batch_j = all_rois[5 * j];
+        if (batch_i != batch_j) {
+          return batch_i < batch_j;
+        }
+        return all_scores[i] > all_scores[j];
+      });
+  std::vector<int> inds;
+  int num_batch_rois = 0;
+  for (size_t k = 0; k < order.size(); ++k) {
+    if (k > 0 && all_rois[5 * order[k]] != all_rois[5 * order[k - 1]]) {
+      num_batch_rois = 0;
+    }
+    if (num_batch_rois < rpn_post_nms_topN_) {
+      inds.push_back(order[k]);
+    }
+    ++num_batch_rois;
+  }
+  const int num_rois = inds.size();
+
+  auto* rois_out = Output(0);
+  rois_out->Resize(num_rois, 5);
+  float* rois_data = rois_out->mutable_data<float>();
+  for (int i = 0; i < num_rois; ++i) {
+    std::copy(
+        all_rois.begin() + 5 * inds[i],
+        all_rois.begin() + 5 * inds[i] + 5,
+        rois_data + 5 * i);
+  }
+
+  // Determine which FPN level each RoI should map to based on the heuristic
+  // in the FPN paper (see modeling.FPN.map_rois_to_fpn_levels)
+  std::vector<int> lvls(num_rois);
+  for (int i = 0; i < num_rois; ++i) {
+    const float* roi = rois_data + 5 * i;
+    const float area = (roi[3] - roi[1] + 1) * (roi[4] - roi[2] + 1);
+    const float s = std::sqrt(area);
+    const float lvl = std::floor(
+        roi_canonical_level_ +
+        std::log2(s / roi_canonical_scale_ + 1e-6f));
+    lvls[i] = std::min(
+        std::max(static_cast<int>(lvl), roi_min_level_), roi_max_level_);
+  }
+
+  // Create new roi blobs for each FPN level and the permutation that restores
+  // the RoIs to the order of the rois blob once the levels are concatenated
+  auto* rois_idx_restore = Output(num_roi_lvls + 1);
+  rois_idx_restore->Resize(num_rois);
+  int* restore_data = rois_idx_restore->mutable_data<int>();
+  int num_lvl_rois_total = 0;
+  for (int lvl = roi_min_level_; lvl <= roi_max_level_; ++lvl) {
+    const int num_lvl_rois = std::count(lvls.begin(), lvls.end(), lvl);
+    auto* lvl_rois_out = Output(lvl - roi_min_level_ + 1);
+    lvl_rois_out->Resize(num_lvl_rois, 5);
+    float* lvl_rois_data = lvl_rois_out->mutable_data<float>();
+    for (int i = 0; i < num_rois; ++i) {
+      if (lvls[i] == lvl) {
+        std::copy(rois_data + 5 * i, rois_data + 5 * i + 5, lvl_rois_data);
+        lvl_rois_data += 5;
+        restore_data[i] = num_lvl_rois_total++;
+      }
+    }
+  }
+  return true;
+}
+
+REGISTER_CPU_OPERATOR(
+    DetectronCollectAndDistributeFpnRpnProposals,
+    DetectronCollectAndDistributeFpnRpnProposalsOp<float, CPUContext>);
+
+OPERATOR_SCHEMA(DetectronCollectAndDistributeFpnRpnProposals)
+    .NumInputs(2, INT_MAX)
+    .NumOutputs(3, INT_MAX)
+    .Arg("roi_canonical_scale", "(int) FPN.ROI_CANONICAL_SCALE")
+    .Arg("roi_canonical_level", "(int) FPN.ROI_CANONICAL_LEVEL")
+    .Arg("roi_max_level", "(int) FPN.ROI_MAX_LEVEL")
+    .Arg("roi_min_level", "(int) FPN.ROI_MIN_LEVEL")
+    .Arg("rpn_post_nms_topN", "(int) Number of proposals kept per image")
+    .Input(0, "rpn_rois_fpn<min>", "Proposals of the RPN levels, (R_i, 5)")
+    .Input(1, "rpn_roi_probs_fpn<min>", "Scores of the proposals, (R_i, 1)")
+    .Output(0, "rois", "Top scoring proposals of all levels, (R, 5)")
+    .Output(1, "rois_fpn<min>", "Proposals of the RoI levels, (R_i, 5)")
+    .Output(2, "rois_idx_restore", "Permutation restoring the rois order");
+
+SHOULD_NOT_DO_GRADIENT(DetectronCollectAndDistributeFpnRpnProposals);
+
+} // namespace caffe2
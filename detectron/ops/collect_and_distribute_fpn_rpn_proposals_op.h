@@ -0,0 +1,61 @@
+/**
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+ */
+
+#ifndef COLLECT_AND_DISTRIBUTE_FPN_RPN_PROPOSALS_OP_H_
+#define COLLECT_AND_DISTRIBUTE_FPN_RPN_PROPOSALS_OP_H_
+
+#include "caffe2/core/context.h"
+#include "caffe2/core/logging.h"
+#include "caffe2/core/operator.h"
+
+namespace caffe2 {
+
+/**
+ * DetectronCollectAndDistributeFpnRpnProposals operator. C++ implementation
+ * of the inference path of the Python op
+ * detectron/ops/collect_and_distribute_fpn_rpn_proposals.py (see
+ * modeling.detector.CollectAndDistributeFpnRpnProposals for the inputs and
+ * outputs). As in the Python op, the RPN_POST_NMS_TOP_N limit applies to each
+ * image of the batch.
+ */
+template <typename T, class Context>
+class DetectronCollectAndDistributeFpnRpnProposalsOp final
+    : public Operator<Context> {
+ public:
+  USE_OPERATOR_CONTEXT_FUNCTIONS;
+
+  DetectronCollectAndDistributeFpnRpnProposalsOp(
+      const OperatorDef& operator_def,
+      Workspace* ws)
+      : Operator<Context>(operator_def, ws),
+        roi_canonical_scale_(OperatorBase::GetSingleArgument<int>(
+            "roi_canonical_scale", 224)),
+        roi_canonical_level_(OperatorBase::GetSingleArgument<int>(
+            "roi_canonical_level", 4)),
+        roi_max_level_(OperatorBase::GetSingleArgument<int>(
+            "roi_max_level", 5)),
+        roi_min_level_(OperatorBase::GetSingleArgument<int>(
+            "roi_min_level", 2)),
+        rpn_post_nms_topN_(OperatorBase::GetSingleArgument<int>(
+            "rpn_post_nms_topN", 2000)) {
+    CAFFE_ENFORCE_GE(roi_max_level_, roi_min_level_);
+  }
+
+  bool RunOnDevice() override;
+
+ protected:
+  int roi_canonical_scale_;
+  int roi_canonical_level_;
+  int roi_max_level_;
+  int roi_min_level_;
+  int rpn_post_nms_topN_;
+};
+
+} // namespace caffe2
+
+#endif // COLLECT_AND_DISTRIBUTE_FPN_RPN_PROPOSALS_OP_H_
@@ -0,0 +1,57 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+
+from detectron.core.config import cfg
+import detectron.modeling.FPN as fpn
+import detectron.utils.blob as blob_utils
+
+
+class DistributeHeadRoisOp(object):
+    def __init__(self, blob_prefix):
+        self._blob_prefix = blob_prefix
+
+    def forward(self, inputs, outputs):
+        """See modeling.fused_net.add_head_rois for inputs/outputs
+        documentation.
+        """
+        # inputs is [bbox_nms]: R x 4 post-NMS detections in the coordinate
+        # space of the network input (i.e., already multiplied by im_scale)
+        boxes = inputs[0].data
+        batch_inds = np.zeros((boxes.shape[0], 1), dtype=np.float32)
+        rois = np.hstack((batch_inds, boxes)).astype(np.float32, copy=False)
+        blobs = {self._blob_prefix: rois}
+        if cfg.FPN.MULTILEVEL_ROIS:
+            lvl_min = cfg.FPN.ROI_MIN_LEVEL
+            lvl_max = cfg.FPN.ROI_MAX_LEVEL
+            lvls = fpn.map_rois_to_fpn_levels(rois[:, 1:5], lvl_min, lvl_max)
+            fpn.add_multilevel_roi_blobs(
+                blobs, self._blob_prefix, rois, lvls, lvl_min, lvl_max
+            )
+        for i, k in enumerate(get_head_rois_blob_names(self._blob_prefix)):
+            blob_utils.py_op_copy_blob(blobs[k], outputs[i])
+
+
+def get_head_rois_blob_names(blob_prefix):
+    """Names of the RoI blobs consumed by a RoI head whose RoI input is named
+    `blob_prefix` (e.g., 'mask_rois'), in the order produced by
+    DistributeHeadRoisOp.
+    """
+    blob_names = [blob_prefix]
+    if cfg.FPN.MULTILEVEL_ROIS:
+        lvl_min = cfg.FPN.ROI_MIN_LEVEL
+        lvl_max = cfg.FPN.ROI_MAX_LEVEL
+        for lvl in range(lvl_min, lvl_max + 1):
+            blob_names += [blob_prefix + '_fpn' + str(lvl)]
+        blob_names += [blob_prefix + '_idx_restore_int32']
+    return blob_names
@@ -163,6 +163,117 @@ class GenerateProposalsOp(object):
         return proposals, scores
 
 
+class GenerateJointFpnProposalsOp(object):
+    """Output the object detection proposals of all the FPN RPN levels at once.
+    Unlike running GenerateProposalsOp on each level, the top scoring anchors
+    are selected jointly over the levels before their bounding-box
+    transformations are applied and NMS is run once for all the levels (as a
+    batched NMS in which proposals of different levels do not suppress each
+    other).
+    """
+
+    def __init__(self, anchors, spatial_scales, train):
+        # Anchors of one grid location of each level
+        self._anchors = anchors
+        self._feat_strides = [1. / sc for sc in spatial_scales]
+        self._train = train
+
+    def forward(self, inputs, outputs):
+        """See modeling.detector.GenerateJointFpnProposals for inputs/outputs
+        documentation.
+        """
+        num_lvls = len(self._anchors)
+        scores = [blob.data for blob in inputs[:num_lvls]]
+        bbox_deltas = [blob.data for blob in inputs[num_lvls:2 * num_lvls]]
+        im_info = inputs[-1].data
+        lvl_rois = [[] for _ in range(num_lvls)]
+        lvl_roi_probs = [[] for _ in range(num_lvls)]
+        for im_i in range(scores[0].shape[0]):
+            im_i_boxes, im_i_probs, im_i_lvls = self.proposals_for_one_image(
+                im_info[im_i, :], [s[im_i] for s in scores],
+                [d[im_i] for d in bbox_deltas]
+            )
+            for lvl_i in range(num_lvls):
+                inds = np.where(im_i_lvls == lvl_i)[0]
+                batch_inds = im_i * np.ones((len(inds), 1), dtype=np.float32)
+                lvl_rois[lvl_i].append(
+                    np.hstack((batch_inds, im_i_boxes[inds, :]))
+                )
+                lvl_roi_probs[lvl_i].append(im_i_probs[inds, :])
+
+        for lvl_i in range(num_lvls):
+            rois = np.concatenate(lvl_rois[lvl_i])
+            roi_probs = np.concatenate(lvl_roi_probs[lvl_i])
+            outputs[lvl_i].reshape(rois.shape)
+            outputs[lvl_i].data[...] = rois
+            outputs[num_lvls + lvl_i].reshape(roi_probs.shape)
+            outputs[num_lvls + lvl_i].data[...] = roi_probs
+
+    def proposals_for_one_image(self, im_info, scores, bbox_deltas):
+        """Proposals of one image given the (A, H, W) scores and (4 * A, H, W)
+        bbox deltas of each level. Returns the proposals sorted by decreasing
+        score, their scores and the index of their level.
+        """
+        cfg_key = 'TRAIN' if self._train else 'TEST'
+        pre_nms_topN = cfg[cfg_key].RPN_JOINT_PRE_NMS_TOP_N
+        post_nms_topN = cfg[cfg_key].RPN_POST_NMS_TOP_N
+        nms_thresh = cfg[cfg_key].RPN_NMS_THRESH
+        min_size = cfg[cfg_key].RPN_MIN_SIZE
+
+        # Sort the anchors of all the levels by score and take the top
+        # pre_nms_topN (scores are kept in their (A, H, W) order to avoid
+        # transposing the inputs)
+        lvl_starts = np.cumsum([0] + [s.size for s in scores])
+        all_scores = np.concatenate([s.ravel() for s in scores])
+        if pre_nms_topN <= 0 or pre_nms_topN >= len(all_scores):
+            order = np.argsort(-all_scores)
+        else:
+            inds = np.argpartition(-all_scores, pre_nms_topN)[:pre_nms_topN]
+            order = inds[np.argsort(-all_scores[inds])]
+        lvls = np.searchsorted(lvl_starts, order, side='right') - 1
+        scores = all_scores[order]
+
+        # Only decode the selected anchors
+        proposals = np.zeros((len(order), 4), dtype=np.float32)
+        for lvl_i in np.unique(lvls):
+            inds = np.where(lvls == lvl_i)[0]
+            A, H, W = bbox_deltas[lvl_i].shape
+            A //= 4
+            anchor_inds, ys, xs = np.unravel_index(
+                order[inds] - lvl_starts[lvl_i], (A, H, W)
+            )
+            shifts = np.vstack((xs, ys, xs, ys)).transpose()
+            anchors = (
+                self._anchors[lvl_i][anchor_inds, :] +
+                shifts * self._feat_strides[lvl_i]
+            )
+            deltas = bbox_deltas[lvl_i].reshape((A, 4, H, W))[
+                anchor_inds, :, ys, xs]
+            proposals[inds, :] = box_utils.bbox_transform(
+                anchors, deltas, (1.0, 1.0, 1.0, 1.0)
+            )
+
+        # Clip proposals to image and remove small ones
+        proposals = box_utils.clip_tiled_boxes(proposals, im_info[:2])
+        keep = _filter_boxes(proposals, min_size, im_info)
+        proposals = proposals[keep, :]
+        scores = scores[keep]
+        lvls = lvls[keep]
+
+        # NMS of all the levels in one call
+        if nms_thresh > 0:
+            keep = box_utils.batched_nms(
+                np.hstack((proposals, scores[:, np.newaxis])), lvls,
+                nms_thresh
+            )
+            if post_nms_topN > 0:
+                keep = keep[:post_nms_topN]
+            proposals = proposals[keep, :]
+            scores = scores[keep]
+            lvls = lvls[keep]
+        return proposals, scores[:, np.newaxis], lvls
+
+
 def _filter_boxes(boxes, min_size, im_info):
     """Only keep boxes with both sides >= min_size and center within the image.
     """
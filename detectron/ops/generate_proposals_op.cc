@@ -0,0 +1,253 @@
+/**
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+ */
+
+#include <algorithm>
+#include <numeric>
+
+#include "generate_proposals_op.h"
+
+namespace caffe2 {
+
+namespace {
+
+// Greedy NMS of boxes sorted by decreasing score (same arithmetic as
+// detectron/utils/cython_nms.pyx). Stops after max_keep boxes are kept if
+// max_keep > 0.
+std::vector<int> NMSSorted(
+    const std::vector<float>& boxes,
+    float thresh,
+    int max_keep) {
+  const int num_boxes = boxes.size() / 4;
+  std::vector<float> areas(num_boxes);
+  for (int i = 0; i < num_boxes; ++i) {
+    const float* b = &boxes[4 * i];
+    areas[i] = (b[2] - b[0] + 1) * (b[3] - b[1] + 1);
+  }
+  std::vector<char> suppressed(num_boxes, 0);
+  std::vector<int> keep;
+  for (int i = 0; i < num_boxes; ++i) {
+    if (suppressed[i]) {
+      continue;
+    }
+    keep.push_back(i);
+    if (max_keep > 0 && keep.size() >= static_cast<size_t>(max_keep)) {
+      break;
+    }
+    const float* bi = &boxes[4 * i];
+    for (int j = i + 1; j < num_boxes; ++j) {
+      if (suppressed[j]) {
+        continue;
+      }
+      const float* bj = &boxes[4 * j];
+      const float w =
+          std::max(0.f, std::min(bi[2], bj[2]) - std::max(bi[0], bj[0]) + 1);
+      const float h =
+          std::max(0.f, std::min(bi[3], bj[3]) - std::max(bi[1], bj[1]) + 1);
+      const float inter = w * h;
+      const float ovr = inter / (areas[i] + areas[j] - inter);
+      if (ovr >= thresh) {
+        suppressed[j] = 1;
+      }
+    }
+  }
+  return keep;
+}
+
+} // namespace
+
+template <>
+void DetectronGenerateProposalsOp<float, CPUContext>::ProposalsForOneImage(
+    const float* im_info,
+    const float* scores,
+    const float* bbox_deltas,
+    int height,
+    int width,
+    std::vector<float>* boxes,
+    std::vector<float>* probs) {
+  const int num_anchors = anchors_.size() / 4;
+  const int num_boxes = height * width * num_anchors;
+  const double feat_stride = 1. / spatial_scale_;
+
+  // Boxes are enumerated in (H, W, A) order (slowest to fastest) while the
+  // scores are (A, H, W) and the bbox deltas (4 * A, H, W)
+  std::vector<float> box_scores(num_boxes);
+  for (int i = 0; i < num_boxes; ++i) {
+    const int a = i % num_anchors;
+    const int hw = i / num_anchors;
+    box_scores[i] = scores[a * height * width + hw];
+  }
+
+  // 4. sort all (proposal, score) pairs by score from highest to lowest
+  // 5. take top pre_nms_topN (e.g. 6000)
+  std::vector<int> order(num_boxes);
+  std::iota(order.begin(), order.end(), 0);
+  auto score_greater = [&box_scores](int i, int j) {
+    return box_scores[i] > box_scores[j];
+  };
+  if (pre_nms_topN_ <= 0 || pre_nms_topN_ >= num_boxes) {
+    std::stable_sort(order.begin(), order.end(), score_greater);
+  } else {
+    std::partial_sort(
+        order.begin(), order.begin() + pre_nms_topN_, order.end(),
+        score_greater);
+    order.resize(pre_nms_topN_);
+  }
+
+  // Transform anchors into proposals via bbox transformations
+  // 2. clip proposals to image
+  // 3. remove predicted boxes with either height or width < min_size
+  const float im_height = im_info[0];
+  const float im_width = im_info[1];
+  const float min_size = min_size_ * im_info[2];
+  std::vector<float> proposals;
+  std::vector<float> proposal_scores;
+  proposals.reserve(4 * order.size());
+  proposal_scores.reserve(order.size());
+  for (int i : order) {
+    const int a = i % num_anchors;
+    const int hw = i / num_anchors;
+    const double shift_x = (hw % width) * feat_stride;
+    const double shift_y = (hw / width) * feat_stride;
+    const float x1 = anchors_[4 * a] + shift_x;
+    const float y1 = anchors_[4 * a + 1] + shift_y;
+    const float x2 = anchors_[4 * a + 2] + shift_x;
+    const float y2 = anchors_[4 * a + 3] + shift_y;
+    const float widths = x2 - x1 + 1.0f;
+    const float heights = y2 - y1 + 1.0f;
+    const float ctr_x = x1 + 0.5f * widths;
+    const float ctr_y = y1 + 0.5f * heights;
+
+    const int delta_stride = height * width;
+    const float* d = bbox_deltas + 4 * a * delta_stride + hw;
+    const float dx = d[0];
+    const float dy = d[delta_stride];
+    const float dw = std::min(d[2 * delta_stride], bbox_xform_clip_);
+    const float dh = std::min(d[3 * delta_stride], bbox_xform_clip_);
+
+    const float pred_ctr_x = dx * widths + ctr_x;
+    const float pred_ctr_y = dy * heights + ctr_y;
+    const float pred_w = std::exp(dw) * widths;
+    const float pred_h = std::exp(dh) * heights;
+
+    float box[4] = {
+        pred_ctr_x - 0.5f * pred_w,
+        pred_ctr_y - 0.5f * pred_h,
+        pred_ctr_x + 0.5f * pred_w - 1,
+        pred_ctr_y + 0.5f * pred_h - 1};
+    for (int k = 0; k < 4; ++k) {
+      const float max_coord = (k % 2 == 0 ? im_width : im_height) - 1;
+      box[k] = std::max(std::min(box[k], max_coord), 0.f);
+    }
+
+    const float ws = box[2] - box[0] + 1;
+    const float hs = box[3] - box[1] + 1;
+    const float x_ctr = box[0] + ws / 2.f;
+    const float y_ctr = box[1] + hs / 2.f;
+    if (ws >= min_size && hs >= min_size && x_ctr < im_width &&
+        y_ctr < im_height) {
+      proposals.insert(proposals.end(), box, box + 4);
+      proposal_scores.push_back(box_scores[i]);
+    }
+  }
+
+  // 6. apply loose nms (e.g. threshold = 0.7)
+  // 7. take after_nms_topN (e.g. 300)
+  // 8. return the top proposals (-> RoIs top)
+  if (nms_thresh_ > 0) {
+    std::vector<int> keep =
+        NMSSorted(proposals, nms_thresh_, std::max(post_nms_topN_, 0));
+    for (int i : keep) {
+      boxes->insert(
+          boxes->end(), proposals.begin() + 4 * i,
+          proposals.begin() + 4 * i + 4);
+      probs->push_back(proposal_scores[i]);
+    }
+  } else {
+    boxes->swap(proposals);
+    probs->swap(proposal_scores);
+  }
+}
+
+template <>
+bool DetectronGenerateProposalsOp<float, CPUContext>::RunOnDevice() {
+  const auto& scores = Input(0);
+  const auto& bbox_deltas = Input(1);
+  const auto& im_info = Input(2);
+  const int num_anchors = anchors_.size() / 4;
+  CAFFE_ENFORCE_EQ(scores.ndim(), 4);
+  CAFFE_ENFORCE_EQ(scores.dim32(1), num_anchors);
+  const int num_images = scores.dim32(0);
+  const int height = scores.dim32(2);
+  const int width = scores.dim32(3);
+  CAFFE_ENFORCE_EQ(bbox_deltas.ndim(), 4);
+  CAFFE_ENFORCE_EQ(bbox_deltas.dim32(0), num_images);
+  CAFFE_ENFORCE_EQ(bbox_deltas.dim32(1), 4 * num_anchors);
+  CAFFE_ENFORCE_EQ(bbox_deltas.dim32(2), height);
+  CAFFE_ENFORCE_EQ(bbox_deltas.dim32(3), width);
+  CAFFE_ENFORCE_EQ(im_info.ndim(), 2);
+  CAFFE_ENFORCE_EQ(im_info.dim32(0), num_images);
+  CAFFE_ENFORCE_EQ(im_info.dim32(1), 3);
+
+  std::vector<float> rois;
+  std::vector<float> roi_probs;
+  const int image_size = num_anchors * height * width;
+  for (int im_i = 0; im_i < num_images; ++im_i) {
+    std::vector<float> boxes;
+    std::vector<float> probs;
+    ProposalsForOneImage(
+        im_info.data<float>() + 3 * im_i,
+        scores.data<float>() + im_i * image_size,
+        bbox_deltas.data<float>() + 4 * im_i * image_size,
+        height,
+        width,
+        &boxes,
+        &probs);
+    for (size_t i = 0; i < probs.size(); ++i) {
+      rois.push_back(im_i);
+      rois.insert(rois.end(), boxes.begin() + 4 * i, boxes.begin() + 4 * i + 4);
+    }
+    roi_probs.insert(roi_probs.end(), probs.begin(), probs.end());
+  }
+
+  auto* rois_out = Output(0);
+  rois_out->Resize(roi_probs.size(), 5);
+  std::copy(rois.begin(), rois.end(), rois_out->mutable_data<float>());
+  if (OutputSize() > 1) {
+    auto* roi_probs_out = Output(1);
+    roi_probs_out->Resize(roi_probs.size(), 1);
+    std::copy(
+        roi_probs.begin(),
+        roi_probs.end(),
+        roi_probs_out->mutable_data<float>());
+  }
+  return true;
+}
+
+REGISTER_CPU_OPERATOR(
+    DetectronGenerateProposals,
+    DetectronGenerateProposalsOp<float, CPUContext>);
+
+OPERATOR_SCHEMA(DetectronGenerateProposals)
+    .NumInputs(3)
+    .NumOutputs(1, 2)
+    .Arg("anchors", "Anchors of one location, (A * 4) floats")
+    .Arg("spatial_scale", "Spatial scale of the inputs (1 / feature stride)")
+    .Arg("pre_nms_topN", "Number of top scoring boxes to keep before NMS")
+    .Arg("post_nms_topN", "Number of top scoring boxes to keep after NMS")
+    .Arg("nms_thresh", "NMS threshold")
+    .Arg("min_size", "Minimum side of the boxes (w.r.t. the original image)")
+    .Arg("bbox_xform_clip", "Maximum value of the width and height deltas")
+    .Input(0, "rpn_cls_probs", "Scores of shape (N, A, H, W)")
+    .Input(1, "rpn_bbox_pred", "Bounding box deltas of shape (N, 4 * A, H, W)")
+    .Input(2, "im_info", "Image info of shape (N, 3) (height, width, scale)")
+    .Output(0, "rpn_rois", "Proposals of shape (R, 5) (batch ind, box)")
+    .Output(1, "rpn_roi_probs", "Scores of the proposals of shape (R, 1)");
+
+SHOULD_NOT_DO_GRADIENT(DetectronGenerateProposals);
+
+} // namespace caffe2
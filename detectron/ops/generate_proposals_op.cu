@@ -0,0 +1,22 @@
+/**
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+ */
+
+#include "caffe2/core/context_gpu.h"
+#include "caffe2/operators/operator_fallback_gpu.h"
+
+#include "generate_proposals_op.h"
+
+namespace caffe2 {
+
+// Runs the CPU implementation, copying the inputs from and the outputs to the
+// GPU, so that the op can be used in nets built under a CUDA device scope
+REGISTER_CUDA_OPERATOR(
+    DetectronGenerateProposals,
+    GPUFallbackOp<DetectronGenerateProposalsOp<float, CPUContext>>);
+
+} // namespace caffe2
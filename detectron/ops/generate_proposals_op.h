@@ -0,0 +1,77 @@
+/**
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+ */
+
+#ifndef GENERATE_PROPOSALS_OP_H_
+#define GENERATE_PROPOSALS_OP_H_
+
+#include <cmath>
+#include <vector>
+
+#include "caffe2/core/context.h"
+#include "caffe2/core/logging.h"
+#include "caffe2/core/operator.h"
+
+namespace caffe2 {
+
+/**
+ * DetectronGenerateProposals operator. C++ implementation of the Python op
+ * detectron/ops/generate_proposals.py (see its documentation and
+ * modeling.detector.GenerateProposals for the inputs and outputs). The
+ * anchors of one grid location and the RPN_* options of the Python op are
+ * given as arguments.
+ */
+template <typename T, class Context>
+class DetectronGenerateProposalsOp final : public Operator<Context> {
+ public:
+  USE_OPERATOR_CONTEXT_FUNCTIONS;
+
+  DetectronGenerateProposalsOp(const OperatorDef& operator_def, Workspace* ws)
+      : Operator<Context>(operator_def, ws),
+        anchors_(OperatorBase::GetRepeatedArgument<float>("anchors")),
+        spatial_scale_(OperatorBase::GetSingleArgument<float>(
+            "spatial_scale", 1. / 16.)),
+        pre_nms_topN_(OperatorBase::GetSingleArgument<int>(
+            "pre_nms_topN", 6000)),
+        post_nms_topN_(OperatorBase::GetSingleArgument<int>(
+            "post_nms_topN", 300)),
+        nms_thresh_(OperatorBase::GetSingleArgument<float>(
+            "nms_thresh", 0.7f)),
+        min_size_(OperatorBase::GetSingleArgument<float>("min_size", 0.)),
+        bbox_xform_clip_(OperatorBase::GetSingleArgument<float>(
+            "bbox_xform_clip", std::log(1000. / 16.))) {
+    CAFFE_ENFORCE_GT(anchors_.size(), 0);
+    CAFFE_ENFORCE_EQ(anchors_.size() % 4, 0);
+    CAFFE_ENFORCE_GT(spatial_scale_, 0);
+  }
+
+  bool RunOnDevice() override;
+
+ protected:
+  // Proposals of one image as (x1, y1, x2, y2) boxes and their scores
+  void ProposalsForOneImage(
+      const T* im_info,
+      const T* scores,
+      const T* bbox_deltas,
+      int height,
+      int width,
+      std::vector<T>* boxes,
+      std::vector<T>* probs);
+
+  // Anchors of one grid location as (x1, y1, x2, y2) boxes
+  std::vector<float> anchors_;
+  float spatial_scale_;
+  int pre_nms_topN_;
+  int post_nms_topN_;
+  float nms_thresh_;
+  float min_size_;
+  float bbox_xform_clip_;
+};
+
+} // namespace caffe2
+
+#endif // GENERATE_PROPOSALS_OP_H_
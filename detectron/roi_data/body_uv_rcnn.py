@@ -53,11 +53,13 @@ def add_body_uv_rcnn_blobs(blobs, sampled_boxes, roidb, im_scale, batch_idx):
         rois_fg.astype(np.float32, copy=False)
         boxes_from_polys.astype(np.float32, copy=False)
         #
-        overlaps_bbfg_bbpolys = box_utils.bbox_overlaps(
+        overlaps_bbfg_bbpolys = box_utils.sparse_bbox_overlaps(
             rois_fg.astype(np.float32, copy=False),
             boxes_from_polys.astype(np.float32, copy=False))
-        fg_polys_value = np.max(overlaps_bbfg_bbpolys, axis=1)
+        fg_polys_value = overlaps_bbfg_bbpolys.max_overlaps
         fg_inds = fg_inds[fg_polys_value>0.7]
+        # Index of the mask with highest overlap for each remaining fg roi
+        fg_polys_inds = overlaps_bbfg_bbpolys.argmax[fg_polys_value>0.7]
 
     if (bool(boxes_from_polys.any()) & (fg_inds.shape[0] > 0) ):
         for jj in fg_inds:
@@ -78,10 +80,6 @@ def add_body_uv_rcnn_blobs(blobs, sampled_boxes, roidb, im_scale, batch_idx):
         #################################################
 
         rois_fg = sampled_boxes[fg_inds]
-        overlaps_bbfg_bbpolys = box_utils.bbox_overlaps(
-            rois_fg.astype(np.float32, copy=False),
-            boxes_from_polys.astype(np.float32, copy=False))
-        fg_polys_inds = np.argmax(overlaps_bbfg_bbpolys, axis=1)
 
         for i in range(rois_fg.shape[0]):
             #
@@ -14,6 +14,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from collections import namedtuple
+from collections import OrderedDict
 import logging
 import numpy as np
 import threading
@@ -38,6 +39,13 @@ FieldOfAnchors = namedtuple(
 # Cache for memoizing _get_field_of_anchors
 _threadlocal_foa = threading.local()
 
+# Cache for memoizing get_inds_inside_field_of_anchors, shared by all threads.
+# Holds the indices of at most _INDS_INSIDE_CACHE_SIZE (field of anchors, image
+# size) pairs; the oldest entry is evicted first.
+_inds_inside_cache = OrderedDict()
+_inds_inside_lock = threading.Lock()
+_INDS_INSIDE_CACHE_SIZE = 1024
+
 
 def get_field_of_anchors(
     stride, anchor_sizes, anchor_aspect_ratios, octave=None, aspect=None
@@ -93,6 +101,36 @@ def get_field_of_anchors(
     return foa
 
 
+def get_inds_inside_field_of_anchors(foa, im_height, im_width, straddle_thresh):
+    """Indices of the anchors of a field of anchors that are inside an image of
+    size (im_height, im_width) by a margin of straddle_thresh. The returned
+    array is shared and must not be modified.
+    """
+    A = foa.num_cell_anchors
+    cache_key = (
+        foa.stride, foa.field_size, foa.field_of_anchors[:A].tobytes(),
+        im_height, im_width, straddle_thresh
+    )
+    with _inds_inside_lock:
+        inds_inside = _inds_inside_cache.get(cache_key)
+    if inds_inside is not None:
+        return inds_inside
+
+    anchors = foa.field_of_anchors
+    inds_inside = np.where(
+        (anchors[:, 0] >= -straddle_thresh) &
+        (anchors[:, 1] >= -straddle_thresh) &
+        (anchors[:, 2] < im_width + straddle_thresh) &
+        (anchors[:, 3] < im_height + straddle_thresh)
+    )[0].astype(np.int32)
+    inds_inside.flags.writeable = False
+    with _inds_inside_lock:
+        if len(_inds_inside_cache) >= _INDS_INSIDE_CACHE_SIZE:
+            _inds_inside_cache.popitem(last=False)
+        _inds_inside_cache[cache_key] = inds_inside
+    return inds_inside
+
+
 def unmap(data, count, inds, fill=0):
     """Unmap a subset of item (data) back to the original set of items (of
     size count)"""
@@ -23,6 +23,7 @@ from detectron.core.config import cfg
 import detectron.modeling.FPN as fpn
 import detectron.roi_data.keypoint_rcnn as keypoint_rcnn_roi_data
 import detectron.roi_data.mask_rcnn as mask_rcnn_roi_data
+import detectron.roi_data.profiler as profiler
 import detectron.roi_data.body_uv_rcnn as body_uv_rcnn_roi_data
 import detectron.utils.blob as blob_utils
 import detectron.utils.boxes as box_utils
@@ -125,7 +126,8 @@ def add_fast_rcnn_blobs(blobs, im_scales, roidb):
     """Add blobs needed for training Fast R-CNN style models."""
     # Sample training RoIs from each image and append them to the blob lists
     for im_i, entry in enumerate(roidb):
-        frcn_blobs = _sample_rois(entry, im_scales[im_i], im_i)
+        with profiler.timed('fast_rcnn_sampling'):
+            frcn_blobs = _sample_rois(entry, im_scales[im_i], im_i)
         for k, v in frcn_blobs.items():
             blobs[k].append(v)
     # Concat the training blob lists into tensors
@@ -209,21 +211,25 @@ def _sample_rois(roidb, im_scale, batch_idx):
 
     # Optionally add Mask R-CNN blobs
     if cfg.MODEL.MASK_ON:
-        mask_rcnn_roi_data.add_mask_rcnn_blobs(
-            blob_dict, sampled_boxes, roidb, im_scale, batch_idx
-        )
+        with profiler.timed('mask_targets'):
+            mask_rcnn_roi_data.add_mask_rcnn_blobs(
+                blob_dict, sampled_boxes, roidb, im_scale, batch_idx
+            )
 
     # Optionally add Keypoint R-CNN blobs
     if cfg.MODEL.KEYPOINTS_ON:
-        keypoint_rcnn_roi_data.add_keypoint_rcnn_blobs(
-            blob_dict, roidb, fg_rois_per_image, fg_inds, im_scale, batch_idx
-        )
+        with profiler.timed('keypoint_targets'):
+            keypoint_rcnn_roi_data.add_keypoint_rcnn_blobs(
+                blob_dict, roidb, fg_rois_per_image, fg_inds, im_scale,
+                batch_idx
+            )
 
     # Optionally body UV R-CNN blobs
     if cfg.MODEL.BODY_UV_ON:
-        body_uv_rcnn_roi_data.add_body_uv_rcnn_blobs(
-            blob_dict, sampled_boxes, roidb, im_scale, batch_idx
-        )
+        with profiler.timed('body_uv_targets'):
+            body_uv_rcnn_roi_data.add_body_uv_rcnn_blobs(
+                blob_dict, sampled_boxes, roidb, im_scale, batch_idx
+            )
 
     return blob_dict
 
@@ -0,0 +1,225 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Cache of the training images pre-resized to the training scales (see
+cfg.TRAIN.IMAGE_CACHE).
+
+The first time an image is read, it is decoded, resized to the largest of
+cfg.TRAIN.SCALES (or to each of them with cfg.TRAIN.IMAGE_CACHE.PER_SCALE) and
+written to local disk in a format that is fast to read. The most recently used
+decoded images are also kept in memory. A cached image is then resized to the
+scale sampled for a minibatch. Scales are always relative to the original
+image, whose shape is taken from the 'height' and 'width' of its roidb entry
+(the ground-truth boxes are in these coordinates).
+
+Entries are stored in one file per image and cached size, named after a hash
+of the image path, size and modification time, so that images that change are
+cached again. Entries are never evicted from disk.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import cv2
+import hashlib
+import logging
+import numpy as np
+import os
+import threading
+
+from detectron.core.config import cfg
+import detectron.utils.blob as blob_utils
+
+logger = logging.getLogger(__name__)
+
+_FORMATS = ('npy', 'jpg')
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+class ImageCache(object):
+    """Thread safe cache of the images of the roidb entries resized to the
+    training scales.
+    """
+
+    def __init__(
+        self, cache_dir, scales, max_size, per_scale=False, fmt='npy',
+        jpeg_quality=95, memory_size=0
+    ):
+        assert fmt in _FORMATS, \
+            'Unknown image cache format: {}'.format(fmt)
+        self._dir = cache_dir
+        self._scales = sorted(scales)
+        self._max_size = max_size
+        self._per_scale = per_scale
+        self._format = fmt
+        self._jpeg_quality = jpeg_quality
+        self._max_memory_size = memory_size
+        # Decoded images by (image file, cached size), least recently used first
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(self._dir)
+        except OSError:
+            # Already created (possibly by another process)
+            assert os.path.isdir(self._dir), self._dir
+
+    def get_scaled_image(self, entry, target_size):
+        """Return the image of a roidb entry (not flipped) rescaled to
+        target_size, capped at the maximum size, as a uint8 BGR image, and the
+        scale factor relative to the original image (see
+        utils.blob.prep_im_for_blob).
+        """
+        orig_shape = (entry['height'], entry['width'])
+        im_scale = blob_utils.get_target_scale(
+            orig_shape, target_size, self._max_size
+        )
+        cache_size = target_size if self._per_scale else self._scales[-1]
+        im = self._get(entry['image'], orig_shape, cache_size)
+        height, width = _get_scaled_shape(orig_shape, im_scale)
+        if im.shape[:2] != (height, width):
+            # Resize to the shape of the original image rescaled by im_scale
+            im = cv2.resize(
+                im, (width, height), interpolation=cv2.INTER_LINEAR
+            )
+        return im, im_scale
+
+    def _get(self, image_file, orig_shape, cache_size):
+        memory_key = (image_file, cache_size)
+        with self._lock:
+            im = self._memory.pop(memory_key, None)
+            if im is not None:
+                # Mark as recently used
+                self._memory[memory_key] = im
+                return im
+        file_name = self._get_file_name(image_file, orig_shape, cache_size)
+        im = self._read(file_name)
+        if im is None:
+            im = self._add(image_file, orig_shape, cache_size)
+        im.flags.writeable = False
+        self._add_to_memory(memory_key, im)
+        return im
+
+    def _add(self, image_file, orig_shape, cache_size):
+        """Decode an image and add it to the cache on disk at the sizes that
+        are cached. Returns the image resized to cache_size.
+        """
+        im = cv2.imread(image_file)
+        assert im is not None, \
+            'Failed to read image \'{}\''.format(image_file)
+        assert im.shape[:2] == orig_shape, \
+            'Image \'{}\' does not have the size of its roidb entry'.format(
+                image_file
+            )
+        cache_sizes = self._scales if self._per_scale else [cache_size]
+        cached_im = None
+        for size in cache_sizes:
+            # Same as prep_im_for_blob (but in uint8)
+            im_scale = blob_utils.get_target_scale(
+                orig_shape, size, self._max_size
+            )
+            resized_im = cv2.resize(
+                im,
+                None,
+                None,
+                fx=im_scale,
+                fy=im_scale,
+                interpolation=cv2.INTER_LINEAR
+            )
+            self._write(
+                self._get_file_name(image_file, orig_shape, size), resized_im
+            )
+            if size == cache_size:
+                cached_im = resized_im
+        return cached_im
+
+    def _add_to_memory(self, memory_key, im):
+        with self._lock:
+            if memory_key in self._memory:
+                return
+            self._memory[memory_key] = im
+            self._memory_size += im.nbytes
+            while self._memory_size > self._max_memory_size:
+                _, evicted_im = self._memory.popitem(last=False)
+                self._memory_size -= evicted_im.nbytes
+
+    def _get_file_name(self, image_file, orig_shape, cache_size):
+        st = os.stat(image_file)
+        key = '{} {} {}'.format(image_file, st.st_size, st.st_mtime)
+        im_scale = blob_utils.get_target_scale(
+            orig_shape, cache_size, self._max_size
+        )
+        height, width = _get_scaled_shape(orig_shape, im_scale)
+        return os.path.join(
+            self._dir, '{}_{}x{}.{}'.format(
+                hashlib.sha1(key.encode('utf-8')).hexdigest(), height, width,
+                self._format
+            )
+        )
+
+    def _read(self, file_name):
+        """Return a cached image or None if it is not cached."""
+        if self._format == 'jpg':
+            # None if the file does not exist or is corrupted
+            return cv2.imread(file_name)
+        try:
+            return np.load(file_name)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write(self, file_name, im):
+        # Write to a temporary file first so that concurrent readers never see
+        # a partial entry
+        tmp_file_name = '{}.{}.{}.tmp'.format(
+            file_name, os.getpid(), threading.current_thread().ident
+        )
+        with open(tmp_file_name, 'wb') as f:
+            if self._format == 'npy':
+                np.save(f, im)
+            else:
+                f.write(cv2.imencode(
+                    '.jpg', im, [cv2.IMWRITE_JPEG_QUALITY, self._jpeg_quality]
+                )[1])
+        os.rename(tmp_file_name, file_name)
+
+
+def get_image_cache():
+    """Return the image cache of this process or None if
+    cfg.TRAIN.IMAGE_CACHE.ENABLED is False.
+    """
+    global _image_cache
+    if not cfg.TRAIN.IMAGE_CACHE.ENABLED:
+        return None
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache(
+                cfg.TRAIN.IMAGE_CACHE.DIR,
+                cfg.TRAIN.SCALES,
+                cfg.TRAIN.MAX_SIZE,
+                per_scale=cfg.TRAIN.IMAGE_CACHE.PER_SCALE,
+                fmt=cfg.TRAIN.IMAGE_CACHE.FORMAT,
+                jpeg_quality=cfg.TRAIN.IMAGE_CACHE.JPEG_QUALITY,
+                memory_size=int(
+                    cfg.TRAIN.IMAGE_CACHE.MEMORY_SIZE_GB * 1024**3
+                )
+            )
+            logger.info('Image cache: {}'.format(cfg.TRAIN.IMAGE_CACHE.DIR))
+    return _image_cache
+
+
+def _get_scaled_shape(im_shape, im_scale):
+    """Shape of an image of shape im_shape rescaled by im_scale by cv2.resize.
+    """
+    return (
+        int(np.round(im_shape[0] * im_scale)),
+        int(np.round(im_shape[1] * im_scale))
+    )
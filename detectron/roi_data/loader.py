@@ -32,7 +32,6 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from collections import deque
 from collections import OrderedDict
 import logging
 import numpy as np
@@ -45,11 +44,14 @@ import uuid
 from caffe2.python import core, workspace
 
 from detectron.core.config import cfg
+from detectron.roi_data.loader_controller import LoaderController
 from detectron.roi_data.minibatch import get_minibatch
 from detectron.roi_data.minibatch import get_minibatch_blob_names
+from detectron.roi_data.sampler import RoidbSampler
 from detectron.utils.coordinator import coordinated_get
 from detectron.utils.coordinator import coordinated_put
 from detectron.utils.coordinator import Coordinator
+import detectron.roi_data.profiler as profiler
 import detectron.utils.c2 as c2_utils
 
 logger = logging.getLogger(__name__)
@@ -61,17 +63,25 @@ class RoIDataLoader(object):
         roidb,
         num_loaders=4,
         minibatch_queue_size=64,
-        blobs_queue_capacity=8
+        blobs_queue_capacity=8,
+        adaptive=False
     ):
         self._roidb = roidb
-        self._lock = threading.Lock()
-        self._perm = deque(range(len(self._roidb)))
-        self._cur = 0  # _perm cursor
+        self._sampler = RoidbSampler(
+            roidb, cfg.TRAIN.IMS_PER_BATCH, cfg.RNG_SEED,
+            cfg.TRAIN.ASPECT_GROUPING, cfg.TRAIN.ASPECT_BUCKETS
+        )
         # The minibatch queue holds prepared training data in host (CPU) memory
         # When training with N > 1 GPUs, each element in the minibatch queue
         # is actually a partial minibatch which contributes 1 / N of the
         # examples to the overall minibatch
         self._minibatch_queue = Queue.Queue(maxsize=minibatch_queue_size)
+        # Number of minibatches the loader threads fill the queue up to (the
+        # adaptation thread may lower it below the queue maxsize, which stays
+        # fixed: on Python 2, Queue.put does not block if a lowered maxsize is
+        # already exceeded)
+        self._minibatch_queue_size = minibatch_queue_size
+        self._minibatch_queue_size_cond = threading.Condition()
         self._blobs_queue_capacity = blobs_queue_capacity
         # Random queue name in case one instantiates multple RoIDataLoaders
         self._loader_id = uuid.uuid4()
@@ -81,15 +91,30 @@ class RoIDataLoader(object):
         self._num_loaders = num_loaders
         self._num_gpus = cfg.NUM_GPUS
         self.coordinator = Coordinator()
+        # Adapts the number of loader threads and the minibatch queue size
+        self._controller = None
+        if adaptive:
+            self._controller = LoaderController(
+                num_loaders, minibatch_queue_size,
+                min(cfg.DATA_LOADER.MIN_THREADS, num_loaders),
+                max(cfg.DATA_LOADER.MAX_THREADS, num_loaders),
+                min(cfg.DATA_LOADER.MIN_MINIBATCH_QUEUE_SIZE,
+                    minibatch_queue_size),
+                minibatch_queue_size
+            )
+        # Loader thread of each loader id (None once it has exited)
+        self._loader_threads = []
+        self._loader_threads_lock = threading.Lock()
 
         self._output_names = get_minibatch_blob_names()
-        self._shuffle_roidb_inds()
         self.create_threads()
 
-    def minibatch_loader_thread(self):
+    def minibatch_loader_thread(self, loader_id):
         """Load mini-batches and put them onto the mini-batch queue."""
         with self.coordinator.stop_on_exception():
             while not self.coordinator.should_stop():
+                if self._should_exit_loader(loader_id):
+                    return
                 blobs = self.get_next_minibatch()
                 # Blobs must be queued in the order specified by
                 # self.get_output_names
@@ -99,9 +124,8 @@ class RoIDataLoader(object):
                         'Blob {} of dtype {} must have dtype of ' \
                         'np.int32 or np.float32'.format(key, blobs[key].dtype)
                     ordered_blobs[key] = blobs[key]
-                coordinated_put(
-                    self.coordinator, self._minibatch_queue, ordered_blobs
-                )
+                with profiler.timed('queue_put_wait'):
+                    self._put_minibatch(ordered_blobs)
         logger.info('Stopping mini-batch loading thread')
 
     def enqueue_blobs_thread(self, gpu_id, blob_names):
@@ -110,61 +134,77 @@ class RoIDataLoader(object):
             while not self.coordinator.should_stop():
                 if self._minibatch_queue.qsize == 0:
                     logger.warning('Mini-batch queue is empty')
-                blobs = coordinated_get(self.coordinator, self._minibatch_queue)
-                self.enqueue_blobs(gpu_id, blob_names, blobs.values())
+                if self._controller is not None:
+                    # Minibatches above a lowered queue size are draining
+                    self._controller.record_get(
+                        min(
+                            self._minibatch_queue.qsize(),
+                            self._minibatch_queue_size
+                        )
+                    )
+                with profiler.timed('queue_get_wait'):
+                    blobs = coordinated_get(
+                        self.coordinator, self._minibatch_queue
+                    )
+                with self._minibatch_queue_size_cond:
+                    self._minibatch_queue_size_cond.notify()
+                with profiler.timed('enqueue_blobs'):
+                    self.enqueue_blobs(gpu_id, blob_names, blobs.values())
                 logger.debug(
                     'batch queue size {}'.format(self._minibatch_queue.qsize())
                 )
             logger.info('Stopping enqueue thread')
 
+    def _put_minibatch(self, blobs):
+        """Put a minibatch on the minibatch queue once it holds fewer than
+        self._minibatch_queue_size minibatches.
+        """
+        with self._minibatch_queue_size_cond:
+            while self._minibatch_queue.qsize() >= self._minibatch_queue_size:
+                if self.coordinator.should_stop():
+                    raise Exception('Coordinator stopped during put()')
+                self._minibatch_queue_size_cond.wait(1.0)
+            # Does not block: only the loader threads put, under the lock
+            coordinated_put(self.coordinator, self._minibatch_queue, blobs)
+
     def get_next_minibatch(self):
         """Return the blobs to be used for the next minibatch. Thread safe."""
+        t = time.time()
         valid = False
         while not valid:
-            db_inds = self._get_next_minibatch_inds()
+            batch, db_inds = self._sampler.next_batch()
             minibatch_db = [self._roidb[i] for i in db_inds]
-            blobs, valid = get_minibatch(minibatch_db)
+            with profiler.timed('minibatch'):
+                blobs, valid = get_minibatch(minibatch_db)
+            if not valid:
+                self._sampler.set_invalid(batch)
+        if self._controller is not None:
+            self._controller.record_minibatch(time.time() - t)
         return blobs
 
-    def _shuffle_roidb_inds(self):
-        """Randomly permute the training roidb. Not thread safe."""
-        if cfg.TRAIN.ASPECT_GROUPING:
-            widths = np.array([r['width'] for r in self._roidb])
-            heights = np.array([r['height'] for r in self._roidb])
-            horz = (widths >= heights)
-            vert = np.logical_not(horz)
-            horz_inds = np.where(horz)[0]
-            vert_inds = np.where(vert)[0]
-
-            horz_inds = np.random.permutation(horz_inds)
-            vert_inds = np.random.permutation(vert_inds)
-            mb = cfg.TRAIN.IMS_PER_BATCH
-            horz_inds = horz_inds[:(len(horz_inds) // mb) * mb]
-            vert_inds = vert_inds[:(len(vert_inds) // mb) * mb]
-            inds = np.hstack((horz_inds, vert_inds))
-
-            inds = np.reshape(inds, (-1, mb))
-            row_perm = np.random.permutation(np.arange(inds.shape[0]))
-            inds = np.reshape(inds[row_perm, :], (-1, ))
-            self._perm = inds
-        else:
-            self._perm = np.random.permutation(np.arange(len(self._roidb)))
-        self._perm = deque(self._perm)
-        self._cur = 0
-
-    def _get_next_minibatch_inds(self):
-        """Return the roidb indices for the next minibatch. Thread safe."""
-        with self._lock:
-            # We use a deque and always take the *first* IMS_PER_BATCH items
-            # followed by *rotating* the deque so that we see fresh items
-            # each time. If the length of _perm is not divisible by
-            # IMS_PER_BATCH, then we end up wrapping around the permutation.
-            db_inds = [self._perm[i] for i in range(cfg.TRAIN.IMS_PER_BATCH)]
-            self._perm.rotate(-cfg.TRAIN.IMS_PER_BATCH)
-            self._cur += cfg.TRAIN.IMS_PER_BATCH
-            if self._cur >= len(self._perm):
-                self._shuffle_roidb_inds()
-        return db_inds
+    def get_sampler_state(self, num_iters):
+        """State of the minibatch sampler after `num_iters` training iterations
+        (see roi_data.sampler), e.g., to save it with a checkpoint.
+        """
+        return self._sampler.get_state(num_iters * self._num_gpus)
+
+    def set_sampler_state(self, state=None, num_iters=0):
+        """Resume the minibatch sampler from a state saved by get_sampler_state,
+        or after `num_iters` training iterations if the state is None or was
+        saved with another roidb or other options. Not thread safe: must be
+        called before the loader threads are started.
+        """
+        if state is None or not self._sampler.is_compatible(state):
+            if state is not None:
+                logger.warning(
+                    'Ignoring the saved data loader state (different roidb '
+                    'or options)'
+                )
+            state = self._sampler.get_state(num_iters * self._num_gpus)
+        self._sampler.set_state(state)
+        logger.info(
+            'Data loader resumed at minibatch {}'.format(state['next_batch'])
+        )
 
     def get_output_names(self):
         return self._output_names
@@ -194,13 +234,72 @@ class RoIDataLoader(object):
             format(gpu_id, time.time() - t)
         )
 
+    def adapt_thread(self):
+        """Periodically adapt the number of loader threads and the minibatch
+        queue size (see roi_data.loader_controller).
+        """
+        period = cfg.DATA_LOADER.ADAPT_PERIOD
+        with self.coordinator.stop_on_exception():
+            t = time.time()
+            while not self.coordinator.wait_for_stop(period):
+                now = time.time()
+                num_loaders, queue_size, reason = self._controller.update(
+                    now - t
+                )
+                t = now
+                if reason is None:
+                    continue
+                logger.info(
+                    'Data loader: {:d} -> {:d} loader threads, minibatch '
+                    'queue size {:d} -> {:d} ({})'.format(
+                        self._num_loaders, num_loaders,
+                        self._minibatch_queue_size, queue_size, reason
+                    )
+                )
+                self._set_minibatch_queue_size(queue_size)
+                self._set_num_loaders(num_loaders)
+        logger.info('Stopping data loader adaptation thread')
+
+    def _set_num_loaders(self, num_loaders):
+        """Start or stop loader threads; stopped threads exit after their
+        current minibatch.
+        """
+        with self._loader_threads_lock:
+            self._num_loaders = num_loaders
+            for loader_id in range(num_loaders):
+                if loader_id == len(self._loader_threads):
+                    self._loader_threads.append(None)
+                if self._loader_threads[loader_id] is None:
+                    w = threading.Thread(
+                        target=self.minibatch_loader_thread, args=(loader_id, )
+                    )
+                    self._loader_threads[loader_id] = w
+                    self._workers.append(w)
+                    w.start()
+
+    def _should_exit_loader(self, loader_id):
+        with self._loader_threads_lock:
+            if loader_id < self._num_loaders:
+                return False
+            self._loader_threads[loader_id] = None
+            return True
+
+    def _set_minibatch_queue_size(self, queue_size):
+        # Minibatches above a smaller size stay in the queue; loader threads
+        # wait until they are dequeued
+        assert queue_size <= self._minibatch_queue.maxsize
+        with self._minibatch_queue_size_cond:
+            self._minibatch_queue_size = queue_size
+            self._minibatch_queue_size_cond.notify_all()
+
     def create_threads(self):
         # Create mini-batch loader threads, each of which builds mini-batches
         # and places them into a queue in CPU memory
         self._workers = [
-            threading.Thread(target=self.minibatch_loader_thread)
-            for _ in range(self._num_loaders)
+            threading.Thread(target=self.minibatch_loader_thread, args=(i, ))
+            for i in range(self._num_loaders)
         ]
+        self._loader_threads = list(self._workers)
 
         # Create one BlobsQueue per GPU
         # (enqueue_blob_names are unscoped)
@@ -213,17 +312,21 @@ class RoIDataLoader(object):
                 args=(gpu_id, enqueue_blob_names)
             ) for gpu_id in range(self._num_gpus)
         ]
+        # Create the adaptation thread, if enabled
+        self._adapters = []
+        if self._controller is not None:
+            self._adapters.append(threading.Thread(target=self.adapt_thread))
 
     def start(self, prefill=False):
-        for w in self._workers + self._enqueuers:
+        for w in self._workers + self._enqueuers + self._adapters:
             w.start()
         if prefill:
             logger.info('Pre-filling mini-batch queue...')
-            while not self._minibatch_queue.full():
+            while self._minibatch_queue.qsize() < self._minibatch_queue_size:
                 logger.info(
                     '  [{:d}/{:d}]'.format(
                         self._minibatch_queue.qsize(),
-                        self._minibatch_queue.maxsize
+                        self._minibatch_queue_size
                     )
                 )
                 time.sleep(0.1)
@@ -236,7 +339,7 @@ class RoIDataLoader(object):
         self.coordinator.request_stop()
         self.coordinator.wait_for_stop()
         self.close_blobs_queues()
-        for w in self._workers + self._enqueuers:
+        for w in self._workers + self._enqueuers + self._adapters:
             w.join()
 
     def create_blobs_queues(self):
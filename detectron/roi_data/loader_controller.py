@@ -0,0 +1,139 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Controller of the number of loader threads and of the size of the minibatch
+queue of a RoIDataLoader (see cfg.DATA_LOADER.ADAPTIVE).
+
+The data loader records the occupancy of the minibatch queue each time an
+enqueue thread dequeues a minibatch, and the time the loader threads take to
+build each minibatch. Every period, the controller changes one of the two
+settings (or none), within their bounds:
+
+  - the queue ran empty (training waited for data): a loader thread is added
+    if the queue was mostly empty (the loaders are too slow), otherwise the
+    queue size is doubled (the loaders keep up on average but not with the
+    bursts of slow minibatches)
+  - the queue stayed mostly full (the loaders are ahead of training): a loader
+    thread is removed if the others can still build minibatches 25% faster
+    than they are consumed, otherwise the queue size is halved to hold fewer
+    prepared minibatches in memory
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+
+# Mean occupancy of the minibatch queue under which it is mostly empty and over
+# which it is mostly full
+_LOW_OCCUPANCY = 0.5
+_HIGH_OCCUPANCY = 0.75
+
+# Margin by which the loader threads left must be faster than training for a
+# loader thread to be removed
+_SPEED_MARGIN = 1.25
+
+
+class LoaderController(object):
+    """Thread safe controller of the data loader settings."""
+
+    def __init__(
+        self, num_threads, queue_size, min_threads, max_threads,
+        min_queue_size, max_queue_size
+    ):
+        assert min_threads <= num_threads <= max_threads
+        assert min_queue_size <= queue_size <= max_queue_size
+        self.num_threads = num_threads
+        self.queue_size = queue_size
+        self._min_threads = min_threads
+        self._max_threads = max_threads
+        self._min_queue_size = min_queue_size
+        self._max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        # Mean time to build a minibatch in the last period in which a
+        # minibatch was built (loader threads blocked on a full queue may not
+        # build any during a period)
+        self._minibatch_time = None
+        self._reset()
+
+    def record_get(self, qsize):
+        """Record that a minibatch is dequeued from a queue of size qsize."""
+        with self._lock:
+            self._num_gets += 1
+            self._num_empty_gets += int(qsize == 0)
+            self._qsize_sum += qsize
+
+    def record_minibatch(self, seconds):
+        """Record that a loader thread took `seconds` to build a minibatch."""
+        with self._lock:
+            self._num_minibatches += 1
+            self._minibatch_time_sum += seconds
+
+    def update(self, elapsed):
+        """Decide the settings given what was recorded in the last `elapsed`
+        seconds. Returns the number of loader threads, the queue size and the
+        reason of the change (None if they did not change).
+        """
+        with self._lock:
+            num_gets = self._num_gets
+            num_empty_gets = self._num_empty_gets
+            qsize_sum = self._qsize_sum
+            if self._num_minibatches > 0:
+                self._minibatch_time = \
+                    self._minibatch_time_sum / self._num_minibatches
+            self._reset()
+        if num_gets == 0 or elapsed <= 0:
+            # Training is not consuming minibatches (e.g., checkpointing)
+            return self.num_threads, self.queue_size, None
+        occupancy = qsize_sum / num_gets / self.queue_size
+        dequeue_rate = num_gets / elapsed
+        reason = None
+        if num_empty_gets > 0:
+            starved = 'the minibatch queue was empty for {:.0%} of the ' \
+                'dequeues (mean occupancy {:.0%})'.format(
+                    num_empty_gets / num_gets, occupancy
+                )
+            if occupancy < _LOW_OCCUPANCY and \
+                    self.num_threads < self._max_threads:
+                self.num_threads += 1
+                reason = starved
+            elif self.queue_size < self._max_queue_size:
+                self.queue_size = min(
+                    2 * self.queue_size, self._max_queue_size
+                )
+                reason = starved
+            elif self.num_threads < self._max_threads:
+                self.num_threads += 1
+                reason = starved
+        elif occupancy > _HIGH_OCCUPANCY:
+            # Minibatches that the remaining loader threads can build per second
+            rate = 0.
+            if self._minibatch_time:
+                rate = (self.num_threads - 1) / self._minibatch_time
+            if self.num_threads > self._min_threads and \
+                    rate > _SPEED_MARGIN * dequeue_rate:
+                self.num_threads -= 1
+                reason = 'loaders ahead of training: {:.1f} minibatches/s ' \
+                    'consumed, {:d} threads build {:.1f}/s'.format(
+                        dequeue_rate, self.num_threads, rate
+                    )
+            elif self.queue_size > self._min_queue_size:
+                self.queue_size = max(
+                    self.queue_size // 2, self._min_queue_size
+                )
+                reason = 'the minibatch queue stayed full (mean ' \
+                    'occupancy {:.0%})'.format(occupancy)
+        return self.num_threads, self.queue_size, reason
+
+    def _reset(self):
+        self._num_gets = 0
+        self._num_empty_gets = 0
+        self._qsize_sum = 0
+        self._num_minibatches = 0
+        self._minibatch_time_sum = 0.
@@ -48,13 +48,13 @@ def add_mask_rcnn_blobs(blobs, sampled_boxes, roidb, im_scale, batch_idx):
         # Find overlap between all foreground rois and the bounding boxes
         # enclosing each segmentation
         rois_fg = sampled_boxes[fg_inds]
-        overlaps_bbfg_bbpolys = box_utils.bbox_overlaps(
+        overlaps_bbfg_bbpolys = box_utils.sparse_bbox_overlaps(
             rois_fg.astype(np.float32, copy=False),
             boxes_from_polys.astype(np.float32, copy=False)
         )
         # Map from each fg rois to the index of the mask with highest overlap
         # (measured by bbox overlap)
-        fg_polys_inds = np.argmax(overlaps_bbfg_bbpolys, axis=1)
+        fg_polys_inds = overlaps_bbfg_bbpolys.argmax
 
         # add fg targets
         for i in range(rois_fg.shape[0]):
@@ -25,7 +25,10 @@ import logging
 import numpy as np
 
 from detectron.core.config import cfg
+import detectron.datasets.roidb as roidb_utils
 import detectron.roi_data.fast_rcnn as fast_rcnn_roi_data
+import detectron.roi_data.image_cache as image_cache_utils
+import detectron.roi_data.profiler as profiler
 import detectron.roi_data.retinanet as retinanet_roi_data
 import detectron.roi_data.rpn as rpn_roi_data
 import detectron.utils.blob as blob_utils
@@ -58,20 +61,24 @@ def get_minibatch(roidb):
     # We collect blobs from each image onto a list and then concat them into a
     # single tensor, hence we initialize each blob to an empty list
     blobs = {k: [] for k in get_minibatch_blob_names()}
+    # Flip the entries that are flipped on demand (cfg.TRAIN.FLIP_ON_DEMAND)
+    roidb = [roidb_utils.get_minibatch_entry(entry) for entry in roidb]
     # Get the input image blob, formatted for caffe2
     im_blob, im_scales = _get_image_blob(roidb)
     blobs['data'] = im_blob
     if cfg.RPN.RPN_ON:
         # RPN-only or end-to-end Faster/Mask R-CNN
-        valid = rpn_roi_data.add_rpn_blobs(blobs, im_scales, roidb)
+        with profiler.timed('rpn_targets'):
+            valid = rpn_roi_data.add_rpn_blobs(blobs, im_scales, roidb)
     elif cfg.RETINANET.RETINANET_ON:
         im_width, im_height = im_blob.shape[3], im_blob.shape[2]
         # im_width, im_height corresponds to the network input: padded image
         # (if needed) width and height. We pass it as input and slice the data
         # accordingly so that we don't need to use SampleAsOp
-        valid = retinanet_roi_data.add_retinanet_blobs(
-            blobs, im_scales, roidb, im_width, im_height
-        )
+        with profiler.timed('retinanet_targets'):
+            valid = retinanet_roi_data.add_retinanet_blobs(
+                blobs, im_scales, roidb, im_width, im_height
+            )
     else:
         # Fast R-CNN like models trained on precomputed proposals
         valid = fast_rcnn_roi_data.add_fast_rcnn_blobs(blobs, im_scales, roidb)
@@ -87,22 +94,35 @@ def _get_image_blob(roidb):
     scale_inds = np.random.randint(
         0, high=len(cfg.TRAIN.SCALES), size=num_images
     )
+    image_cache = image_cache_utils.get_image_cache()
     processed_ims = []
     im_scales = []
     for i in range(num_images):
-        im = cv2.imread(roidb[i]['image'])
-        assert im is not None, \
-            'Failed to read image \'{}\''.format(roidb[i]['image'])
-        if roidb[i]['flipped']:
-            im = im[:, ::-1, :]
         target_size = cfg.TRAIN.SCALES[scale_inds[i]]
-        im, im_scale = blob_utils.prep_im_for_blob(
-            im, cfg.PIXEL_MEANS, target_size, cfg.TRAIN.MAX_SIZE
-        )
+        if image_cache is not None:
+            # A rescaled uint8 image; im_list_to_blob subtracts the pixel means
+            with profiler.timed('decode'):
+                im, im_scale = image_cache.get_scaled_image(
+                    roidb[i], target_size
+                )
+            if roidb[i]['flipped']:
+                im = im[:, ::-1, :]
+        else:
+            with profiler.timed('decode'):
+                im = cv2.imread(roidb[i]['image'])
+            assert im is not None, \
+                'Failed to read image \'{}\''.format(roidb[i]['image'])
+            if roidb[i]['flipped']:
+                im = im[:, ::-1, :]
+            with profiler.timed('resize'):
+                im, im_scale = blob_utils.prep_im_for_blob(
+                    im, cfg.PIXEL_MEANS, target_size, cfg.TRAIN.MAX_SIZE
+                )
         im_scales.append(im_scale)
         processed_ims.append(im)
 
     # Create a blob to hold the input images
-    blob = blob_utils.im_list_to_blob(processed_ims)
+    with profiler.timed('im_blob'):
+        blob = blob_utils.im_list_to_blob(processed_ims)
 
     return blob, im_scales
@@ -0,0 +1,139 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Profiler of the stages of the training data pipeline (see
+cfg.DATA_LOADER.PROFILE).
+
+The code of a stage is timed with `with timed(stage):` and the times of all
+threads are aggregated per stage into histograms with logarithmic bins, from
+which training_stats.TrainingStats reports the mean and approximate
+percentiles every LOG_PERIOD iterations. The time of a stage excludes the time
+of the stages timed within it, so that the stages of a thread add up to its
+total time (the 'minibatch' stage is what get_minibatch spends outside of the
+other stages).
+
+Stages:
+  - decode: reading and decoding the images (or reading them from the image
+    cache, see cfg.TRAIN.IMAGE_CACHE)
+  - resize: rescaling the images
+  - im_blob: building the image blob (utils.blob.im_list_to_blob)
+  - rpn_targets, retinanet_targets: anchor targets
+  - fast_rcnn_sampling: sampling of the RoIs and of their box targets
+  - mask_targets, keypoint_targets, body_uv_targets: RoI head targets
+  - minibatch: the rest of get_minibatch (e.g., collating the blobs)
+  - queue_put_wait: time the loader threads wait for room in the minibatch
+    queue (the loaders are ahead of training)
+  - queue_get_wait: time the enqueue threads wait for a minibatch (training is
+    input bound)
+  - enqueue_blobs: feeding the minibatches to the GPU blobs queues
+
+In end-to-end Faster R-CNN training, Fast R-CNN sampling and the RoI head
+targets are computed by Python ops of the training net (see
+ops.generate_proposal_labels and ops.collect_and_distribute_fpn_rpn_proposals)
+rather than by the data loader; they are reported as well.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import contextlib
+import numpy as np
+import threading
+import time
+
+from detectron.core.config import cfg
+
+# Upper edges of the histogram bins in seconds: 8 bins per decade from 10 us to
+# 100 s (the last bin holds all larger times)
+_BIN_EDGES = np.logspace(-5, 2, 7 * 8 + 1)
+
+# Stages that wait on the other ones; not candidates for the bottleneck
+_WAIT_STAGES = ('queue_put_wait', 'queue_get_wait')
+
+_stage_stats = OrderedDict()
+_stage_stats_lock = threading.Lock()
+# Per thread stack of the time spent in the nested stages of the running stages
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def timed(stage):
+    """Time the code run in the context as the given stage, excluding the time
+    of the stages timed within it.
+    """
+    if not cfg.DATA_LOADER.PROFILE:
+        yield
+        return
+    if not hasattr(_local, 'nested_times'):
+        _local.nested_times = []
+    _local.nested_times.append(0.)
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        elapsed = time.time() - start_time
+        nested_time = _local.nested_times.pop()
+        if len(_local.nested_times) > 0:
+            _local.nested_times[-1] += elapsed
+        add_time(stage, elapsed - nested_time)
+
+
+def add_time(stage, seconds):
+    """Record that a stage took the given number of seconds."""
+    bin_ind = min(np.searchsorted(_BIN_EDGES, seconds), len(_BIN_EDGES) - 1)
+    with _stage_stats_lock:
+        if stage not in _stage_stats:
+            _stage_stats[stage] = [np.zeros(len(_BIN_EDGES), np.int64), 0.]
+        stats = _stage_stats[stage]
+        stats[0][bin_ind] += 1
+        stats[1] += seconds
+
+
+def get_stats(reset=False):
+    """Return the statistics of each stage since the start or the last reset
+    as a dict of stage: dict with the number of calls, the total time in
+    seconds and the mean and median (p50) and 90th percentile (p90) time in
+    milliseconds; percentiles are within the precision of the histogram bins.
+    """
+    with _stage_stats_lock:
+        stage_stats = [(s, h.copy(), t) for s, (h, t) in _stage_stats.items()]
+        if reset:
+            _stage_stats.clear()
+    stats = OrderedDict()
+    for stage, hist, total_time in stage_stats:
+        count = int(hist.sum())
+        stats[stage] = dict(
+            n=count,
+            total=round(total_time, 3),
+            mean=round(1000. * total_time / count, 3),
+            p50=round(1000. * _get_percentile(hist, 0.5), 3),
+            p90=round(1000. * _get_percentile(hist, 0.9), 3),
+        )
+    return stats
+
+
+def get_bottleneck(stats):
+    """Stage (other than the waits) with the largest total time in the
+    statistics returned by get_stats, or None.
+    """
+    stages = [s for s in stats if s not in _WAIT_STAGES]
+    if len(stages) == 0:
+        return None
+    return max(stages, key=lambda s: stats[s]['total'])
+
+
+def _get_percentile(hist, q):
+    """Approximate q-quantile of the times in a histogram: the geometric center
+    of the bin that holds it.
+    """
+    bin_ind = int(np.searchsorted(np.cumsum(hist), q * hist.sum()))
+    if bin_ind == 0:
+        return float(_BIN_EDGES[0])
+    return float(np.sqrt(_BIN_EDGES[bin_ind - 1] * _BIN_EDGES[bin_ind]))
@@ -191,22 +191,26 @@ def _get_retinanet_blobs(
     labels.fill(-1)
     if len(gt_boxes) > 0:
         # Compute overlaps between the anchors and the gt boxes overlaps
-        anchor_by_gt_overlap = box_utils.bbox_overlaps(anchors, gt_boxes)
+        # (only the overlapping pairs are computed)
+        anchor_by_gt_overlap = box_utils.sparse_bbox_overlaps(
+            anchors, gt_boxes
+        )
         # Map from anchor to gt box that has highest overlap
-        anchor_to_gt_argmax = anchor_by_gt_overlap.argmax(axis=1)
+        anchor_to_gt_argmax = anchor_by_gt_overlap.argmax
         # For each anchor, amount of overlap with most overlapping gt box
-        anchor_to_gt_max = anchor_by_gt_overlap[
-            np.arange(num_inside), anchor_to_gt_argmax]
+        anchor_to_gt_max = anchor_by_gt_overlap.max_overlaps
 
-        # Map from gt box to an anchor that has highest overlap
-        gt_to_anchor_argmax = anchor_by_gt_overlap.argmax(axis=0)
         # For each gt box, amount of overlap with most overlapping anchor
-        gt_to_anchor_max = anchor_by_gt_overlap[
-            gt_to_anchor_argmax, np.arange(anchor_by_gt_overlap.shape[1])]
+        gt_to_anchor_max = anchor_by_gt_overlap.query_max_overlaps
         # Find all anchors that share the max overlap amount
         # (this includes many ties)
-        anchors_with_max_overlap = np.where(
-            anchor_by_gt_overlap == gt_to_anchor_max)[0]
+        if np.any(gt_to_anchor_max == 0):
+            # A gt box that overlaps no anchor ties with all of them
+            anchors_with_max_overlap = np.arange(num_inside)
+        else:
+            anchors_with_max_overlap = anchor_by_gt_overlap.inds[
+                anchor_by_gt_overlap.overlaps ==
+                gt_to_anchor_max[anchor_by_gt_overlap.query_inds]]
 
         # Fg label: for each gt use anchors with highest overlap
         # (including ties)
@@ -133,12 +133,16 @@ def _get_rpn_blobs(im_height, im_width, foas, all_anchors, gt_boxes):
         # Only keep anchors inside the image by a margin of straddle_thresh
         # Set TRAIN.RPN_STRADDLE_THRESH to -1 (or a large value) to keep all
         # anchors
-        inds_inside = np.where(
-            (all_anchors[:, 0] >= -straddle_thresh) &
-            (all_anchors[:, 1] >= -straddle_thresh) &
-            (all_anchors[:, 2] < im_width + straddle_thresh) &
-            (all_anchors[:, 3] < im_height + straddle_thresh)
-        )[0]
+        inds_inside = []
+        offset = 0
+        for foa in foas:
+            inds_inside.append(
+                offset + data_utils.get_inds_inside_field_of_anchors(
+                    foa, im_height, im_width, straddle_thresh
+                )
+            )
+            offset += foa.field_of_anchors.shape[0]
+        inds_inside = np.concatenate(inds_inside)
         # keep only inside anchors
         anchors = all_anchors[inds_inside, :]
     else:
@@ -155,26 +159,12 @@ def _get_rpn_blobs(im_height, im_width, foas, all_anchors, gt_boxes):
     labels = np.empty((num_inside, ), dtype=np.int32)
     labels.fill(-1)
     if len(gt_boxes) > 0:
-        # Compute overlaps between the anchors and the gt boxes overlaps
-        anchor_by_gt_overlap = box_utils.bbox_overlaps(anchors, gt_boxes)
-        # Map from anchor to gt box that has highest overlap
-        anchor_to_gt_argmax = anchor_by_gt_overlap.argmax(axis=1)
-        # For each anchor, amount of overlap with most overlapping gt box
-        anchor_to_gt_max = anchor_by_gt_overlap[np.arange(num_inside),
-                                                anchor_to_gt_argmax]
-
-        # Map from gt box to an anchor that has highest overlap
-        gt_to_anchor_argmax = anchor_by_gt_overlap.argmax(axis=0)
-        # For each gt box, amount of overlap with most overlapping anchor
-        gt_to_anchor_max = anchor_by_gt_overlap[
-            gt_to_anchor_argmax,
-            np.arange(anchor_by_gt_overlap.shape[1])
-        ]
-        # Find all anchors that share the max overlap amount
-        # (this includes many ties)
-        anchors_with_max_overlap = np.where(
-            anchor_by_gt_overlap == gt_to_anchor_max
-        )[0]
+        # Match anchors and gt boxes using sparse overlaps (same result as
+        # computing the overlaps between all the anchors and gt boxes)
+        anchor_to_gt_argmax, anchor_to_gt_max, anchors_with_max_overlap = \
+            _match_anchors_to_gt_boxes(
+                foas, all_anchors, inds_inside, anchors, gt_boxes
+            )
 
         # Fg label: for each gt use anchors with highest overlap
         # (including ties)
@@ -272,3 +262,140 @@ def _get_rpn_blobs(im_height, im_width, foas, all_anchors, gt_boxes):
             )
         )
     return blobs_out[0] if len(blobs_out) == 1 else blobs_out
+
+
+def _match_anchors_to_gt_boxes(
+    foas, all_anchors, inds_inside, anchors, gt_boxes
+):
+    """Match the anchors inds_inside of all_anchors (the concatenated fields of
+    anchors `foas`) to the gt boxes. Returns, for each anchor in inds_inside,
+    the index of the gt box with highest overlap (the first one in case of ties)
+    and the amount of overlap with it, and the anchors that have the highest
+    overlap with a gt box (including ties).
+
+    Anchor overlaps are only used to compare them to RPN_NEGATIVE_OVERLAP and
+    RPN_POSITIVE_OVERLAP, so only the pairs of anchors and gt boxes that may
+    overlap by more than the smallest of them are considered. These pairs are
+    found directly from the gt box coordinates as anchors lie on regular grids.
+    The result is the same as with the dense anchor by gt box overlaps.
+    """
+    gt_boxes = gt_boxes.astype(np.float32, copy=False)
+    num_inside = len(inds_inside)
+    num_gt = gt_boxes.shape[0]
+    thresh = min(cfg.TRAIN.RPN_NEGATIVE_OVERLAP, cfg.TRAIN.RPN_POSITIVE_OVERLAP)
+    pos, gt_inds, overlaps = _get_sparse_overlaps(
+        foas, all_anchors, inds_inside, gt_boxes, max(thresh, 0) * (1 - 1e-3)
+    )
+
+    anchor_to_gt_argmax = np.zeros(num_inside, dtype=np.int64)
+    anchor_to_gt_max = np.zeros(num_inside, dtype=np.float32)
+    anchors_with_max_overlap = []
+    # Gt boxes whose max overlap may be missed by the sparse overlaps
+    dense_gt_inds = []
+    order = np.argsort(gt_inds, kind='mergesort')
+    gt_bounds = np.searchsorted(gt_inds[order], np.arange(num_gt + 1))
+    for j in range(num_gt):
+        # An anchor appears at most once per gt box
+        inds = order[gt_bounds[j]:gt_bounds[j + 1]]
+        if len(inds) == 0 or overlaps[inds].max() < thresh:
+            dense_gt_inds.append(j)
+            continue
+        is_max = overlaps[inds] == overlaps[inds].max()
+        anchors_with_max_overlap.append(pos[inds[is_max]])
+        # Gt boxes are visited in order so strict comparison keeps the first
+        # gt box in case of ties
+        is_better = overlaps[inds] > anchor_to_gt_max[pos[inds]]
+        anchor_to_gt_max[pos[inds[is_better]]] = overlaps[inds[is_better]]
+        anchor_to_gt_argmax[pos[inds[is_better]]] = j
+
+    for j in dense_gt_inds:
+        # Overlaps with all the anchors that intersect the gt box
+        inds, _, gt_overlaps = _get_sparse_overlaps(
+            foas, all_anchors, inds_inside, gt_boxes[j:j + 1, :], 0
+        )
+        if len(inds) > 0:
+            inds = inds[gt_overlaps == gt_overlaps.max()]
+        else:
+            # All the anchors share the max overlap (0)
+            inds = np.arange(num_inside)
+        anchors_with_max_overlap.append(inds)
+        # The overlaps of these anchors with the other gt boxes may have been
+        # skipped
+        anchor_by_gt_overlap = box_utils.bbox_overlaps(anchors[inds], gt_boxes)
+        anchor_to_gt_argmax[inds] = anchor_by_gt_overlap.argmax(axis=1)
+        anchor_to_gt_max[inds] = anchor_by_gt_overlap.max(axis=1)
+
+    anchors_with_max_overlap = np.concatenate(anchors_with_max_overlap)
+    return anchor_to_gt_argmax, anchor_to_gt_max, anchors_with_max_overlap
+
+
+def _get_sparse_overlaps(foas, all_anchors, inds_inside, gt_boxes, thresh):
+    """Positive overlaps between the anchors inds_inside (sorted) of
+    all_anchors and the gt boxes, including at least those that are >= thresh.
+    Returns the (index in inds_inside, gt box index, overlap) of the pairs.
+    """
+    anchor_inds, gt_inds = _get_anchor_gt_pairs(foas, gt_boxes, thresh)
+    pos = np.searchsorted(inds_inside, anchor_inds)
+    keep = pos < len(inds_inside)
+    keep[keep] = inds_inside[pos[keep]] == anchor_inds[keep]
+    overlaps = box_utils.paired_bbox_overlaps(
+        all_anchors[anchor_inds[keep]], gt_boxes[gt_inds[keep]]
+    )
+    keep = np.where(keep)[0][overlaps > 0]
+    return pos[keep], gt_inds[keep], overlaps[overlaps > 0]
+
+
+def _get_anchor_gt_pairs(foas, gt_boxes, thresh):
+    """Pairs of (index in the concatenated fields of anchors `foas`, gt box
+    index) that include all the anchors that overlap each gt box by at least
+    thresh (and some that do not).
+    """
+    num_gt = gt_boxes.shape[0]
+    gt_widths = gt_boxes[:, 2:3] - gt_boxes[:, 0:1] + 1
+    gt_heights = gt_boxes[:, 3:4] - gt_boxes[:, 1:2] + 1
+    anchor_inds = []
+    gt_inds = []
+    offset = 0
+    for foa in foas:
+        A = foa.num_cell_anchors
+        F = foa.field_size
+        stride = foa.stride
+        cell_anchors = foa.field_of_anchors[:A]
+        widths = cell_anchors[:, 2] - cell_anchors[:, 0] + 1
+        heights = cell_anchors[:, 3] - cell_anchors[:, 1] + 1
+        # An overlap >= thresh requires an intersection of at least
+        # thresh * max(area) / min(height) in width (same for height). This
+        # gives the range (G x A) of grid cells where each cell anchor may
+        # overlap each gt box by at least thresh.
+        max_areas = np.maximum(widths * heights, gt_widths * gt_heights)
+        min_iw = thresh * max_areas / np.minimum(heights, gt_heights)
+        min_ih = thresh * max_areas / np.minimum(widths, gt_widths)
+        x_lo = np.floor(
+            (gt_boxes[:, 0:1] - 1 + min_iw - cell_anchors[:, 2]) / stride
+        ).clip(0, F - 1).astype(np.int64)
+        x_hi = np.ceil(
+            (gt_boxes[:, 2:3] + 1 - min_iw - cell_anchors[:, 0]) / stride
+        ).clip(-1, F - 1).astype(np.int64)
+        y_lo = np.floor(
+            (gt_boxes[:, 1:2] - 1 + min_ih - cell_anchors[:, 3]) / stride
+        ).clip(0, F - 1).astype(np.int64)
+        y_hi = np.ceil(
+            (gt_boxes[:, 3:4] + 1 - min_ih - cell_anchors[:, 1]) / stride
+        ).clip(-1, F - 1).astype(np.int64)
+        feasible = (
+            (min_iw <= np.minimum(widths, gt_widths)) &
+            (min_ih <= np.minimum(heights, gt_heights))
+        )
+        nx = np.where(feasible, np.maximum(x_hi - x_lo + 1, 0), 0).ravel()
+        ny = np.maximum(y_hi - y_lo + 1, 0).ravel()
+        # Enumerate the cells of each range
+        counts = nx * ny
+        pairs = np.repeat(np.arange(num_gt * A), counts)
+        starts = np.cumsum(counts) - counts
+        k = np.arange(counts.sum()) - np.repeat(starts, counts)
+        xs = x_lo.ravel()[pairs] + k % nx[pairs]
+        ys = y_lo.ravel()[pairs] + k // nx[pairs]
+        anchor_inds.append(offset + (ys * F + xs) * A + pairs % A)
+        gt_inds.append(pairs // A)
+        offset += foa.field_of_anchors.shape[0]
+    return np.concatenate(anchor_inds), np.concatenate(gt_inds)
@@ -0,0 +1,148 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Deterministic sampler of the roidb indices of the training minibatches.
+
+Minibatches are numbered from 0 over the whole training run. Minibatch k is
+the (k % B)-th slice of IMS_PER_BATCH indices of the permutation of epoch
+k // B (B is the number of minibatches per epoch), and the permutation of an
+epoch is drawn from a generator seeded with (seed, epoch). The indices of any
+minibatch are thus a function of the seed and k only, which makes the data
+order reproducible and lets training resume at any minibatch: the sampler
+state is essentially the number of the next minibatch (see
+RoIDataLoader.get_sampler_state).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import threading
+
+from detectron.core.config import cfg
+import detectron.utils.blob as blob_utils
+
+
+class RoidbSampler(object):
+    """Thread safe sampler of the roidb indices of the training minibatches."""
+
+    def __init__(
+        self, roidb, ims_per_batch, seed, aspect_grouping, num_buckets=0
+    ):
+        self._ims_per_batch = ims_per_batch
+        self._seed = seed
+        self._aspect_grouping = aspect_grouping
+        self._num_buckets = num_buckets if aspect_grouping else 0
+        self._num_entries = len(roidb)
+        if aspect_grouping and num_buckets > 0:
+            # Minibatches only contain images of one bucket of scaled shapes
+            self._groups = blob_utils.get_shape_buckets(
+                [_get_scaled_shape(r) for r in roidb], num_buckets
+            )
+        elif aspect_grouping:
+            # Minibatches only contain horizontal or only vertical images
+            widths = np.array([r['width'] for r in roidb])
+            heights = np.array([r['height'] for r in roidb])
+            self._groups = [
+                np.where(widths >= heights)[0], np.where(widths < heights)[0]
+            ]
+        else:
+            self._groups = [np.arange(self._num_entries)]
+        self._batches_per_epoch = sum(
+            len(inds) // ims_per_batch for inds in self._groups
+        )
+        assert self._batches_per_epoch > 0, \
+            'The roidb has fewer than IMS_PER_BATCH entries per group'
+        self._lock = threading.Lock()
+        self._epoch = None
+        self._epoch_perm = None
+        self._next_batch = 0
+        # Minibatches rejected by the loader (see get_minibatch)
+        self._invalid_batches = []
+
+    def next_batch(self):
+        """Return the number and the roidb indices of the next minibatch."""
+        with self._lock:
+            batch = self._next_batch
+            self._next_batch += 1
+            epoch, i = divmod(batch, self._batches_per_epoch)
+            if epoch != self._epoch:
+                self._epoch_perm = self._get_epoch_perm(epoch)
+                self._epoch = epoch
+            return batch, self._epoch_perm[i]
+
+    def set_invalid(self, batch):
+        """Record that minibatch `batch` was not used."""
+        with self._lock:
+            self._invalid_batches.append(batch)
+
+    def get_state(self, num_minibatches):
+        """State of the sampler after `num_minibatches` valid minibatches have
+        been used.
+        """
+        with self._lock:
+            invalid_batches = sorted(self._invalid_batches)
+        next_batch = num_minibatches
+        for batch in invalid_batches:
+            if batch >= next_batch:
+                break
+            next_batch += 1
+        return {
+            'seed': self._seed,
+            'num_entries': self._num_entries,
+            'ims_per_batch': self._ims_per_batch,
+            'aspect_grouping': self._aspect_grouping,
+            'num_buckets': self._num_buckets,
+            'next_batch': next_batch,
+            'invalid_batches': [b for b in invalid_batches if b < next_batch],
+        }
+
+    def is_compatible(self, state):
+        """Whether a sampler state was saved by a sampler of the same roidb with
+        the same options.
+        """
+        return (
+            state['seed'] == self._seed and
+            state['num_entries'] == self._num_entries and
+            state['ims_per_batch'] == self._ims_per_batch and
+            state['aspect_grouping'] == self._aspect_grouping and
+            state['num_buckets'] == self._num_buckets
+        )
+
+    def set_state(self, state):
+        assert self.is_compatible(state)
+        with self._lock:
+            self._next_batch = state['next_batch']
+            self._invalid_batches = list(state['invalid_batches'])
+
+    def _get_epoch_perm(self, epoch):
+        """Roidb indices of the minibatches of an epoch, in order (an array of
+        shape (minibatches per epoch, ims per batch)).
+        """
+        rng = np.random.RandomState([self._seed, epoch])
+        mb = self._ims_per_batch
+        inds = []
+        for group_inds in self._groups:
+            group_inds = rng.permutation(group_inds)
+            inds.append(group_inds[:(len(group_inds) // mb) * mb])
+        inds = np.hstack(inds).reshape((-1, mb))
+        return inds[rng.permutation(inds.shape[0])]
+
+
+def _get_scaled_shape(entry):
+    """Shape of the image of a roidb entry scaled to the largest training scale.
+    """
+    im_shape = (entry['height'], entry['width'])
+    im_scale = blob_utils.get_target_scale(
+        im_shape, max(cfg.TRAIN.SCALES), cfg.TRAIN.MAX_SIZE
+    )
+    return (
+        int(np.round(im_shape[0] * im_scale)),
+        int(np.round(im_shape[1] * im_scale))
+    )
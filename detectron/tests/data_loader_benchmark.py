@@ -13,6 +13,8 @@
 #   DATA_LOADER.NUM_THREADS 4 \
 #   DATA_LOADER.MINIBATCH_QUEUE_SIZE 64 \
 #   DATA_LOADER.BLOBS_QUEUE_CAPACITY 8
+#
+# Add DATA_LOADER.PROFILE True to report the time of each data loader stage
 
 from __future__ import absolute_import
 from __future__ import division
@@ -36,6 +38,7 @@ from detectron.core.config import merge_cfg_from_file
 from detectron.core.config import merge_cfg_from_list
 from detectron.datasets.roidb import combined_roidb_for_training
 from detectron.roi_data.loader import RoIDataLoader
+import detectron.roi_data.profiler as loader_profiler
 from detectron.utils.logging import setup_logging
 from detectron.utils.timer import Timer
 
@@ -80,6 +83,19 @@ def loader_loop(roi_data_loader):
               i + 1, iters, load_timer.average_time))
 
 
+def log_stage_stats(logger):
+    stats = loader_profiler.get_stats(reset=True)
+    for stage, stage_stats in stats.items():
+        logger.info(
+            '{:>20s}: {:6d} calls  mean: {:.2f}ms  p50: {:.2f}ms  '
+            'p90: {:.2f}ms  total: {:.1f}s'.format(
+                stage, stage_stats['n'], stage_stats['mean'],
+                stage_stats['p50'], stage_stats['p90'], stage_stats['total']
+            )
+        )
+    logger.info('Bottleneck: {}'.format(loader_profiler.get_bottleneck(stats)))
+
+
 def main(opts):
     logger = logging.getLogger(__name__)
     roidb = combined_roidb_for_training(
@@ -89,7 +105,8 @@ def main(opts):
         roidb,
         num_loaders=cfg.DATA_LOADER.NUM_THREADS,
         minibatch_queue_size=cfg.DATA_LOADER.MINIBATCH_QUEUE_SIZE,
-        blobs_queue_capacity=cfg.DATA_LOADER.BLOBS_QUEUE_CAPACITY
+        blobs_queue_capacity=cfg.DATA_LOADER.BLOBS_QUEUE_CAPACITY,
+        adaptive=cfg.DATA_LOADER.ADAPTIVE
     )
     blob_names = roi_data_loader.get_output_names()
 
@@ -115,6 +132,8 @@ def main(opts):
             sort='cumulative')
     else:
         loader_loop(roi_data_loader)
+    if cfg.DATA_LOADER.PROFILE:
+        log_stage_stats(logger)
 
     roi_data_loader.register_sigint_handler()
     roi_data_loader.start(prefill=True)
@@ -136,6 +155,8 @@ def main(opts):
         # To inspect:
         # blobs = workspace.FetchBlobs(all_blobs)
         # from IPython import embed; embed()
+    if cfg.DATA_LOADER.PROFILE:
+        log_stage_stats(logger)
     logger.info('Shutting down data loader...')
     roi_data_loader.shutdown()
 
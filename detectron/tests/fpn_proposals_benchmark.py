@@ -0,0 +1,227 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+# Compares the FPN RPN proposals generated per level (GenerateProposalsOp on
+# each level) with the joint proposals of GenerateJointFpnProposalsOp
+# (FPN.RPN_JOINT_PROPOSALS) on synthetic RPN outputs: reports the proposal
+# recall computed by evaluate_box_proposals, the number of anchors decoded per
+# image and the time per image of the two modes (including the collect step of
+# CollectAndDistributeFpnRpnProposalsOp).
+#
+# Example usage:
+# python2 detectron/tests/fpn_proposals_benchmark.py \
+#   --num-images 50 \
+#   TEST.RPN_PRE_NMS_TOP_N 1000 \
+#   TEST.RPN_POST_NMS_TOP_N 1000 \
+#   TEST.RPN_JOINT_PRE_NMS_TOP_N 2000
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import logging
+import numpy as np
+import pprint
+
+from detectron.core.config import assert_and_infer_cfg
+from detectron.core.config import cfg
+from detectron.core.config import merge_cfg_from_list
+from detectron.datasets.json_dataset_evaluator import evaluate_box_proposals
+from detectron.modeling.generate_anchors import generate_anchors
+from detectron.ops.collect_and_distribute_fpn_rpn_proposals import collect
+from detectron.ops.generate_proposals import GenerateJointFpnProposalsOp
+from detectron.ops.generate_proposals import GenerateProposalsOp
+from detectron.utils.logging import setup_logging
+from detectron.utils.timer import Timer
+import detectron.utils.boxes as box_utils
+
+
+class NumpyBlob(object):
+    """Stand-in for the blobs given to a Python op."""
+
+    def __init__(self, data=None):
+        self.data = data
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def reshape(self, shape):
+        self.data = np.zeros(shape, dtype=np.float32)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--num-images', dest='num_images',
+        help='Number of synthetic images',
+        default=50, type=int)
+    parser.add_argument(
+        '--max-num-gt', dest='max_num_gt',
+        help='Maximum number of ground-truth boxes per synthetic image',
+        default=20, type=int)
+    parser.add_argument(
+        'opts', help='See detectron/core/config.py for all options', default=None,
+        nargs=argparse.REMAINDER)
+    return parser.parse_args()
+
+
+def get_lvl_anchors():
+    k_min, k_max = cfg.FPN.RPN_MIN_LEVEL, cfg.FPN.RPN_MAX_LEVEL
+    return [
+        generate_anchors(
+            stride=2.**lvl,
+            sizes=(cfg.FPN.RPN_ANCHOR_START_SIZE * 2.**(lvl - k_min), ),
+            aspect_ratios=cfg.FPN.RPN_ASPECT_RATIOS
+        )
+        for lvl in range(k_min, k_max + 1)
+    ]
+
+
+def get_synthetic_image(lvl_anchors, max_num_gt, rng):
+    """Ground-truth boxes and RPN outputs of a synthetic image: anchors that
+    overlap a ground-truth box get high scores and noisy deltas towards it.
+    """
+    im_height, im_width = 800, int(rng.randint(800, 1334))
+    num_gt = rng.randint(1, max_num_gt + 1)
+    sizes = np.exp(rng.uniform(np.log(16), np.log(600), size=(num_gt, 2)))
+    x1y1 = rng.rand(num_gt, 2) * ([im_width, im_height] - sizes)
+    gt_boxes = np.hstack((x1y1, x1y1 + sizes)).astype(np.float32)
+
+    scores = []
+    bbox_deltas = []
+    for lvl, anchors in zip(
+        range(cfg.FPN.RPN_MIN_LEVEL, cfg.FPN.RPN_MAX_LEVEL + 1), lvl_anchors
+    ):
+        stride = 2**lvl
+        A = anchors.shape[0]
+        H = int(np.ceil(im_height / float(stride)))
+        W = int(np.ceil(im_width / float(stride)))
+        # Anchors in (A, H, W) order
+        ys, xs = np.meshgrid(np.arange(H), np.arange(W), indexing='ij')
+        shifts = np.vstack((xs.ravel(), ys.ravel(), xs.ravel(), ys.ravel()))
+        all_anchors = (
+            anchors[:, np.newaxis, :] + shifts.transpose() * stride
+        ).reshape((-1, 4)).astype(np.float32)
+        overlaps = box_utils.sparse_bbox_overlaps(all_anchors, gt_boxes)
+        logits = (overlaps.max_overlaps - 0.5) * 10 + rng.randn(
+            len(all_anchors)
+        ) * 2
+        lvl_scores = 1. / (1. + np.exp(-logits))
+        deltas = box_utils.bbox_transform_inv(
+            all_anchors, gt_boxes[overlaps.argmax], (1., 1., 1., 1.)
+        )
+        deltas[overlaps.max_overlaps == 0] = 0
+        deltas += rng.randn(*deltas.shape) * 0.1
+        scores.append(
+            lvl_scores.reshape((1, A, H, W)).astype(np.float32)
+        )
+        bbox_deltas.append(
+            deltas.reshape((A, H, W, 4)).transpose((0, 3, 1, 2)).reshape(
+                (1, 4 * A, H, W)
+            ).astype(np.float32)
+        )
+    im_info = np.array([[im_height, im_width, 1.]], dtype=np.float32)
+    return gt_boxes, scores, bbox_deltas, im_info
+
+
+def per_level_proposals(lvl_anchors, scores, bbox_deltas, im_info):
+    lvls = range(cfg.FPN.RPN_MIN_LEVEL, cfg.FPN.RPN_MAX_LEVEL + 1)
+    roi_blobs = [NumpyBlob() for _ in lvls]
+    prob_blobs = [NumpyBlob() for _ in lvls]
+    for i, lvl in enumerate(lvls):
+        GenerateProposalsOp(lvl_anchors[i], 1. / 2**lvl, False).forward(
+            [
+                NumpyBlob(scores[i]), NumpyBlob(bbox_deltas[i]),
+                NumpyBlob(im_info)
+            ],
+            [roi_blobs[i], prob_blobs[i]]
+        )
+    return collect(roi_blobs + prob_blobs, False)
+
+
+def joint_proposals(lvl_anchors, scores, bbox_deltas, im_info):
+    lvls = range(cfg.FPN.RPN_MIN_LEVEL, cfg.FPN.RPN_MAX_LEVEL + 1)
+    outputs = [NumpyBlob() for _ in range(2 * len(lvls))]
+    GenerateJointFpnProposalsOp(
+        lvl_anchors, [1. / 2**lvl for lvl in lvls], False
+    ).forward(
+        [NumpyBlob(s) for s in scores] + [NumpyBlob(d) for d in bbox_deltas] +
+        [NumpyBlob(im_info)],
+        outputs
+    )
+    return collect(outputs, False)
+
+
+def get_roidb_entry(gt_boxes, rois):
+    num_gt, num_rois = gt_boxes.shape[0], rois.shape[0]
+    return {
+        'boxes': np.vstack((gt_boxes, rois[:, 1:5])),
+        'gt_classes': np.hstack(
+            (np.ones(num_gt, dtype=np.int32),
+             np.zeros(num_rois, dtype=np.int32))
+        ),
+        'is_crowd': np.zeros(num_gt + num_rois, dtype=np.bool_),
+        'seg_areas': np.hstack(
+            (box_utils.boxes_area(gt_boxes), np.zeros(num_rois))
+        ),
+    }
+
+
+def main(args):
+    logger = logging.getLogger(__name__)
+    rng = np.random.RandomState(cfg.RNG_SEED)
+    lvl_anchors = get_lvl_anchors()
+    images = [
+        get_synthetic_image(lvl_anchors, args.max_num_gt, rng)
+        for _ in range(args.num_images)
+    ]
+
+    for name, func, pre_nms_topN in [
+        ('Per level', per_level_proposals, cfg.TEST.RPN_PRE_NMS_TOP_N),
+        ('Joint', joint_proposals, cfg.TEST.RPN_JOINT_PRE_NMS_TOP_N),
+    ]:
+        timer = Timer()
+        roidb = []
+        num_decoded = 0
+        for gt_boxes, scores, bbox_deltas, im_info in images:
+            timer.tic()
+            rois = func(lvl_anchors, scores, bbox_deltas, im_info)
+            timer.toc()
+            roidb.append(get_roidb_entry(gt_boxes, rois))
+            sizes = [s.size for s in scores]
+            if func is per_level_proposals:
+                num_decoded += sum(min(pre_nms_topN, n) for n in sizes)
+            else:
+                num_decoded += min(pre_nms_topN, sum(sizes))
+        res = evaluate_box_proposals(None, roidb)
+        recalls = dict(zip(np.round(res['thresholds'], 2), res['recalls']))
+        logger.info(
+            '{}: AR {:.4f}, recall@0.5 {:.4f}, recall@0.7 {:.4f}, '
+            '{:.0f} anchors decoded / image, {:.2f}ms / image'.format(
+                name, res['ar'], recalls[0.5], recalls[0.7],
+                num_decoded / float(len(images)),
+                timer.average_time * 1000
+            )
+        )
+
+
+if __name__ == '__main__':
+    logger = setup_logging(__name__)
+    args = parse_args()
+    cfg.FPN.FPN_ON = True
+    cfg.FPN.MULTILEVEL_RPN = True
+    cfg.TEST.RPN_PRE_NMS_TOP_N = 1000
+    cfg.TEST.RPN_POST_NMS_TOP_N = 1000
+    if args.opts is not None:
+        merge_cfg_from_list(args.opts)
+    assert_and_infer_cfg(cache_urls=False)
+    logger.info('Running with config:')
+    logger.info(pprint.pformat(cfg))
+    main(args)
@@ -0,0 +1,176 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+# Compares the per class NMS of box_results_with_nms_and_limit (reference
+# implementation below) with the class-batched NMS of core.test on synthetic
+# detections, and measures the throughput of the batched path when several
+# images are processed by parallel threads (the NMS kernel releases the GIL).
+#
+# Example usage:
+# python2 detectron/tests/nms_benchmark.py \
+#   --num-proposals 1000 \
+#   --threads 4 \
+#   TEST.DETECTIONS_PER_IM 100 \
+#   TEST.BBOX_VOTE.ENABLED True
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import logging
+import numpy as np
+import pprint
+import threading
+
+from detectron.core.config import assert_and_infer_cfg
+from detectron.core.config import cfg
+from detectron.core.config import merge_cfg_from_list
+from detectron.core.test import box_results_with_nms_and_limit
+from detectron.utils.logging import setup_logging
+from detectron.utils.timer import Timer
+import detectron.utils.boxes as box_utils
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--num-proposals', dest='num_proposals',
+        help='Number of proposals (rows of scores and boxes) per image',
+        default=1000, type=int)
+    parser.add_argument(
+        '--num-images', dest='num_images',
+        help='Number of synthetic images',
+        default=200, type=int)
+    parser.add_argument(
+        '--num-classes', dest='num_classes',
+        help='Number of classes (including the background class)',
+        default=81, type=int)
+    parser.add_argument(
+        '--threads', dest='threads',
+        help='Number of threads used for the threaded batched NMS run',
+        default=4, type=int)
+    parser.add_argument(
+        'opts', help='See detectron/core/config.py for all options', default=None,
+        nargs=argparse.REMAINDER)
+    return parser.parse_args()
+
+
+def per_class_box_results(scores, boxes):
+    """box_results_with_nms_and_limit with one NMS call per class."""
+    num_classes = cfg.MODEL.NUM_CLASSES
+    cls_boxes = [[] for _ in range(num_classes)]
+    for j in range(1, num_classes):
+        inds = np.where(scores[:, j] > cfg.TEST.SCORE_THRESH)[0]
+        scores_j = scores[inds, j]
+        boxes_j = boxes[inds, j * 4:(j + 1) * 4]
+        dets_j = np.hstack((boxes_j, scores_j[:, np.newaxis])).astype(
+            np.float32, copy=False
+        )
+        keep = box_utils.nms(dets_j, cfg.TEST.NMS)
+        nms_dets = dets_j[keep, :]
+        if cfg.TEST.BBOX_VOTE.ENABLED:
+            nms_dets = box_utils.box_voting(
+                nms_dets,
+                dets_j,
+                cfg.TEST.BBOX_VOTE.VOTE_TH,
+                scoring_method=cfg.TEST.BBOX_VOTE.SCORING_METHOD
+            )
+        cls_boxes[j] = nms_dets
+    if cfg.TEST.DETECTIONS_PER_IM > 0:
+        image_scores = np.hstack(
+            [cls_boxes[j][:, -1] for j in range(1, num_classes)]
+        )
+        if len(image_scores) > cfg.TEST.DETECTIONS_PER_IM:
+            image_thresh = np.sort(image_scores)[-cfg.TEST.DETECTIONS_PER_IM]
+            for j in range(1, num_classes):
+                keep = np.where(cls_boxes[j][:, -1] >= image_thresh)[0]
+                cls_boxes[j] = cls_boxes[j][keep, :]
+    return cls_boxes
+
+
+def get_synthetic_detections(num_proposals, rng):
+    """Class scores and per class boxes that look like the output of the box
+    head: each proposal has a few likely classes and its per class boxes are
+    jittered versions of the same box.
+    """
+    num_classes = cfg.MODEL.NUM_CLASSES
+    ctrs = rng.rand(num_proposals, 2) * cfg.TEST.MAX_SIZE * 0.6
+    sizes = rng.rand(num_proposals, 2) * 200 + 20
+    proposals = np.hstack((ctrs - sizes / 2, ctrs + sizes / 2))
+    boxes = np.tile(proposals, (1, num_classes)) + \
+        rng.randn(num_proposals, 4 * num_classes) * 4
+    logits = rng.randn(num_proposals, num_classes) * 3
+    scores = np.exp(logits - logits.max(axis=1, keepdims=True))
+    scores /= scores.sum(axis=1, keepdims=True)
+    return scores.astype(np.float32), boxes.astype(np.float32)
+
+
+def time_images(func, images):
+    timer = Timer()
+    for scores, boxes in images:
+        timer.tic()
+        func(scores, boxes)
+        timer.toc()
+    return timer
+
+
+def main(args):
+    logger = logging.getLogger(__name__)
+    rng = np.random.RandomState(cfg.RNG_SEED)
+    images = [
+        get_synthetic_detections(args.num_proposals, rng)
+        for _ in range(args.num_images)
+    ]
+
+    # Results are the same up to the order of equal score detections
+    for scores, boxes in images[:10]:
+        ref_cls_boxes = per_class_box_results(scores, boxes)
+        cls_boxes = box_results_with_nms_and_limit(scores, boxes)[2]
+        for j in range(1, cfg.MODEL.NUM_CLASSES):
+            np.testing.assert_allclose(
+                cls_boxes[j], ref_cls_boxes[j], rtol=1e-5, atol=1e-3
+            )
+
+    ref_timer = time_images(per_class_box_results, images)
+    batched_timer = time_images(box_results_with_nms_and_limit, images)
+    logger.info('Per class NMS: {:.2f}ms / image'.format(
+        ref_timer.average_time * 1000))
+    logger.info('Batched NMS: {:.2f}ms / image ({:.2f}x)'.format(
+        batched_timer.average_time * 1000,
+        ref_timer.average_time / batched_timer.average_time))
+
+    # Split the images among threads
+    threads = [
+        threading.Thread(
+            target=time_images,
+            args=(box_results_with_nms_and_limit, images[i::args.threads])
+        )
+        for i in range(args.threads)
+    ]
+    timer = Timer()
+    timer.tic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    timer.toc()
+    logger.info('Batched NMS with {} threads: {:.2f}ms / image'.format(
+        args.threads, timer.total_time / len(images) * 1000))
+
+
+if __name__ == '__main__':
+    logger = setup_logging(__name__)
+    args = parse_args()
+    cfg.MODEL.NUM_CLASSES = args.num_classes
+    if args.opts is not None:
+        merge_cfg_from_list(args.opts)
+    assert_and_infer_cfg(cache_urls=False)
+    logger.info('Running with config:')
+    logger.info(pprint.pformat(cfg))
+    main(args)
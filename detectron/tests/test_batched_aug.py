@@ -0,0 +1,71 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import unittest
+
+from detectron.core.config import cfg
+from detectron.core.test_aug import AugView
+import detectron.core.test_aug as test_aug
+
+
+class TestBatchedAug(unittest.TestCase):
+    def test_view_batches(self):
+        im = np.random.randint(0, 255, size=(60, 80, 3)).astype(np.uint8)
+        views = [
+            AugView(cfg.TEST.SCALE, cfg.TEST.MAX_SIZE, False, 1.0),
+            AugView(cfg.TEST.SCALE // 2, cfg.TEST.MAX_SIZE, False, 1.0),
+            AugView(cfg.TEST.SCALE, cfg.TEST.MAX_SIZE, True, 1.0),
+        ]
+        batches = test_aug.get_view_batches(im, views)
+        # The flipped view has the same shape as the original image
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(batches[0].views, [views[0], views[2]])
+        self.assertEqual(batches[1].views, [views[1]])
+        self.assertEqual(batches[0].blob.shape[0], 2)
+        self.assertEqual(batches[0].im_info.shape, (2, 3))
+        np.testing.assert_array_almost_equal(
+            batches[0].blob[0], batches[0].blob[1][:, :, ::-1], decimal=3
+        )
+
+        # All views in one padded batch
+        cfg.TEST.AUG_BUCKETS = 1
+        batches = test_aug.get_view_batches(im, views)
+        cfg.TEST.AUG_BUCKETS = 0
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0].views, views)
+        self.assertEqual(batches[0].blob.shape[0], 3)
+
+    def test_transform_boxes(self):
+        boxes = np.array([[10., 5., 30., 40.], [0., 0., 79., 59.]])
+        view = AugView(cfg.TEST.SCALE, cfg.TEST.MAX_SIZE, True, 0.5)
+        im_view_shape = (60, 40, 3)
+        boxes_view = test_aug.transform_boxes(boxes, view, im_view_shape)
+        np.testing.assert_array_almost_equal(
+            boxes_view[0], [40 - 15 - 1, 5, 40 - 5 - 1, 40]
+        )
+        np.testing.assert_array_almost_equal(
+            test_aug.invert_transform_boxes(boxes_view, view, im_view_shape),
+            boxes
+        )
+        # Boxes tiled per class
+        tiled_boxes = np.tile(boxes, (1, 3))
+        np.testing.assert_array_almost_equal(
+            test_aug.invert_transform_boxes(
+                np.tile(boxes_view, (1, 3)), view, im_view_shape
+            ),
+            tiled_boxes
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import unittest
+
+import detectron.utils.boxes as box_utils
+
+
+class TestBatchedNMS(unittest.TestCase):
+    def test_batched_nms(self):
+        rng = np.random.RandomState(0)
+        xy = rng.rand(300, 2) * 100
+        wh = rng.rand(300, 2) * 50 + 10
+        dets = np.hstack((xy, xy + wh, rng.rand(300, 1))).astype(np.float32)
+        classes = rng.randint(1, 5, size=300).astype(np.int32)
+        keep = box_utils.batched_nms(dets, classes, 0.5)
+        expected_keep = []
+        for j in range(1, 5):
+            inds = np.where(classes == j)[0]
+            expected_keep.extend(inds[box_utils.nms(dets[inds], 0.5)])
+        np.testing.assert_array_equal(keep, np.sort(expected_keep))
+        keep = box_utils.batched_nms(dets[:0], classes[:0], 0.5)
+        self.assertEqual(len(keep), 0)
+
+    def test_box_voting(self):
+        all_dets = np.array(
+            [[0, 0, 9, 9, 0.9], [1, 1, 10, 10, 0.3], [50, 50, 59, 59, 0.5]],
+            dtype=np.float32
+        )
+        top_dets = all_dets[[0, 2]]
+        voted = box_utils.box_voting(top_dets, all_dets, 0.5)
+        np.testing.assert_allclose(
+            voted[0, :4], [0.25, 0.25, 9.25, 9.25], rtol=1e-5
+        )
+        np.testing.assert_allclose(voted[1], all_dets[2])
+        voted = box_utils.box_voting(
+            top_dets, all_dets, 0.5, scoring_method='AVG'
+        )
+        np.testing.assert_allclose(voted[:, 4], [0.6, 0.5], rtol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
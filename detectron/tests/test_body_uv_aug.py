@@ -0,0 +1,143 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import os
+import unittest
+import mock
+
+from detectron.core.config import cfg
+from detectron.core.test import _softmax
+from detectron.core.test import combine_body_uv_aug_preds
+import detectron.utils.densepose_methods as dp_utils
+
+
+def fake_loadmat(file_name):
+    """Stand-in for the DensePoseData/UV_data files (downloaded separately):
+    the symmetric U of part i + 1 is i + U and the symmetric V is 1 - V, so
+    that the remap can be checked.
+    """
+    if os.path.basename(file_name) == 'UV_Processed.mat':
+        return {
+            'All_FaceIndices': np.zeros((1, 1)),
+            'All_Faces': np.ones((1, 3)),
+            'All_U_norm': np.zeros((1, 1)),
+            'All_V_norm': np.zeros((1, 1)),
+            'All_vertices': np.zeros((1, 1)),
+        }
+    v, u = np.mgrid[:256, :256] / 255.
+    U_transforms = np.empty((1, 24), dtype=object)
+    V_transforms = np.empty((1, 24), dtype=object)
+    for i in range(24):
+        U_transforms[0, i] = i + u
+        V_transforms[0, i] = 1 - v
+    return {'U_transforms': U_transforms, 'V_transforms': V_transforms}
+
+
+def get_body_uv_preds(rng, num_rois=2, size=8):
+    return [
+        rng.randn(num_rois, 15, size, size).astype(np.float32),
+        rng.randn(num_rois, 25, size, size).astype(np.float32),
+        rng.rand(num_rois, 25, size, size).astype(np.float32),
+        rng.rand(num_rois, 25, size, size).astype(np.float32),
+    ]
+
+
+class TestBodyUvAug(unittest.TestCase):
+    def setUp(self):
+        with mock.patch.object(dp_utils, 'loadmat', side_effect=fake_loadmat):
+            self.dp = dp_utils.DensePoseMethods()
+        self.heur = cfg.TEST.BODY_UV_AUG.HEUR
+
+    def tearDown(self):
+        cfg.TEST.BODY_UV_AUG.HEUR = self.heur
+
+    def test_flip_twice(self):
+        AnnIndex, Index_UV, U_uv, V_uv = get_body_uv_preds(
+            np.random.RandomState(0)
+        )
+        sym = self.dp.get_symmetric_body_uv_preds(
+            AnnIndex, Index_UV, U_uv, V_uv
+        )
+        AnnIndex_2, Index_UV_2, _, _ = \
+            self.dp.get_symmetric_body_uv_preds(*sym)
+        np.testing.assert_array_equal(AnnIndex_2, AnnIndex)
+        np.testing.assert_array_equal(Index_UV_2, Index_UV)
+
+    def test_symmetric_channels(self):
+        AnnIndex, Index_UV, U_uv, V_uv = get_body_uv_preds(
+            np.random.RandomState(0)
+        )
+        AnnIndex_sym, Index_UV_sym, U_sym, V_sym = \
+            self.dp.get_symmetric_body_uv_preds(AnnIndex, Index_UV, U_uv, V_uv)
+        # Left and right masks swapped, mirrored horizontally
+        mask_syms = [0, 1, 3, 2, 5, 4, 7, 6, 9, 8, 11, 10, 13, 12, 14]
+        for c, c_sym in enumerate(mask_syms):
+            np.testing.assert_array_equal(
+                AnnIndex_sym[:, c_sym], AnnIndex[:, c, :, ::-1]
+            )
+        np.testing.assert_array_equal(
+            Index_UV_sym[:, 0], Index_UV[:, 0, :, ::-1]
+        )
+        for i, i_sym in enumerate(self.dp.Index_Symmetry_List):
+            # Part i + 1 of the flipped image is part i_sym of the image
+            np.testing.assert_array_equal(
+                Index_UV_sym[:, i_sym], Index_UV[:, i + 1, :, ::-1]
+            )
+            # U and V remapped through the tables of part i + 1
+            U_loc = np.floor(U_uv[:, i + 1, :, ::-1] * 255) / 255.
+            V_loc = np.floor(V_uv[:, i + 1, :, ::-1] * 255) / 255.
+            np.testing.assert_allclose(U_sym[:, i_sym], i + U_loc, atol=1e-5)
+            np.testing.assert_allclose(V_sym[:, i_sym], 1 - V_loc, atol=1e-5)
+        # No part maps to the background channel
+        self.assertTrue((U_sym[:, 0] == 0).all())
+
+    def test_combine_aug_preds(self):
+        a = get_body_uv_preds(np.random.RandomState(0), num_rois=1, size=2)
+        b = get_body_uv_preds(np.random.RandomState(1), num_rois=1, size=2)
+        cfg.TEST.BODY_UV_AUG.HEUR = 'LOGIT_AVG'
+        combined = combine_body_uv_aug_preds([a, b])
+        for x, x_a, x_b in zip(combined, a, b):
+            np.testing.assert_allclose(x, (x_a + x_b) / 2, rtol=1e-6)
+
+        cfg.TEST.BODY_UV_AUG.HEUR = 'SOFT_AVG'
+        combined = combine_body_uv_aug_preds([a, b])
+        for k in range(2):
+            p_a = np.exp(a[k]) / np.exp(a[k]).sum(axis=1, keepdims=True)
+            p_b = np.exp(b[k]) / np.exp(b[k]).sum(axis=1, keepdims=True)
+            np.testing.assert_allclose(
+                combined[k], (p_a + p_b) / 2, rtol=1e-5
+            )
+        # U and V are averaged in both cases
+        for k in range(2, 4):
+            np.testing.assert_allclose(
+                combined[k], (a[k] + b[k]) / 2, rtol=1e-6
+            )
+
+        cfg.TEST.BODY_UV_AUG.HEUR = 'MAX'
+        with self.assertRaises(NotImplementedError):
+            combine_body_uv_aug_preds([a, b])
+
+    def test_softmax(self):
+        x = np.array([[[[0.]], [[np.log(3.)]]]], dtype=np.float32)
+        np.testing.assert_allclose(
+            _softmax(x)[0, :, 0, 0], [0.25, 0.75], rtol=1e-6
+        )
+        # Large logits do not overflow
+        x = 100 * np.random.RandomState(0).randn(3, 25, 4, 4)
+        np.testing.assert_allclose(
+            _softmax(x).sum(axis=1), np.ones((3, 4, 4)), rtol=1e-6
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+
+from caffe2.python import workspace
+
+import detectron.utils.io as io_utils
+import detectron.utils.net as net_utils
+
+
+class TestFlatWeights(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.tmp_dir, 'model.wts')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_save_and_load(self):
+        blobs = {
+            'conv1_w': np.random.randn(64, 3, 7, 7).astype(np.float32),
+            'conv1_b': np.random.randn(64).astype(np.float32),
+            'empty': np.zeros((0, 4), dtype=np.float32),
+            'ids': np.arange(5, dtype=np.int32),
+        }
+        io_utils.save_flat_weights(blobs, self.file_name, cfg_yaml='a: 1\n')
+        self.assertTrue(io_utils.is_flat_weights_file(self.file_name))
+
+        loaded = io_utils.load_flat_weights(self.file_name)
+        self.assertEqual(loaded['cfg'], 'a: 1\n')
+        self.assertEqual(sorted(loaded['blobs'].keys()), sorted(blobs.keys()))
+        for name, blob in blobs.items():
+            loaded_blob = loaded['blobs'][name]
+            self.assertEqual(loaded_blob.dtype, blob.dtype)
+            np.testing.assert_array_equal(loaded_blob, blob)
+        # Blobs are aligned views of the mapped file (no copy on astype)
+        conv1_w = loaded['blobs']['conv1_w']
+        self.assertFalse(conv1_w.flags.writeable)
+        self.assertIs(conv1_w.astype(np.float32, copy=False), conv1_w)
+
+    def test_load_without_cfg(self):
+        blobs = {'conv1_w': np.random.randn(8, 3, 1, 1).astype(np.float32)}
+        # As written by tools/convert_pkl_to_flat_weights.py for a weights file
+        # without a cfg (e.g., ImageNet pretrained weights)
+        io_utils.save_flat_weights(blobs, self.file_name, cfg_yaml=None)
+        loaded = io_utils.load_flat_weights(self.file_name)
+        self.assertNotIn('cfg', loaded)
+        # Blobs unused by the model are preserved in the workspace
+        workspace.ResetWorkspace()
+        model = mock.Mock(params=[])
+        net_utils.initialize_gpu_from_weights_file(
+            model, self.file_name, cpu=True
+        )
+        np.testing.assert_array_equal(
+            workspace.FetchBlob('__preserve__/conv1_w'), blobs['conv1_w']
+        )
+        workspace.ResetWorkspace()
+
+    def test_pickle_is_not_flat(self):
+        io_utils.save_object({'blobs': {}}, self.file_name)
+        self.assertFalse(io_utils.is_flat_weights_file(self.file_name))
+
+
+if __name__ == '__main__':
+    unittest.main()
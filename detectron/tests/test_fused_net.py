@@ -0,0 +1,103 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from caffe2.python import workspace
+
+from detectron.core.config import assert_and_infer_cfg
+from detectron.core.config import cfg
+from detectron.core.config import merge_cfg_from_file
+from detectron.core.test import im_detect_all
+from detectron.core.test_engine import initialize_model_from_cfg
+from detectron.modeling import model_builder
+from detectron.utils.io import save_object
+from detectron.utils.logging import setup_logging
+import detectron.utils.c2 as c2_utils
+
+c2_utils.import_detectron_ops()
+
+
+def save_random_weights(weights_file):
+    """Save the randomly initialized weights of an inference model."""
+    workspace.ResetWorkspace()
+    model = model_builder.create(cfg.MODEL.TYPE, train=False)
+    workspace.RunNetOnce(model.param_init_net)
+    blobs = {}
+    for param in model.params:
+        blobs[c2_utils.UnscopeName(str(param))] = \
+            workspace.FetchBlob(str(param))
+    save_object(dict(blobs=blobs), weights_file)
+
+
+def run_im_detect_all(weights_file, im, fused):
+    workspace.ResetWorkspace()
+    cfg.TEST.FUSED_NET = fused
+    model = initialize_model_from_cfg(weights_file)
+    with c2_utils.NamedCudaScope(0):
+        return im_detect_all(model, im, None)
+
+
+class TestFusedNet(unittest.TestCase):
+    def setUp(self):
+        self._output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        cfg.TEST.FUSED_NET = False
+        workspace.ResetWorkspace()
+        shutil.rmtree(self._output_dir)
+
+    def test_fused_net_matches_cascade(self):
+        weights_file = os.path.join(self._output_dir, 'model_random.pkl')
+        save_random_weights(weights_file)
+        im = np.random.randint(0, 255, size=(240, 320, 3)).astype(np.uint8)
+        boxes, _, _, bodys = run_im_detect_all(weights_file, im, False)
+        fused_boxes, _, _, fused_bodys = run_im_detect_all(
+            weights_file, im, True
+        )
+        self.assertGreater(len(boxes[1]), 0)
+        # Same detections (the fused net runs on CPU, the cascade on GPU)
+        np.testing.assert_allclose(
+            fused_boxes[1], boxes[1], rtol=1e-3, atol=0.1
+        )
+        self.assertEqual(len(fused_bodys[1]), len(bodys[1]))
+        for fused_iuv, iuv in zip(fused_bodys[1], bodys[1]):
+            self.assertEqual(fused_iuv.shape, iuv.shape)
+            # The part index is an argmax of the nearly uniform probabilities
+            # of random weights: allow a few pixels to differ
+            self.assertGreater(np.mean(np.abs(fused_iuv - iuv) < 1.), 0.99)
+
+
+if __name__ == '__main__':
+    workspace.GlobalInit(['caffe2', '--caffe2_log_level=0'])
+    logger = setup_logging(__name__)
+    logger.setLevel(logging.DEBUG)
+    np.random.seed(cfg.RNG_SEED)
+    merge_cfg_from_file(
+        os.path.join(
+            os.path.dirname(__file__), '..', '..', 'configs',
+            'DensePose_ResNet50_FPN_s1x-e2e.yaml'
+        )
+    )
+    cfg.NUM_GPUS = 1
+    cfg.TEST.SCALE = 240
+    cfg.TEST.MAX_SIZE = 320
+    # Few detections, whose order does not depend on near ties of the scores
+    cfg.TEST.RPN_PRE_NMS_TOP_N = 100
+    cfg.TEST.RPN_POST_NMS_TOP_N = 20
+    assert_and_infer_cfg(cache_urls=False, make_immutable=False)
+    unittest.main()
@@ -0,0 +1,93 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import unittest
+
+from detectron.core.config import cfg
+import detectron.utils.blob as blob_utils
+
+
+def get_ims(rng):
+    return [
+        rng.randint(0, 255, size=shape).astype(np.uint8)
+        for shape in [(60, 80, 3), (70, 50, 3)]
+    ]
+
+
+def get_blob(ims, target_size):
+    processed_ims = [
+        blob_utils.prep_im_for_blob(im, cfg.PIXEL_MEANS, target_size, 1000)[0]
+        for im in ims
+    ]
+    return blob_utils.im_list_to_blob(processed_ims)
+
+
+class TestImBlob(unittest.TestCase):
+    def tearDown(self):
+        cfg.IM_BLOB.UINT8_RESIZE = False
+        cfg.IM_BLOB.POOL_SIZE = 0
+
+    def test_im_list_to_blob(self):
+        ims = get_ims(np.random.RandomState(0))
+        processed_ims = [
+            (im - cfg.PIXEL_MEANS).astype(np.float32) for im in ims
+        ]
+        blob = blob_utils.im_list_to_blob(processed_ims)
+        self.assertEqual(blob.shape, (2, 3, 70, 80))
+        self.assertTrue(blob.flags.c_contiguous)
+        for i, im in enumerate(processed_ims):
+            h, w = im.shape[:2]
+            np.testing.assert_array_equal(
+                blob[i, :, :h, :w], im.transpose((2, 0, 1))
+            )
+            self.assertEqual(np.count_nonzero(blob[i]), im.size)
+        # Means are subtracted from uint8 images
+        np.testing.assert_array_almost_equal(
+            blob_utils.im_list_to_blob(ims), blob, decimal=4
+        )
+
+    def test_uint8_resize(self):
+        ims = get_ims(np.random.RandomState(0))
+        blob = get_blob(ims, 100)
+        cfg.IM_BLOB.UINT8_RESIZE = True
+        uint8_blob = get_blob(ims, 100)
+        self.assertEqual(uint8_blob.shape, blob.shape)
+        # Only the rounding of the resized images differs
+        self.assertLess(np.abs(uint8_blob - blob).max(), 1.)
+
+    def test_pool(self):
+        cfg.IM_BLOB.POOL_SIZE = 2
+        ims = get_ims(np.random.RandomState(0))
+        blob = blob_utils.im_list_to_blob(ims)
+        blob_id = id(blob)
+        # In use
+        self.assertIsNot(blob_utils.im_list_to_blob(ims), blob)
+        del blob
+        blob = blob_utils.im_list_to_blob(ims[::-1])
+        self.assertEqual(id(blob), blob_id)
+        # The padding of a reused buffer is zeroed
+        np.testing.assert_array_equal(blob[0, :, :, 50:], 0)
+        np.testing.assert_array_equal(
+            blob, blob_utils.im_list_to_blob(ims[::-1])
+        )
+        # Free buffers of other shapes are released
+        blob_utils.im_list_to_blob(ims[:1])
+        blob_utils.im_list_to_blob(ims[1:])
+        self.assertEqual(
+            [b.shape for b in blob_utils._blob_pool._buffers],
+            [blob.shape, (1, 3, 70, 50)]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import cv2
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from detectron.roi_data.image_cache import ImageCache
+import detectron.utils.blob as blob_utils
+
+
+class TestImageCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # A smooth image, whose resized images barely depend on the exact
+        # sampling positions
+        im = np.random.RandomState(0).randint(0, 255, size=(30, 40, 3))
+        self.im = cv2.resize(im.astype(np.uint8), (400, 300))
+        self.entry = {
+            'image': os.path.join(self.tmp_dir, 'im.png'),
+            'height': 300,
+            'width': 400,
+        }
+        cv2.imwrite(self.entry['image'], self.im)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def get_cache(self, fmt, per_scale, memory_size=10**6):
+        return ImageCache(
+            os.path.join(self.tmp_dir, 'cache'), (200, 100), 1000,
+            per_scale=per_scale, fmt=fmt, memory_size=memory_size
+        )
+
+    def test_scales(self):
+        for fmt in ['npy', 'jpg']:
+            for per_scale in [False, True]:
+                cache = self.get_cache(fmt, per_scale)
+                for target_size in [200, 100]:
+                    im, im_scale = cache.get_scaled_image(
+                        self.entry, target_size
+                    )
+                    expected_im, expected_im_scale = \
+                        blob_utils.prep_im_for_blob(
+                            self.im, np.zeros((1, 1, 3)), target_size, 1000
+                        )
+                    self.assertEqual(im.dtype, np.uint8)
+                    self.assertEqual(im.shape, expected_im.shape)
+                    self.assertAlmostEqual(im_scale, expected_im_scale)
+                    if fmt == 'npy' and (per_scale or target_size == 200):
+                        # Resized once and stored losslessly
+                        np.testing.assert_allclose(
+                            im, expected_im, atol=1
+                        )
+                shutil.rmtree(os.path.join(self.tmp_dir, 'cache'))
+
+    def test_tiers(self):
+        cache = self.get_cache('npy', False)
+        im = cache.get_scaled_image(self.entry, 200)[0]
+        # From memory
+        self.assertIs(cache.get_scaled_image(self.entry, 200)[0], im)
+        self.assertEqual(len(os.listdir(cache._dir)), 1)
+        # From disk, with room for one image in memory
+        cache = self.get_cache('npy', False, memory_size=im.nbytes)
+        np.testing.assert_array_equal(
+            cache.get_scaled_image(self.entry, 200)[0], im
+        )
+        # The memory cache is bounded
+        entry = dict(self.entry, image=os.path.join(self.tmp_dir, 'im2.png'))
+        shutil.copy(self.entry['image'], entry['image'])
+        for _ in range(2):
+            for e in [self.entry, entry]:
+                cache.get_scaled_image(e, 200)
+        self.assertEqual(len(cache._memory), 1)
+        self.assertEqual(cache._memory_size, im.nbytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
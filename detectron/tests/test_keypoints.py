@@ -0,0 +1,60 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import unittest
+
+from detectron.core.config import cfg
+import detectron.utils.keypoints as keypoint_utils
+
+
+class TestKeypoints(unittest.TestCase):
+    def setUp(self):
+        self.num_keypoints = cfg.KRCNN.NUM_KEYPOINTS
+        self.inference_min_size = cfg.KRCNN.INFERENCE_MIN_SIZE
+        cfg.KRCNN.NUM_KEYPOINTS = 17
+        cfg.KRCNN.INFERENCE_MIN_SIZE = 100
+
+    def tearDown(self):
+        cfg.KRCNN.NUM_KEYPOINTS = self.num_keypoints
+        cfg.KRCNN.INFERENCE_MIN_SIZE = self.inference_min_size
+
+    def test_heatmaps_to_keypoints_fast(self):
+        rng = np.random.RandomState(0)
+        num_rois, size = 20, 56
+        xy = rng.rand(num_rois, 2) * 500
+        wh = rng.rand(num_rois, 2) * 300 + 50
+        rois = np.hstack((xy, xy + wh)).astype(np.float32)
+        # Gaussian heatmaps with a sub-pixel peak (not on the border, where
+        # the peak is not refined)
+        ys, xs = np.mgrid[:size, :size]
+        ctrs = rng.rand(num_rois, 17, 2, 1, 1) * (size - 3) + 1
+        maps = -((xs - ctrs[:, :, 0])**2 + (ys - ctrs[:, :, 1])**2) / 2.
+        maps = maps.astype(np.float32)
+
+        xy_preds = keypoint_utils.heatmaps_to_keypoints(maps, rois)
+        fast_xy_preds = keypoint_utils.heatmaps_to_keypoints_fast(maps, rois)
+        self.assertEqual(fast_xy_preds.shape, xy_preds.shape)
+        # Within half a heatmap pixel
+        cell_sizes = (wh / size)[:, :, np.newaxis]
+        errors = np.abs(fast_xy_preds[:, :2] - xy_preds[:, :2]) / cell_sizes
+        self.assertLess(errors.max(), 0.5)
+        np.testing.assert_allclose(
+            fast_xy_preds[:, 2], xy_preds[:, 2], atol=0.2
+        )
+        np.testing.assert_allclose(
+            fast_xy_preds[:, 3], xy_preds[:, 3], rtol=0.2
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,7 @@ from __future__ import unicode_literals
 
 import numpy as np
 import logging
+import time
 import unittest
 import mock
 
@@ -100,6 +101,47 @@ class TestRoIDataLoader(unittest.TestCase):
         test_loader.shutdown()
         train_loader.shutdown()
 
+    @mock.patch(
+        'detectron.roi_data.loader.get_minibatch_blob_names',
+        return_value=[u'data']
+    )
+    @mock.patch(
+        'detectron.roi_data.loader.get_minibatch',
+        side_effect=get_roidb_blobs
+    )
+    @mock.patch.object(RoIDataLoader, 'create_blobs_queues', return_value=[])
+    def test_shrink_minibatch_queue(self, _1, _2, _3):
+        def wait_for_qsize(queue, qsize):
+            for _ in range(100):
+                if queue.qsize() == qsize:
+                    break
+                time.sleep(0.05)
+            # Leave time to the loader threads to overfill the queue
+            time.sleep(0.2)
+            self.assertEqual(queue.qsize(), qsize)
+
+        data = np.random.rand(2, 3, 3).astype(np.float32)
+        loader = RoIDataLoader(
+            get_roidb_sample_data(data), num_loaders=2, minibatch_queue_size=8
+        )
+        queue = loader._minibatch_queue
+        # Only the loader threads: minibatches are dequeued by the test
+        for w in loader._workers:
+            w.start()
+        wait_for_qsize(queue, 8)
+        # Full queue shrunk: no minibatch is queued until it holds fewer than 4
+        loader._set_minibatch_queue_size(4)
+        for _ in range(3):
+            queue.get()
+        wait_for_qsize(queue, 5)
+        for _ in range(3):
+            queue.get()
+        wait_for_qsize(queue, 4)
+        loader.coordinator.request_stop()
+        for w in loader._workers:
+            w.join()
+        self.assertLessEqual(queue.qsize(), 4)
+
 
 if __name__ == '__main__':
     workspace.GlobalInit(['caffe2', '--caffe2_log_level=0'])
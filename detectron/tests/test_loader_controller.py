@@ -0,0 +1,53 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from detectron.roi_data.loader_controller import LoaderController
+
+
+def run_period(controller, qsizes, minibatch_time):
+    """Simulate one period of 10 seconds."""
+    for qsize in qsizes:
+        controller.record_get(qsize)
+        controller.record_minibatch(minibatch_time)
+    return controller.update(10.)
+
+
+class TestLoaderController(unittest.TestCase):
+    def test_input_bound(self):
+        controller = LoaderController(2, 8, 1, 3, 2, 16)
+        # The queue runs empty: add threads up to the maximum
+        self.assertEqual(run_period(controller, [0, 1] * 10, 1.)[:2], (3, 8))
+        self.assertEqual(run_period(controller, [0, 1] * 10, 1.)[:2], (3, 16))
+        _, _, reason = run_period(controller, [0, 1] * 10, 1.)
+        self.assertIsNone(reason)
+        # Bursts with a queue mostly full: deeper queue
+        controller = LoaderController(2, 8, 1, 3, 2, 16)
+        self.assertEqual(run_period(controller, [0, 8, 8, 8], 1.)[:2], (2, 16))
+
+    def test_loaders_ahead(self):
+        controller = LoaderController(4, 16, 1, 8, 2, 16)
+        # 2 minibatches/s consumed, 0.1s per minibatch: 3 threads build 30/s
+        num_threads, queue_size, reason = run_period(controller, [16] * 20, .1)
+        self.assertEqual((num_threads, queue_size), (3, 16))
+        self.assertIn('loaders ahead', reason)
+        # 1s per minibatch: 2 threads would build 2/s, which is too slow
+        self.assertEqual(run_period(controller, [16] * 20, 1.)[:2], (3, 8))
+        # Training not consuming
+        self.assertEqual(controller.update(10.), (3, 8, None))
+        # Half full: no change
+        self.assertIsNone(run_period(controller, [4] * 20, 1.)[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
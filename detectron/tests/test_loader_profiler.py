@@ -0,0 +1,67 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+import time
+import unittest
+
+from detectron.core.config import cfg
+import detectron.roi_data.profiler as profiler
+
+
+class TestLoaderProfiler(unittest.TestCase):
+    def setUp(self):
+        cfg.DATA_LOADER.PROFILE = True
+        profiler.get_stats(reset=True)
+
+    def tearDown(self):
+        cfg.DATA_LOADER.PROFILE = False
+
+    def test_nested_stages(self):
+        def run():
+            for _ in range(5):
+                with profiler.timed('minibatch'):
+                    time.sleep(0.01)
+                    with profiler.timed('decode'):
+                        time.sleep(0.03)
+
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = profiler.get_stats(reset=True)
+        self.assertEqual(stats['decode']['n'], 10)
+        self.assertEqual(stats['minibatch']['n'], 10)
+        # Nested stages are excluded
+        self.assertGreater(stats['decode']['total'], 0.3)
+        self.assertLess(stats['minibatch']['total'], 0.2)
+        # Within the precision of the bins (8 per decade)
+        self.assertGreater(stats['decode']['p50'], 30 / 1.4)
+        self.assertLess(stats['decode']['p90'], 30 * 1.4 * 2)
+        self.assertEqual(profiler.get_bottleneck(stats), 'decode')
+        self.assertEqual(len(profiler.get_stats()), 0)
+
+    def test_waits(self):
+        profiler.add_time('queue_get_wait', 10.)
+        profiler.add_time('enqueue_blobs', 0.1)
+        self.assertEqual(
+            profiler.get_bottleneck(profiler.get_stats()), 'enqueue_blobs'
+        )
+        cfg.DATA_LOADER.PROFILE = False
+        with profiler.timed('decode'):
+            pass
+        self.assertNotIn('decode', profiler.get_stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from detectron.core.config import cfg
+from detectron.core.proposal_cache import ProposalCache
+
+
+class ProposalCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.weights_file = os.path.join(self.cache_dir, 'weights.pkl')
+        with open(self.weights_file, 'wb') as f:
+            f.write(b'weights')
+        cfg.TEST.PROPOSAL_CACHE.DIR = os.path.join(self.cache_dir, 'cache')
+        cfg.TEST.PROPOSAL_CACHE.MAX_SIZE_GB = 1.
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def _get_entry(self, rng):
+        scores = rng.rand(100, 81).astype(np.float32)
+        boxes = rng.rand(100, 4 * 81).astype(np.float32)
+        return scores, boxes, 0.5
+
+    def test_key(self):
+        rng = np.random.RandomState(0)
+        im = rng.randint(0, 256, size=(40, 50, 3)).astype(np.uint8)
+        cache = ProposalCache(None, self.weights_file)
+        key = cache.get_key(im)
+        self.assertEqual(key, cache.get_key(im.copy()))
+        im2 = im.copy()
+        im2[0, 0, 0] += 1
+        self.assertNotEqual(key, cache.get_key(im2))
+        self.assertNotEqual(key, cache.get_key(im, np.zeros((1, 4))))
+
+        # Post-processing options are not part of the key
+        nms = cfg.TEST.NMS
+        cfg.TEST.NMS = nms / 2
+        self.assertEqual(
+            key, ProposalCache(None, self.weights_file).get_key(im)
+        )
+        cfg.TEST.NMS = nms
+        scale = cfg.TEST.SCALE
+        cfg.TEST.SCALE = scale + 1
+        self.assertNotEqual(
+            key, ProposalCache(None, self.weights_file).get_key(im)
+        )
+        cfg.TEST.SCALE = scale
+
+    def test_get_put(self):
+        rng = np.random.RandomState(0)
+        cache = ProposalCache(None, self.weights_file)
+        self.assertIsNone(cache.get('a'))
+        scores, boxes, im_scale = self._get_entry(rng)
+        cache.put('a', scores, boxes, im_scale)
+        entry = ProposalCache(None, self.weights_file).get('a')
+        np.testing.assert_array_equal(entry['scores'], scores)
+        np.testing.assert_array_equal(entry['boxes'], boxes)
+        self.assertEqual(entry['im_scale'], im_scale)
+        self.assertTrue(cache.feed_features(entry))
+
+    def test_lru_eviction(self):
+        rng = np.random.RandomState(0)
+        cache = ProposalCache(None, self.weights_file)
+        cache.put('a', *self._get_entry(rng))
+        cache.put('b', *self._get_entry(rng))
+        # 'a' is used more recently than 'b'
+        t = time.time() - 100
+        os.utime(cache._get_file_name('b'), (t, t))
+        os.utime(cache._get_file_name('a'), (t + 1, t + 1))
+
+        entry_size = os.path.getsize(cache._get_file_name('a'))
+        cfg.TEST.PROPOSAL_CACHE.MAX_SIZE_GB = 2.5 * entry_size / 1024.**3
+        cache = ProposalCache(None, self.weights_file)
+        cache.put('c', *self._get_entry(rng))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+
+if __name__ == '__main__':
+    unittest.main()
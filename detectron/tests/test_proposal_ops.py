@@ -0,0 +1,220 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import unittest
+
+from caffe2.python import core
+from caffe2.python import workspace
+
+from detectron.core.config import cfg
+from detectron.modeling.generate_anchors import generate_anchors
+from detectron.ops.collect_and_distribute_fpn_rpn_proposals \
+    import CollectAndDistributeFpnRpnProposalsOp
+from detectron.ops.generate_proposals import GenerateJointFpnProposalsOp
+from detectron.ops.generate_proposals import GenerateProposalsOp
+import detectron.utils.c2 as c2_utils
+
+
+def get_unique_scores(rng, shape):
+    """Random scores without ties (the order of equal scores may differ
+    between the Python and C++ ops).
+    """
+    size = int(np.prod(shape))
+    return (rng.permutation(size).reshape(shape) / float(size)).astype(
+        np.float32
+    )
+
+
+class ProposalOpsTest(unittest.TestCase):
+    def _run_generate_proposals(self, inputs, anchors, spatial_scale, native):
+        net = core.Net('generate_proposals')
+        blobs_in = ['rpn_cls_probs', 'rpn_bbox_pred', 'im_info']
+        blobs_out = ['rpn_rois', 'rpn_roi_probs']
+        for name, blob in zip(blobs_in, inputs):
+            workspace.FeedBlob(name, blob)
+        if native:
+            net.DetectronGenerateProposals(
+                blobs_in,
+                blobs_out,
+                anchors=anchors.astype(np.float32).ravel().tolist(),
+                spatial_scale=spatial_scale,
+                pre_nms_topN=cfg.TEST.RPN_PRE_NMS_TOP_N,
+                post_nms_topN=cfg.TEST.RPN_POST_NMS_TOP_N,
+                nms_thresh=cfg.TEST.RPN_NMS_THRESH,
+                min_size=float(cfg.TEST.RPN_MIN_SIZE),
+                bbox_xform_clip=float(cfg.BBOX_XFORM_CLIP)
+            )
+        else:
+            net.Python(
+                GenerateProposalsOp(anchors, spatial_scale, False).forward
+            )(blobs_in, blobs_out)
+        workspace.RunNetOnce(net)
+        return [workspace.FetchBlob(b) for b in blobs_out]
+
+    def test_generate_proposals(self):
+        rng = np.random.RandomState(0)
+        num_images, A, H, W = 2, 3, 40, 50
+        stride = 8
+        anchors = generate_anchors(
+            stride=stride, sizes=(64, ), aspect_ratios=(0.5, 1, 2)
+        )
+        scores = get_unique_scores(rng, (num_images, A, H, W))
+        bbox_deltas = (rng.randn(num_images, 4 * A, H, W) * 0.3).astype(
+            np.float32
+        )
+        im_info = np.array(
+            [[H * stride - 5, W * stride - 9, 1.5], [H * stride, 300, 2.]],
+            dtype=np.float32
+        )
+        inputs = [scores, bbox_deltas, im_info]
+        for pre_nms_topN, post_nms_topN, min_size in [
+                (1000, 300, 0), (0, 0, 16)]:
+            cfg.TEST.RPN_PRE_NMS_TOP_N = pre_nms_topN
+            cfg.TEST.RPN_POST_NMS_TOP_N = post_nms_topN
+            cfg.TEST.RPN_MIN_SIZE = min_size
+            rois, roi_probs = self._run_generate_proposals(
+                inputs, anchors, 1. / stride, True
+            )
+            rois_ref, roi_probs_ref = self._run_generate_proposals(
+                inputs, anchors, 1. / stride, False
+            )
+            np.testing.assert_allclose(rois, rois_ref, rtol=1e-5, atol=1e-3)
+            np.testing.assert_array_equal(roi_probs, roi_probs_ref)
+
+    def test_joint_fpn_proposals(self):
+        # Without top-k limits, the joint proposals of each level are the
+        # proposals of the level
+        rng = np.random.RandomState(0)
+        num_images, A, im_height, im_width = 2, 3, 256, 320
+        lvls = range(cfg.FPN.RPN_MIN_LEVEL, cfg.FPN.RPN_MAX_LEVEL + 1)
+        lvl_anchors = [
+            generate_anchors(
+                stride=2**lvl, sizes=(2**(lvl + 3), ),
+                aspect_ratios=(0.5, 1, 2)
+            )
+            for lvl in lvls
+        ]
+        sizes = [(im_height // 2**lvl, im_width // 2**lvl) for lvl in lvls]
+        scores = get_unique_scores(
+            rng, (num_images, A * sum(H * W for H, W in sizes))
+        )
+        for i, (lvl, (H, W)) in enumerate(zip(lvls, sizes)):
+            start = A * sum(h * w for h, w in sizes[:i])
+            workspace.FeedBlob(
+                'rpn_cls_probs_fpn{}'.format(lvl),
+                scores[:, start:start + A * H * W].reshape(
+                    (num_images, A, H, W)
+                )
+            )
+            workspace.FeedBlob(
+                'rpn_bbox_pred_fpn{}'.format(lvl),
+                (rng.randn(num_images, 4 * A, H, W) * 0.3).astype(np.float32)
+            )
+        workspace.FeedBlob(
+            'im_info',
+            np.array(
+                [[im_height, im_width, 1.], [im_height - 7, 200, 1.5]],
+                dtype=np.float32
+            )
+        )
+        blobs_in = (
+            ['rpn_cls_probs_fpn{}'.format(lvl) for lvl in lvls] +
+            ['rpn_bbox_pred_fpn{}'.format(lvl) for lvl in lvls] + ['im_info']
+        )
+        blobs_out = (
+            ['rpn_rois_fpn{}'.format(lvl) for lvl in lvls] +
+            ['rpn_roi_probs_fpn{}'.format(lvl) for lvl in lvls]
+        )
+        cfg.TEST.RPN_PRE_NMS_TOP_N = 0
+        cfg.TEST.RPN_JOINT_PRE_NMS_TOP_N = 0
+        cfg.TEST.RPN_POST_NMS_TOP_N = 0
+        cfg.TEST.RPN_MIN_SIZE = 4
+
+        net = core.Net('generate_joint_fpn_proposals')
+        net.Python(
+            GenerateJointFpnProposalsOp(
+                lvl_anchors, [1. / 2**lvl for lvl in lvls], False
+            ).forward
+        )(blobs_in, blobs_out)
+        workspace.RunNetOnce(net)
+        outputs = [workspace.FetchBlob(b) for b in blobs_out]
+
+        for i, lvl in enumerate(lvls):
+            rois, roi_probs = self._run_generate_proposals(
+                [
+                    workspace.FetchBlob(blobs_in[i]),
+                    workspace.FetchBlob(blobs_in[len(lvls) + i]),
+                    workspace.FetchBlob('im_info')
+                ],
+                lvl_anchors[i], 1. / 2**lvl, False
+            )
+            np.testing.assert_allclose(
+                outputs[i], rois, rtol=1e-5, atol=1e-3
+            )
+            np.testing.assert_array_equal(
+                outputs[len(lvls) + i], roi_probs
+            )
+
+    def test_collect_and_distribute(self):
+        rng = np.random.RandomState(0)
+        rpn_lvls = range(cfg.FPN.RPN_MIN_LEVEL, cfg.FPN.RPN_MAX_LEVEL + 1)
+        roi_lvls = range(cfg.FPN.ROI_MIN_LEVEL, cfg.FPN.ROI_MAX_LEVEL + 1)
+        blobs_in = (
+            ['rpn_rois_fpn{}'.format(l) for l in rpn_lvls] +
+            ['rpn_roi_probs_fpn{}'.format(l) for l in rpn_lvls]
+        )
+        blobs_out = (
+            ['rois'] + ['rois_fpn{}'.format(l) for l in roi_lvls] +
+            ['rois_idx_restore_int32']
+        )
+        probs = get_unique_scores(rng, (len(rpn_lvls) * 500, 1))
+        for i, l in enumerate(rpn_lvls):
+            xy = rng.rand(500, 2) * 600
+            wh = np.exp(rng.rand(500, 2) * 6)
+            batch_inds = rng.randint(0, 2, size=(500, 1))
+            workspace.FeedBlob(
+                'rpn_rois_fpn{}'.format(l),
+                np.hstack((batch_inds, xy, xy + wh)).astype(np.float32)
+            )
+            workspace.FeedBlob(
+                'rpn_roi_probs_fpn{}'.format(l), probs[i * 500:(i + 1) * 500]
+            )
+        cfg.TEST.RPN_POST_NMS_TOP_N = 1000
+
+        net = core.Net('collect_and_distribute')
+        net.DetectronCollectAndDistributeFpnRpnProposals(
+            blobs_in,
+            blobs_out,
+            roi_canonical_scale=cfg.FPN.ROI_CANONICAL_SCALE,
+            roi_canonical_level=cfg.FPN.ROI_CANONICAL_LEVEL,
+            roi_max_level=cfg.FPN.ROI_MAX_LEVEL,
+            roi_min_level=cfg.FPN.ROI_MIN_LEVEL,
+            rpn_post_nms_topN=cfg.TEST.RPN_POST_NMS_TOP_N
+        )
+        workspace.RunNetOnce(net)
+        outputs = [workspace.FetchBlob(b) for b in blobs_out]
+
+        net = core.Net('collect_and_distribute_ref')
+        net.Python(CollectAndDistributeFpnRpnProposalsOp(False).forward)(
+            blobs_in, blobs_out
+        )
+        workspace.RunNetOnce(net)
+        for output, b in zip(outputs, blobs_out):
+            np.testing.assert_array_equal(output, workspace.FetchBlob(b))
+
+
+if __name__ == '__main__':
+    workspace.GlobalInit(['caffe2', '--caffe2_log_level=0'])
+    c2_utils.import_custom_ops()
+    assert 'DetectronGenerateProposals' in workspace.RegisteredOperators()
+    unittest.main()
@@ -0,0 +1,68 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import unittest
+
+from caffe2.proto import caffe2_pb2
+from caffe2.python import core
+
+import detectron.utils.quantization as quant_utils
+
+
+class TestQuantization(unittest.TestCase):
+    def test_quantization_params(self):
+        scale, zero_point = quant_utils.choose_quantization_params(-1., 3.)
+        self.assertAlmostEqual(scale, 4. / 255)
+        self.assertEqual(zero_point, 64)
+        # Zero must be exactly representable
+        self.assertEqual(np.round(0. / scale) + zero_point, zero_point)
+        scale, zero_point = quant_utils.choose_quantization_params(0.5, 2.)
+        self.assertAlmostEqual(scale, 2. / 255)
+        self.assertEqual(zero_point, 0)
+        scale, zero_point = quant_utils.choose_quantization_params(0., 0.)
+        self.assertEqual(scale, 1.)
+
+    def test_quantize_net(self):
+        net = caffe2_pb2.NetDef()
+        net.op.extend([
+            core.CreateOperator('Conv', ['x', 'w1', 'b1'], ['y'], kernel=3),
+            core.CreateOperator('Relu', ['y'], ['y']),
+            core.CreateOperator('Conv', ['y', 'w2', 'b2'], ['z'], kernel=3),
+            core.CreateOperator('Relu', ['z'], ['z']),
+            core.CreateOperator('ConvTranspose', ['z', 'w3', 'b3'], ['out']),
+        ])
+        net.external_output.extend(['out'])
+        op_inds = range(4)
+        blobs = quant_utils.get_blobs_to_observe(net, op_inds)
+        self.assertEqual(blobs, ['x', 'y', 'z'])
+        ranges = {'x': (-1., 1.), 'y': (0., 4.), 'z': (0., 2.)}
+        qnet = quant_utils.quantize_net(net, op_inds, ranges)
+
+        self.assertEqual(
+            [op.type for op in qnet.op],
+            ['Quantize', 'Conv', 'Conv', 'Dequantize', 'ConvTranspose']
+        )
+        self.assertEqual(qnet.op[1].engine, 'DNNLOWP')
+        self.assertEqual(qnet.op[1].input[0], 'x_int8')
+        self.assertEqual(qnet.op[2].input[0], 'y_int8')
+        self.assertEqual(qnet.op[3].output[0], 'z')
+        self.assertEqual(qnet.op[4].input[0], 'z')
+        args = {a.name: a for a in qnet.op[1].arg}
+        self.assertEqual(args['followed_by'].s, b'Relu')
+        self.assertAlmostEqual(args['Y_scale'].f, 4. / 255, places=6)
+        # The original net is not modified
+        self.assertEqual(len(net.op), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
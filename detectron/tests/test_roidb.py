@@ -0,0 +1,204 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from detectron.core.config import cfg
+from detectron.datasets.json_dataset import JsonDataset
+from detectron.datasets.roidb import combined_roidb_for_training
+from detectron.datasets.roidb import get_minibatch_entry
+import detectron.datasets.dataset_catalog as dataset_catalog
+import detectron.utils.keypoints as keypoint_utils
+
+
+def write_coco_json(ann_file, num_images, rng):
+    """Write a small COCO json dataset with random person boxes (half of them
+    with DensePose points).
+    """
+    keypoints, _ = keypoint_utils.get_keypoints()
+    images = []
+    annotations = []
+    for i in range(num_images):
+        images.append(
+            {'id': i + 1, 'file_name': 'im.jpg', 'width': 320, 'height': 240}
+        )
+        for _ in range(rng.randint(1, 4)):
+            x, y = rng.randint(0, 200), rng.randint(0, 100)
+            w, h = rng.randint(20, 100), rng.randint(20, 100)
+            kps = np.zeros((len(keypoints), 3), dtype=np.int32)
+            kps[:, 0] = rng.randint(x, x + w, size=len(keypoints))
+            kps[:, 1] = rng.randint(y, y + h, size=len(keypoints))
+            kps[:, 2] = rng.randint(0, 3, size=len(keypoints))
+            ann = {
+                'id': len(annotations) + 1,
+                'image_id': i + 1,
+                'category_id': 1,
+                'bbox': [x, y, w, h],
+                'area': w * h,
+                'iscrowd': 0,
+                'segmentation': [[x, y, x + w, y, x + w, y + h]],
+                'keypoints': kps.ravel().tolist(),
+            }
+            if len(annotations) % 2 == 0:
+                num_points = rng.randint(0, 20)
+                for k in ['dp_x', 'dp_y', 'dp_U', 'dp_V']:
+                    ann[k] = rng.rand(num_points).tolist()
+                ann['dp_I'] = rng.randint(1, 25, size=num_points).tolist()
+                ann['dp_masks'] = [[] for _ in range(14)]
+            annotations.append(ann)
+    with open(ann_file, 'w') as f:
+        json.dump({
+            'images': images,
+            'annotations': annotations,
+            'categories': [
+                {'id': 1, 'name': 'person', 'keypoints': keypoints}
+            ],
+        }, f)
+
+
+class RoidbTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        open(os.path.join(self.tmp_dir, 'im.jpg'), 'w').close()
+        self.ann_file = os.path.join(self.tmp_dir, 'ann.json')
+        write_coco_json(self.ann_file, 10, np.random.RandomState(0))
+        dataset_catalog._DATASETS['roidb_test'] = {
+            dataset_catalog._IM_DIR: self.tmp_dir,
+            dataset_catalog._ANN_FN: self.ann_file,
+        }
+        cfg.TRAIN.ROIDB_CACHE_DIR = os.path.join(self.tmp_dir, 'cache')
+
+    def tearDown(self):
+        del dataset_catalog._DATASETS['roidb_test']
+        cfg.TRAIN.ROIDB_CACHE = False
+        cfg.TRAIN.FLIP_ON_DEMAND = False
+        cfg.TRAIN.PACKED_ROIDB = False
+        cfg.TRAIN.PACKED_ROIDB_FILE = b''
+        cfg.DATA_LOADER.NUM_ROIDB_WORKERS = 0
+        shutil.rmtree(self.tmp_dir)
+
+    def _num_snapshots(self):
+        return len(os.listdir(cfg.TRAIN.ROIDB_CACHE_DIR))
+
+    def test_roidb_cache(self):
+        cfg.TRAIN.ROIDB_CACHE = True
+        roidb = combined_roidb_for_training('roidb_test', ())
+        self.assertEqual(self._num_snapshots(), 1)
+        cached_roidb = combined_roidb_for_training('roidb_test', ())
+        self.assertEqual(self._num_snapshots(), 1)
+        self.assertEqual(len(roidb), len(cached_roidb))
+        for entry, cached_entry in zip(roidb, cached_roidb):
+            self.assertEqual(sorted(entry.keys()), sorted(cached_entry.keys()))
+            for k in ['boxes', 'gt_classes', 'bbox_targets', 'max_overlaps']:
+                np.testing.assert_array_equal(entry[k], cached_entry[k])
+            self.assertEqual(entry['segms'], cached_entry['segms'])
+            self.assertEqual(entry['flipped'], cached_entry['flipped'])
+            self.assertEqual(
+                entry['dataset'].classes, cached_entry['dataset'].classes
+            )
+
+        # A new snapshot is built when the annotations or the config change
+        write_coco_json(self.ann_file, 10, np.random.RandomState(1))
+        combined_roidb_for_training('roidb_test', ())
+        self.assertEqual(self._num_snapshots(), 2)
+        cfg.TRAIN.USE_FLIPPED = not cfg.TRAIN.USE_FLIPPED
+        combined_roidb_for_training('roidb_test', ())
+        cfg.TRAIN.USE_FLIPPED = not cfg.TRAIN.USE_FLIPPED
+        self.assertEqual(self._num_snapshots(), 3)
+
+    def test_flip_on_demand(self):
+        roidb = combined_roidb_for_training('roidb_test', ())
+        cfg.TRAIN.FLIP_ON_DEMAND = True
+        for cache_size in [0, 4]:
+            cfg.TRAIN.FLIP_ON_DEMAND_CACHE_SIZE = cache_size
+            lazy_roidb = combined_roidb_for_training('roidb_test', ())
+            self.assertEqual(len(roidb), len(lazy_roidb))
+            for entry, lazy_entry in zip(roidb, lazy_roidb):
+                lazy_entry = get_minibatch_entry(lazy_entry)
+                self.assertEqual(
+                    sorted(entry.keys()), sorted(lazy_entry.keys())
+                )
+                for k in ['boxes', 'gt_keypoints', 'gt_classes', 'is_crowd']:
+                    np.testing.assert_array_equal(entry[k], lazy_entry[k])
+                np.testing.assert_allclose(
+                    entry['bbox_targets'], lazy_entry['bbox_targets'],
+                    rtol=1e-4, atol=1e-5
+                )
+                self.assertEqual(entry['segms'], lazy_entry['segms'])
+                self.assertEqual(entry['flipped'], lazy_entry['flipped'])
+
+    def test_packed_roidb(self):
+        cfg.TRAIN.FLIP_ON_DEMAND = True
+        roidb = combined_roidb_for_training('roidb_test', ())
+        cfg.TRAIN.PACKED_ROIDB = True
+        for packed_file in [b'', os.path.join(self.tmp_dir, 'roidb.bin')]:
+            cfg.TRAIN.PACKED_ROIDB_FILE = packed_file
+            packed_roidb = combined_roidb_for_training('roidb_test', ())
+            self.assertEqual(len(roidb), len(packed_roidb))
+            for entry, packed_entry in zip(roidb, packed_roidb):
+                self.assertEqual(
+                    sorted(entry.keys()), sorted(packed_entry.keys())
+                )
+                for k, v in entry.items():
+                    packed_v = packed_entry[k]
+                    if k == 'dataset':
+                        self.assertEqual(v.classes, packed_v.classes)
+                    elif k == 'gt_overlaps':
+                        np.testing.assert_array_equal(
+                            v.toarray(), packed_v.toarray()
+                        )
+                    elif k.startswith('dp_') and k != 'dp_masks':
+                        self.assertEqual(len(v), len(packed_v))
+                        for points, packed_points in zip(v, packed_v):
+                            np.testing.assert_allclose(
+                                points, packed_points, rtol=1e-6
+                            )
+                    elif isinstance(v, np.ndarray):
+                        self.assertEqual(v.dtype, packed_v.dtype)
+                        np.testing.assert_array_equal(v, packed_v)
+                    else:
+                        self.assertEqual(v, packed_v)
+                np.testing.assert_array_equal(
+                    get_minibatch_entry(entry)['boxes'],
+                    get_minibatch_entry(packed_entry)['boxes']
+                )
+
+    def test_parallel_gt_annotations(self):
+        write_coco_json(self.ann_file, 300, np.random.RandomState(0))
+        ds = JsonDataset('roidb_test')
+        roidb = ds.get_roidb(gt=True)
+        cfg.DATA_LOADER.NUM_ROIDB_WORKERS = 3
+        parallel_roidb = ds.get_roidb(gt=True)
+        self.assertEqual(len(roidb), len(parallel_roidb))
+        for entry, parallel_entry in zip(roidb, parallel_roidb):
+            self.assertEqual(
+                sorted(entry.keys()), sorted(parallel_entry.keys())
+            )
+            self.assertIs(parallel_entry['dataset'], ds)
+            for k, v in entry.items():
+                if k == 'gt_overlaps':
+                    np.testing.assert_array_equal(
+                        v.toarray(), parallel_entry[k].toarray()
+                    )
+                elif isinstance(v, np.ndarray):
+                    np.testing.assert_array_equal(v, parallel_entry[k])
+                elif k != 'dataset':
+                    self.assertEqual(v, parallel_entry[k])
+
+
+if __name__ == '__main__':
+    unittest.main()
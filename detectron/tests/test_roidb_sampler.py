@@ -0,0 +1,91 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import unittest
+
+from detectron.roi_data.sampler import _get_scaled_shape
+from detectron.roi_data.sampler import RoidbSampler
+
+
+def get_roidb(num_entries, rng):
+    return [
+        {'width': rng.randint(200, 800), 'height': rng.randint(200, 800)}
+        for _ in range(num_entries)
+    ]
+
+
+class RoidbSamplerTest(unittest.TestCase):
+    def test_epochs(self):
+        roidb = get_roidb(101, np.random.RandomState(0))
+        sampler = RoidbSampler(roidb, 2, 3, True)
+        is_horz = np.array([r['width'] >= r['height'] for r in roidb])
+        epoch_inds = []
+        for _ in range(3):
+            inds = [sampler.next_batch()[1] for _ in range(50)]
+            for batch_inds in inds:
+                # Aspect grouping
+                self.assertEqual(len(set(is_horz[batch_inds])), 1)
+            inds = np.hstack(inds)
+            # No image is used twice in an epoch
+            self.assertEqual(len(set(inds)), len(inds))
+            epoch_inds.append(inds)
+        self.assertFalse(np.array_equal(epoch_inds[0], epoch_inds[1]))
+
+        # Same seed, same order
+        sampler = RoidbSampler(roidb, 2, 3, True)
+        for _ in range(50):
+            sampler.next_batch()
+        np.testing.assert_array_equal(
+            np.hstack([sampler.next_batch()[1] for _ in range(50)]),
+            epoch_inds[1]
+        )
+
+    def test_resume(self):
+        roidb = get_roidb(37, np.random.RandomState(0))
+        sampler = RoidbSampler(roidb, 4, 3, False)
+        valid_inds = []
+        for _ in range(30):
+            batch, inds = sampler.next_batch()
+            if batch % 7 == 3:
+                sampler.set_invalid(batch)
+            else:
+                valid_inds.append(inds)
+        for num_minibatches in [0, 3, 11, 20]:
+            resumed_sampler = RoidbSampler(roidb, 4, 3, False)
+            resumed_sampler.set_state(sampler.get_state(num_minibatches))
+            for inds in valid_inds[num_minibatches:num_minibatches + 5]:
+                batch, resumed_inds = resumed_sampler.next_batch()
+                if batch % 7 == 3:
+                    batch, resumed_inds = resumed_sampler.next_batch()
+                np.testing.assert_array_equal(inds, resumed_inds)
+        self.assertFalse(
+            RoidbSampler(roidb, 2, 3, False).is_compatible(sampler.get_state(0))
+        )
+
+    def test_buckets(self):
+        roidb = get_roidb(200, np.random.RandomState(0))
+        shapes = np.array([_get_scaled_shape(r) for r in roidb])
+        padding = []
+        for num_buckets in [0, 8]:
+            sampler = RoidbSampler(roidb, 2, 3, True, num_buckets)
+            image_pixels, blob_pixels = 0, 0
+            for _ in range(sampler._batches_per_epoch):
+                batch_shapes = shapes[sampler.next_batch()[1]]
+                image_pixels += np.prod(batch_shapes, axis=1).sum()
+                blob_pixels += 2 * np.prod(batch_shapes.max(axis=0))
+            padding.append(1. - image_pixels / float(blob_pixels))
+        self.assertLess(padding[1], padding[0] / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
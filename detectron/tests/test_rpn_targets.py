@@ -0,0 +1,78 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import unittest
+
+from detectron.core.config import cfg
+import detectron.roi_data.data_utils as data_utils
+import detectron.roi_data.rpn as rpn
+import detectron.utils.boxes as box_utils
+
+
+class TestRPNTargets(unittest.TestCase):
+    def test_match_anchors_to_gt_boxes(self):
+        im_height, im_width = 600., 900.
+        foas = [
+            data_utils.get_field_of_anchors(
+                2.**lvl, (32 * 2.**(lvl - 2), ), (0.5, 1, 2)
+            )
+            for lvl in range(2, 7)
+        ]
+        all_anchors = np.concatenate([f.field_of_anchors for f in foas])
+        inds_inside = []
+        offset = 0
+        for foa in foas:
+            inds_inside.append(
+                offset + data_utils.get_inds_inside_field_of_anchors(
+                    foa, im_height, im_width, 0
+                )
+            )
+            offset += foa.field_of_anchors.shape[0]
+        inds_inside = np.concatenate(inds_inside)
+        anchors = all_anchors[inds_inside]
+
+        rng = np.random.RandomState(0)
+        xy = rng.rand(30, 2) * 500
+        wh = rng.rand(30, 2)**2 * 400 + 2
+        gt_boxes = np.hstack((xy, xy + wh)).astype(np.float32)
+        # Same as an anchor (ties) and a tiny box
+        gt_boxes[0] = [16, 16, 47, 47]
+        gt_boxes[1] = [100, 100, 102, 101]
+
+        argmax, max_overlaps, anchors_with_max_overlap = \
+            rpn._match_anchors_to_gt_boxes(
+                foas, all_anchors, inds_inside, anchors, gt_boxes
+            )
+        anchor_by_gt_overlap = box_utils.bbox_overlaps(anchors, gt_boxes)
+        expected_max_overlaps = anchor_by_gt_overlap.max(axis=1)
+        # Overlaps below the smallest threshold may be skipped
+        thresh = cfg.TRAIN.RPN_NEGATIVE_OVERLAP
+        above = expected_max_overlaps >= thresh
+        np.testing.assert_array_equal(
+            max_overlaps[above], expected_max_overlaps[above]
+        )
+        np.testing.assert_array_equal(
+            argmax[above], anchor_by_gt_overlap.argmax(axis=1)[above]
+        )
+        self.assertTrue(np.all(max_overlaps[~above] < thresh))
+        expected_anchors_with_max_overlap = np.where(
+            anchor_by_gt_overlap == anchor_by_gt_overlap.max(axis=0)
+        )[0]
+        np.testing.assert_array_equal(
+            np.unique(anchors_with_max_overlap),
+            np.unique(expected_anchors_with_max_overlap)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
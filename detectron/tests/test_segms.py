@@ -0,0 +1,45 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import unittest
+
+import pycocotools.mask as mask_util
+
+import detectron.utils.segms as segm_utils
+
+
+class TestSegms(unittest.TestCase):
+    def test_box_mask_to_rle(self):
+        rng = np.random.RandomState(0)
+        for height, width, x0, y0, w, h in [
+            (20, 30, 5, 3, 10, 8),
+            # The mask spans the height of the image
+            (20, 30, 5, 0, 10, 20),
+            (20, 30, 0, 0, 30, 20),
+            (20, 30, 29, 19, 1, 1),
+            (20, 30, 7, 4, 0, 0),
+        ]:
+            mask = (rng.rand(h, w) > 0.5).astype(np.uint8)
+            mask[:, :1] = 1
+            im_mask = np.zeros((height, width), dtype=np.uint8)
+            im_mask[y0:y0 + h, x0:x0 + w] = mask
+            rle = mask_util.encode(
+                np.array(im_mask[:, :, np.newaxis], order='F')
+            )[0]
+            box_rle = segm_utils.box_mask_to_rle(mask, x0, y0, height, width)
+            self.assertEqual(box_rle['size'], rle['size'])
+            self.assertEqual(box_rle['counts'], rle['counts'])
+
+
+if __name__ == '__main__':
+    unittest.main()
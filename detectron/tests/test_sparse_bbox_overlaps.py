@@ -0,0 +1,68 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import unittest
+
+import detectron.utils.boxes as box_utils
+
+
+def get_random_boxes(rng, num_boxes, max_size):
+    xy = rng.rand(num_boxes, 2) * 500
+    wh = rng.rand(num_boxes, 2) * max_size
+    return np.round(np.hstack((xy, xy + wh))).astype(np.float32)
+
+
+class TestSparseBBoxOverlaps(unittest.TestCase):
+    def _check_against_dense(self, boxes, query_boxes, thresh):
+        so = box_utils.sparse_bbox_overlaps(boxes, query_boxes, thresh)
+        overlaps = box_utils.bbox_overlaps(boxes, query_boxes)
+        overlaps[overlaps < thresh] = 0
+        sparse_overlaps = np.zeros_like(overlaps)
+        sparse_overlaps[so.inds, so.query_inds] = so.overlaps
+        np.testing.assert_array_equal(sparse_overlaps, overlaps)
+        self.assertEqual(len(so.inds), np.count_nonzero(overlaps))
+        np.testing.assert_array_equal(so.max_overlaps, overlaps.max(axis=1))
+        np.testing.assert_array_equal(so.argmax, overlaps.argmax(axis=1))
+        np.testing.assert_array_equal(
+            so.query_max_overlaps, overlaps.max(axis=0))
+        np.testing.assert_array_equal(
+            so.query_argmax, overlaps.argmax(axis=0))
+
+    def test_sparse_bbox_overlaps(self):
+        rng = np.random.RandomState(0)
+        tile_size = box_utils._OVERLAPS_TILE_SIZE
+        # Use small tiles to have many of them
+        box_utils._OVERLAPS_TILE_SIZE = 16
+        try:
+            for max_size, thresh in [(10, 0.), (50, 0.), (200, 0.5)]:
+                boxes = get_random_boxes(rng, 500, max_size)
+                # Duplicates give ties
+                boxes[250:] = boxes[:250]
+                query_boxes = get_random_boxes(rng, 20, 100)
+                self._check_against_dense(boxes, query_boxes, thresh)
+        finally:
+            box_utils._OVERLAPS_TILE_SIZE = tile_size
+
+    def test_empty(self):
+        boxes = np.zeros((0, 4), dtype=np.float32)
+        query_boxes = np.array([[0, 0, 10, 10]], dtype=np.float32)
+        so = box_utils.sparse_bbox_overlaps(boxes, query_boxes)
+        self.assertEqual(len(so.inds), 0)
+        np.testing.assert_array_equal(so.query_max_overlaps, [0])
+        so = box_utils.sparse_bbox_overlaps(query_boxes, boxes)
+        np.testing.assert_array_equal(so.max_overlaps, [0])
+        np.testing.assert_array_equal(so.argmax, [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
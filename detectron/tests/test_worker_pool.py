@@ -0,0 +1,88 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from detectron.utils.subprocess import WorkerPool
+import detectron.utils.subprocess as subprocess_utils
+
+
+def init_worker(worker_id):
+    return 1000 * (worker_id + 1)
+
+
+def process_item(state, item):
+    if item < 0:
+        raise ValueError('Negative item {}'.format(item))
+    return state + item
+
+
+class TestWorkerPool(unittest.TestCase):
+    def assertNoLiveWorkers(self, pool):
+        self.assertFalse(any(p.is_alive() for p in pool._workers))
+
+    def test_imap_unordered(self):
+        pool = WorkerPool('test', 3, init_worker, process_item)
+        for items in [list(range(50)), list(range(100, 110))]:
+            results = list(pool.imap_unordered(items))
+            # Every item is processed exactly once, by any of the workers
+            self.assertEqual(
+                sorted(i for i, _ in results), list(range(len(items)))
+            )
+            for i, result in results:
+                self.assertIn(result - items[i], (1000, 2000, 3000))
+        pool.close()
+        self.assertNoLiveWorkers(pool)
+
+    def test_interrupted_call(self):
+        pool = WorkerPool('test', 2, init_worker, process_item)
+        next(pool.imap_unordered(list(range(20))))
+        # The results of the items left over by the first call are dropped
+        items = list(range(500, 505))
+        results = list(pool.imap_unordered(items))
+        self.assertEqual(
+            sorted(i for i, _ in results), list(range(len(items)))
+        )
+        for i, result in results:
+            self.assertIn(result - items[i], (1000, 2000))
+        pool.close()
+        self.assertNoLiveWorkers(pool)
+
+    def test_worker_error(self):
+        pool = WorkerPool('test', 2, init_worker, process_item)
+        with self.assertRaises(RuntimeError):
+            list(pool.imap_unordered([1, -1, 2, 3]))
+        pool.terminate()
+        self.assertNoLiveWorkers(pool)
+
+    def test_get_and_close_worker_pool(self):
+        pool = subprocess_utils.get_worker_pool(
+            'test', 'key', init_worker, process_item
+        )
+        self.assertIs(
+            subprocess_utils.get_worker_pool(
+                'test', 'key', init_worker, process_item
+            ), pool
+        )
+        subprocess_utils.close_worker_pool('test', 'key')
+        self.assertNoLiveWorkers(pool)
+        self.assertIsNot(
+            subprocess_utils.get_worker_pool(
+                'test', 'key', init_worker, process_item
+            ), pool
+        )
+        subprocess_utils.close_worker_pools(terminate=True)
+        self.assertEqual(len(subprocess_utils._WORKER_POOLS), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
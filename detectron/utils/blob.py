@@ -23,11 +23,62 @@ from __future__ import unicode_literals
 import cPickle as pickle
 import cv2
 import numpy as np
+import sys
+import threading
 
 from caffe2.proto import caffe2_pb2
 
 from detectron.core.config import cfg
 
+# Number of image pixels and of blob pixels of the blobs built by
+# im_list_to_blob (see get_padding_ratio); updated by the data loader threads
+_padding_stats = [0, 0]
+_padding_stats_lock = threading.Lock()
+
+
+class _BlobPool(object):
+    """Pool of float32 blob buffers keyed by shape (see cfg.IM_BLOB.POOL_SIZE).
+    A buffer is free when the pool holds the only reference to it; buffers are
+    not zeroed when they are reused.
+    """
+
+    def __init__(self):
+        # Least recently returned first
+        self._buffers = []
+        self._lock = threading.Lock()
+
+    def get(self, shape, max_buffers):
+        """Return a free buffer of the given shape, allocating it if needed.
+        Free buffers of other shapes are released, least recently used first,
+        to keep at most max_buffers buffers.
+        """
+        shape = tuple(shape)
+        with self._lock:
+            buffers = self._buffers
+            for i in range(len(buffers)):
+                if buffers[i].shape == shape and self._is_free(buffers, i):
+                    buf = buffers.pop(i)
+                    buffers.append(buf)
+                    return buf
+            i = 0
+            while len(buffers) >= max_buffers and i < len(buffers):
+                if self._is_free(buffers, i):
+                    del buffers[i]
+                else:
+                    i += 1
+            buf = np.empty(shape, dtype=np.float32)
+            if len(buffers) < max_buffers:
+                buffers.append(buf)
+            return buf
+
+    @staticmethod
+    def _is_free(buffers, i):
+        # References: the list of buffers and the argument of getrefcount
+        return sys.getrefcount(buffers[i]) <= 2
+
+
+_blob_pool = _BlobPool()
+
 
 def get_image_blob(im, target_scale, target_max_size):
     """Convert an image into a network input.
@@ -56,15 +107,16 @@ def get_image_blob(im, target_scale, target_max_size):
     return blob, im_scale, im_info.astype(np.float32)
 
 
-def im_list_to_blob(ims):
+def im_list_to_blob(ims, pixel_means=None):
     """Convert a list of images into a network input. Assumes images were
     prepared using prep_im_for_blob or equivalent: i.e.
       - BGR channel order
-      - pixel means subtracted
+      - pixel means subtracted (uint8 images are not: pixel_means, by default
+        cfg.PIXEL_MEANS, are subtracted while they are written into the blob)
       - resized to the desired input size
-      - float32 numpy ndarray format
-    Output is a 4D HCHW tensor of the images concatenated along axis 0 with
-    shape.
+      - float32 (or uint8) numpy ndarray format
+    Output is a contiguous 4D NCHW tensor of the images concatenated along
+    axis 0, taken from the blob buffer pool if cfg.IM_BLOB.POOL_SIZE > 0.
     """
     if not isinstance(ims, list):
         ims = [ims]
@@ -76,16 +128,31 @@ def im_list_to_blob(ims):
         max_shape[1] = int(np.ceil(max_shape[1] / stride) * stride)
 
     num_images = len(ims)
-    blob = np.zeros(
-        (num_images, max_shape[0], max_shape[1], 3), dtype=np.float32
+    _add_padding_stats(
+        sum(im.shape[0] * im.shape[1] for im in ims),
+        num_images * max_shape[0] * max_shape[1]
     )
+    blob = _blob_pool.get(
+        (num_images, 3, int(max_shape[0]), int(max_shape[1])),
+        cfg.IM_BLOB.POOL_SIZE
+    )
+    if pixel_means is None:
+        pixel_means = cfg.PIXEL_MEANS
+    means = np.asarray(pixel_means, dtype=np.float32).reshape((3, 1, 1))
     for i in range(num_images):
         im = ims[i]
-        blob[i, 0:im.shape[0], 0:im.shape[1], :] = im
-    # Move channels (axis 3) to axis 1
-    # Axis order will become: (batch elem, channel, height, width)
-    channel_swap = (0, 3, 1, 2)
-    blob = blob.transpose(channel_swap)
+        h, w = im.shape[0], im.shape[1]
+        # Write the image with its channels moved to axis 0 straight into the
+        # (batch elem, channel, height, width) blob and zero the padding
+        if im.dtype == np.uint8:
+            np.subtract(
+                im.transpose((2, 0, 1)), means,
+                out=blob[i, :, :h, :w], casting='unsafe'
+            )
+        else:
+            blob[i, :, :h, :w] = im.transpose((2, 0, 1))
+        blob[i, :, h:, :] = 0
+        blob[i, :, :h, w:] = 0
     return blob
 
 
@@ -96,16 +163,14 @@ def prep_im_for_blob(im, pixel_means, target_size, max_size):
       - Rescale to each of the specified target size (capped at max_size)
     Returns a list of transformed images, one for each target size. Also returns
     the scale factors that were used to compute each returned image.
+
+    If cfg.IM_BLOB.UINT8_RESIZE is True, a uint8 image is only rescaled and
+    returned as uint8; im_list_to_blob subtracts the pixel means.
     """
-    im = im.astype(np.float32, copy=False)
-    im -= pixel_means
-    im_shape = im.shape
-    im_size_min = np.min(im_shape[0:2])
-    im_size_max = np.max(im_shape[0:2])
-    im_scale = float(target_size) / float(im_size_min)
-    # Prevent the biggest axis from being more than max_size
-    if np.round(im_scale * im_size_max) > max_size:
-        im_scale = float(max_size) / float(im_size_max)
+    if not (cfg.IM_BLOB.UINT8_RESIZE and im.dtype == np.uint8):
+        im = im.astype(np.float32, copy=False)
+        im -= pixel_means
+    im_scale = get_target_scale(im.shape, target_size, max_size)
     im = cv2.resize(
         im,
         None,
@@ -117,6 +182,58 @@ def prep_im_for_blob(im, pixel_means, target_size, max_size):
     return im, im_scale
 
 
+def get_target_scale(im_shape, target_size, max_size):
+    """Scale factor applied by prep_im_for_blob to an image of shape im_shape.
+    """
+    im_size_min = np.min(im_shape[0:2])
+    im_size_max = np.max(im_shape[0:2])
+    im_scale = float(target_size) / float(im_size_min)
+    # Prevent the biggest axis from being more than max_size
+    if np.round(im_scale * im_size_max) > max_size:
+        im_scale = float(max_size) / float(im_size_max)
+    return im_scale
+
+
+def get_shape_buckets(shapes, num_buckets):
+    """Group image shapes (height, width) into buckets of similar shapes, so
+    that the images of a bucket can be batched by im_list_to_blob with little
+    padding. The shapes are sorted by aspect ratio (then by area) and split into
+    num_buckets ranges with the same number of shapes; a range that contains
+    both horizontal and vertical shapes is split in two. Returns a list of
+    arrays of indices into shapes.
+    """
+    shapes = np.array(shapes, dtype=np.float64).reshape((-1, 2))
+    if len(shapes) == 0:
+        return []
+    ratios = shapes[:, 0] / shapes[:, 1]
+    order = np.lexsort((shapes[:, 0] * shapes[:, 1], ratios))
+    num_buckets = max(min(num_buckets, len(shapes)), 1)
+    buckets = []
+    for inds in np.array_split(order, num_buckets):
+        is_vert = ratios[inds] > 1
+        buckets.extend(
+            b for b in [inds[~is_vert], inds[is_vert]] if len(b) > 0
+        )
+    return buckets
+
+
+def get_padding_ratio(reset=False):
+    """Fraction of the pixels of the blobs built by im_list_to_blob that are
+    padding, since the start or the last reset.
+    """
+    with _padding_stats_lock:
+        image_pixels, blob_pixels = _padding_stats
+        if reset:
+            _padding_stats[:] = [0, 0]
+    return 1. - image_pixels / float(blob_pixels) if blob_pixels > 0 else 0.
+
+
+def _add_padding_stats(image_pixels, blob_pixels):
+    with _padding_stats_lock:
+        _padding_stats[0] += image_pixels
+        _padding_stats[1] += blob_pixels
+
+
 def zeros(shape, int32=False):
     """Return a blob of all zeros of the given shape with the correct float or
     int data type.
@@ -37,6 +37,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from collections import namedtuple
 import numpy as np
 
 from detectron.core.config import cfg
@@ -45,6 +46,145 @@ import detectron.utils.cython_nms as cython_nms
 
 bbox_overlaps = cython_bbox.bbox_overlaps
 
+# Approximate number of boxes per tile in sparse_bbox_overlaps
+_OVERLAPS_TILE_SIZE = 4096
+
+# Overlapping pairs returned by sparse_bbox_overlaps: overlaps[i] is the overlap
+# between boxes[inds[i]] and query_boxes[query_inds[i]]. max_overlaps / argmax
+# (per box) and query_max_overlaps / query_argmax (per query box) are the
+# max / argmax of the rows / columns of the dense overlaps matrix
+SparseOverlaps = namedtuple(
+    'SparseOverlaps', [
+        'inds', 'query_inds', 'overlaps', 'max_overlaps', 'argmax',
+        'query_max_overlaps', 'query_argmax'
+    ]
+)
+
+
+def paired_bbox_overlaps(boxes, query_boxes):
+    """Overlaps between boxes[i] and query_boxes[i] for each i (float32 boxes).
+    The arithmetic of cython_bbox.bbox_overlaps is reproduced (the widths and
+    heights are computed in double precision) so that both give the same
+    values.
+    """
+    def extent(x1, x2):
+        return (x2 - x1).astype(np.float64) + 1
+
+    iw = extent(
+        np.maximum(boxes[:, 0], query_boxes[:, 0]),
+        np.minimum(boxes[:, 2], query_boxes[:, 2])
+    ).astype(np.float32)
+    ih = extent(
+        np.maximum(boxes[:, 1], query_boxes[:, 1]),
+        np.minimum(boxes[:, 3], query_boxes[:, 3])
+    ).astype(np.float32)
+    overlaps = np.zeros(len(boxes), dtype=np.float32)
+    inds = np.where((iw > 0) & (ih > 0))[0]
+    boxes = boxes[inds]
+    query_boxes = query_boxes[inds]
+    box_areas = (
+        extent(boxes[:, 0], boxes[:, 2]) * extent(boxes[:, 1], boxes[:, 3])
+    )
+    query_box_areas = (
+        extent(query_boxes[:, 0], query_boxes[:, 2]) *
+        extent(query_boxes[:, 1], query_boxes[:, 3])
+    ).astype(np.float32)
+    inter = iw[inds] * ih[inds]
+    ua = (box_areas + query_box_areas - inter).astype(np.float32)
+    overlaps[inds] = inter / ua
+    return overlaps
+
+
+def sparse_bbox_overlaps(boxes, query_boxes, thresh=0.0):
+    """Sparse version of bbox_overlaps (float32 boxes) that only returns the
+    pairs with an overlap that is > 0 and >= thresh as a SparseOverlaps tuple.
+    The max and argmax fields match those computed from the dense matrix with
+    overlaps below thresh set to 0 (the first index wins ties and a row or
+    column with no overlap has max 0 and argmax 0).
+
+    The boxes are bucketed in a grid of tiles by their center and bbox_overlaps
+    is only run between the boxes of a tile and the query boxes that intersect
+    the tile, so the dense len(boxes) x len(query_boxes) matrix is never
+    built.
+    """
+    max_overlaps = np.zeros(len(boxes), dtype=np.float32)
+    argmax = np.zeros(len(boxes), dtype=np.int64)
+    query_max_overlaps = np.zeros(len(query_boxes), dtype=np.float32)
+    query_argmax = np.zeros(len(query_boxes), dtype=np.int64)
+    inds, query_inds, overlaps = [], [], []
+    for tile_inds in _get_box_tiles(boxes):
+        tile_boxes = boxes[tile_inds]
+        tile_query_inds = np.where(
+            (query_boxes[:, 0] <= tile_boxes[:, 2].max() + 1) &
+            (query_boxes[:, 1] <= tile_boxes[:, 3].max() + 1) &
+            (query_boxes[:, 2] >= tile_boxes[:, 0].min() - 1) &
+            (query_boxes[:, 3] >= tile_boxes[:, 1].min() - 1)
+        )[0]
+        if len(tile_query_inds) == 0:
+            continue
+        tile_overlaps = bbox_overlaps(
+            tile_boxes, query_boxes[tile_query_inds]
+        )
+        tile_overlaps[tile_overlaps < thresh] = 0
+        rows, cols = np.where(tile_overlaps > 0)
+        inds.append(tile_inds[rows])
+        query_inds.append(tile_query_inds[cols])
+        overlaps.append(tile_overlaps[rows, cols])
+        # The indices of a tile are sorted, so the first max of a row or
+        # column of tile_overlaps is the first one of the dense matrix
+        tile_argmax = tile_overlaps.argmax(axis=1)
+        max_overlaps[tile_inds] = tile_overlaps[
+            np.arange(len(tile_inds)), tile_argmax]
+        argmax[tile_inds] = np.where(
+            max_overlaps[tile_inds] > 0, tile_query_inds[tile_argmax], 0
+        )
+        tile_argmax = tile_overlaps.argmax(axis=0)
+        tile_max = tile_overlaps[
+            tile_argmax, np.arange(len(tile_query_inds))]
+        tile_argmax = tile_inds[tile_argmax]
+        prev_max = query_max_overlaps[tile_query_inds]
+        prev_argmax = query_argmax[tile_query_inds]
+        update = (tile_max > prev_max) | (
+            (tile_max == prev_max) & (tile_max > 0) &
+            (tile_argmax < prev_argmax)
+        )
+        query_max_overlaps[tile_query_inds[update]] = tile_max[update]
+        query_argmax[tile_query_inds[update]] = tile_argmax[update]
+    if len(inds) > 0:
+        inds = np.concatenate(inds)
+        query_inds = np.concatenate(query_inds)
+        overlaps = np.concatenate(overlaps)
+    else:
+        inds = np.zeros(0, dtype=np.int64)
+        query_inds = np.zeros(0, dtype=np.int64)
+        overlaps = np.zeros(0, dtype=np.float32)
+    return SparseOverlaps(
+        inds, query_inds, overlaps, max_overlaps, argmax, query_max_overlaps,
+        query_argmax
+    )
+
+
+def _get_box_tiles(boxes):
+    """Split the boxes into groups of at most _OVERLAPS_TILE_SIZE boxes with
+    nearby centers. Returns a list of arrays of box indices.
+    """
+    num_boxes = len(boxes)
+    if num_boxes <= _OVERLAPS_TILE_SIZE:
+        return [np.arange(num_boxes)] if num_boxes > 0 else []
+    # Square grid with about _OVERLAPS_TILE_SIZE boxes per tile
+    grid_size = int(np.ceil(np.sqrt(num_boxes / _OVERLAPS_TILE_SIZE)))
+    ctrs = (boxes[:, 0:2] + boxes[:, 2:4]) * 0.5
+    ctrs_min = ctrs.min(axis=0)
+    tile_size = np.maximum(ctrs.max(axis=0) - ctrs_min, 1) / grid_size
+    tiles = np.minimum(
+        np.floor((ctrs - ctrs_min) / tile_size).astype(np.int64),
+        grid_size - 1
+    )
+    tile_ids = tiles[:, 1] * grid_size + tiles[:, 0]
+    order = np.argsort(tile_ids, kind='mergesort')
+    splits = np.where(np.diff(tile_ids[order]) != 0)[0] + 1
+    return np.split(order, splits)
+
 
 def boxes_area(boxes):
     """Compute the area of an array of boxes."""
@@ -263,42 +403,42 @@ def box_voting(top_dets, all_dets, thresh, scoring_method='ID', beta=1.0):
     all_boxes = all_dets[:, :4]
     all_scores = all_dets[:, 4]
     top_to_all_overlaps = bbox_overlaps(top_boxes, all_boxes)
-    for k in range(top_dets_out.shape[0]):
-        inds_to_vote = np.where(top_to_all_overlaps[k] >= thresh)[0]
-        boxes_to_vote = all_boxes[inds_to_vote, :]
-        ws = all_scores[inds_to_vote]
-        top_dets_out[k, :4] = np.average(boxes_to_vote, axis=0, weights=ws)
-        if scoring_method == 'ID':
-            # Identity, nothing to do
-            pass
-        elif scoring_method == 'TEMP_AVG':
-            # Average probabilities (considered as P(detected class) vs.
-            # P(not the detected class)) after smoothing with a temperature
-            # hyperparameter.
-            P = np.vstack((ws, 1.0 - ws))
-            P_max = np.max(P, axis=0)
-            X = np.log(P / P_max)
-            X_exp = np.exp(X / beta)
-            P_temp = X_exp / np.sum(X_exp, axis=0)
-            P_avg = P_temp[0].mean()
-            top_dets_out[k, 4] = P_avg
-        elif scoring_method == 'AVG':
-            # Combine new probs from overlapping boxes
-            top_dets_out[k, 4] = ws.mean()
-        elif scoring_method == 'IOU_AVG':
-            P = ws
-            ws = top_to_all_overlaps[k, inds_to_vote]
-            P_avg = np.average(P, weights=ws)
-            top_dets_out[k, 4] = P_avg
-        elif scoring_method == 'GENERALIZED_AVG':
-            P_avg = np.mean(ws**beta)**(1.0 / beta)
-            top_dets_out[k, 4] = P_avg
-        elif scoring_method == 'QUASI_SUM':
-            top_dets_out[k, 4] = ws.sum() / float(len(ws))**beta
-        else:
-            raise NotImplementedError(
-                'Unknown scoring method {}'.format(scoring_method)
-            )
+    # All top boxes vote at once: row k of `voters` selects the boxes that
+    # vote for top box k
+    voters = (top_to_all_overlaps >= thresh).astype(all_scores.dtype)
+    num_voters = voters.sum(axis=1)
+    weights = voters * all_scores
+    top_dets_out[:, :4] = (
+        np.dot(weights, all_boxes) / weights.sum(axis=1)[:, np.newaxis]
+    )
+    if scoring_method == 'ID':
+        # Identity, nothing to do
+        pass
+    elif scoring_method == 'TEMP_AVG':
+        # Average probabilities (considered as P(detected class) vs.
+        # P(not the detected class)) after smoothing with a temperature
+        # hyperparameter.
+        P = np.vstack((all_scores, 1.0 - all_scores))
+        P_max = np.max(P, axis=0)
+        X = np.log(P / P_max)
+        X_exp = np.exp(X / beta)
+        P_temp = X_exp / np.sum(X_exp, axis=0)
+        top_dets_out[:, 4] = np.dot(voters, P_temp[0]) / num_voters
+    elif scoring_method == 'AVG':
+        # Combine new probs from overlapping boxes
+        top_dets_out[:, 4] = weights.sum(axis=1) / num_voters
+    elif scoring_method == 'IOU_AVG':
+        ws = voters * top_to_all_overlaps
+        top_dets_out[:, 4] = np.dot(ws, all_scores) / ws.sum(axis=1)
+    elif scoring_method == 'GENERALIZED_AVG':
+        P_avg = (np.dot(voters, all_scores**beta) / num_voters)**(1.0 / beta)
+        top_dets_out[:, 4] = P_avg
+    elif scoring_method == 'QUASI_SUM':
+        top_dets_out[:, 4] = weights.sum(axis=1) / num_voters**beta
+    else:
+        raise NotImplementedError(
+            'Unknown scoring method {}'.format(scoring_method)
+        )
 
     return top_dets_out
 
@@ -310,6 +450,20 @@ def nms(dets, thresh):
     return cython_nms.nms(dets, thresh)
 
 
+def batched_nms(dets, classes, thresh):
+    """Apply classic DPM-style greedy NMS independently to the detections of
+    each class in a single call. `classes` holds the class of each row of
+    `dets`. Returns the indices of the kept detections in increasing order.
+    """
+    if dets.shape[0] == 0:
+        return []
+    return cython_nms.batched_nms(
+        np.ascontiguousarray(dets, dtype=np.float32),
+        np.ascontiguousarray(classes, dtype=np.int32),
+        np.float32(thresh)
+    )
+
+
 def soft_nms(
     dets, sigma=0.5, overlap_thresh=0.3, score_thresh=0.001, method='linear'
 ):
@@ -33,8 +33,11 @@ class Coordinator(object):
     def should_stop(self):
         return self._event.is_set()
 
-    def wait_for_stop(self):
-        return self._event.wait()
+    def wait_for_stop(self, timeout=None):
+        """Wait until a stop is requested (at most `timeout` seconds if not
+        None). Returns True if a stop was requested.
+        """
+        return self._event.wait(timeout)
 
     @contextlib.contextmanager
     def stop_on_exception(self):
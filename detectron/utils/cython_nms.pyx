@@ -86,6 +86,78 @@ def nms(np.ndarray[np.float32_t, ndim=2] dets, np.float32_t thresh):
 
     return np.where(suppressed == 0)[0]
 
+@cython.boundscheck(False)
+@cython.cdivision(True)
+@cython.wraparound(False)
+def batched_nms(
+    np.ndarray[np.float32_t, ndim=2] dets,
+    np.ndarray[np.int32_t, ndim=1] classes,
+    np.float32_t thresh
+):
+    """Same as nms, applied independently to the detections of each class.
+
+    Detections are sorted by (class, decreasing score) so that each class is a
+    contiguous segment and a box is only compared to the lower scoring boxes
+    of its own segment. The whole loop runs without the GIL.
+    """
+    cdef np.ndarray[np.float32_t, ndim=1] x1 = dets[:, 0]
+    cdef np.ndarray[np.float32_t, ndim=1] y1 = dets[:, 1]
+    cdef np.ndarray[np.float32_t, ndim=1] x2 = dets[:, 2]
+    cdef np.ndarray[np.float32_t, ndim=1] y2 = dets[:, 3]
+    cdef np.ndarray[np.float32_t, ndim=1] scores = dets[:, 4]
+
+    cdef np.ndarray[np.float32_t, ndim=1] areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    cdef np.ndarray[np.int_t, ndim=1] order = \
+            np.lexsort((-scores, classes)).astype(np.int)
+
+    cdef int ndets = dets.shape[0]
+    cdef np.ndarray[np.int_t, ndim=1] suppressed = \
+            np.zeros((ndets), dtype=np.int)
+
+    # nominal indices
+    cdef int _i, _j
+    # sorted indices
+    cdef int i, j
+    # class of box i
+    cdef np.int32_t icls
+    # temp variables for box i's (the box currently under consideration)
+    cdef np.float32_t ix1, iy1, ix2, iy2, iarea
+    # variables for computing overlap with box j (lower scoring box)
+    cdef np.float32_t xx1, yy1, xx2, yy2
+    cdef np.float32_t w, h
+    cdef np.float32_t inter, ovr
+
+    with nogil:
+      for _i in range(ndets):
+          i = order[_i]
+          if suppressed[i] == 1:
+              continue
+          icls = classes[i]
+          ix1 = x1[i]
+          iy1 = y1[i]
+          ix2 = x2[i]
+          iy2 = y2[i]
+          iarea = areas[i]
+          for _j in range(_i + 1, ndets):
+              j = order[_j]
+              # End of the segment of class icls
+              if classes[j] != icls:
+                  break
+              if suppressed[j] == 1:
+                  continue
+              xx1 = max(ix1, x1[j])
+              yy1 = max(iy1, y1[j])
+              xx2 = min(ix2, x2[j])
+              yy2 = min(iy2, y2[j])
+              w = max(0.0, xx2 - xx1 + 1)
+              h = max(0.0, yy2 - yy1 + 1)
+              inter = w * h
+              ovr = inter / (iarea + areas[j] - inter)
+              if ovr >= thresh:
+                  suppressed[j] = 1
+
+    return np.where(suppressed == 0)[0]
+
 # ----------------------------------------------------------
 # Soft-NMS: Improving Object Detection With One Line of Code
 # Copyright (c) University of Maryland, College Park
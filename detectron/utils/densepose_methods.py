@@ -56,6 +56,21 @@ class DensePoseMethods:
         x_sym = x_max-x
         #
         return Labels_sym , U_sym , V_sym , x_sym , y_sym , Mask_flipped
+
+    def get_symmetric_body_uv_preds(self, AnnIndex, Index_UV, U_uv, V_uv):
+        ### Mirror symmetric body uv head outputs (R x C x M x M blobs), e.g.
+        ### to map the predictions on a flipped image back to the image.
+        AnnIndex_sym = AnnIndex[:, self.SemanticMaskSymmetries, :, ::-1]
+        Index_UV_sym = Index_UV[:, [0] + self.Index_Symmetry_List, :, ::-1]
+        U_sym = np.zeros(U_uv.shape, dtype=U_uv.dtype)
+        V_sym = np.zeros(V_uv.shape, dtype=V_uv.dtype)
+        for i in range(24):
+            U_loc = (np.clip(U_uv[:, i + 1], 0, 1) * 255).astype(np.int64)
+            V_loc = (np.clip(V_uv[:, i + 1], 0, 1) * 255).astype(np.int64)
+            i_sym = self.Index_Symmetry_List[i]
+            U_sym[:, i_sym] = self.UV_symmetry_transformations['U_transforms'][0, i][V_loc, U_loc]
+            V_sym[:, i_sym] = self.UV_symmetry_transformations['V_transforms'][0, i][V_loc, U_loc]
+        return AnnIndex_sym, Index_UV_sym, U_sym[:, :, :, ::-1], V_sym[:, :, :, ::-1]
     
     
     
@@ -14,9 +14,13 @@ from __future__ import unicode_literals
 
 import cPickle as pickle
 import hashlib
+import json
 import logging
+import mmap
+import numpy as np
 import os
 import re
+import struct
 import sys
 import urllib2
 
@@ -30,6 +34,98 @@ def save_object(obj, file_name):
         pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
 
 
+# Flat weights file format:
+#   magic (8 bytes) | header length H (uint64, little endian) | header (H bytes)
+#   | padding | tensor data
+# The header is a json dict {'cfg': <yaml cfg or None>, 'index': {name: {
+# 'dtype', 'shape', 'offset'}}}; offsets are relative to the start of the data
+# section. The data section and every tensor are aligned to
+# _FLAT_WEIGHTS_ALIGNMENT bytes so that tensors can be used directly from a
+# memory mapping of the file.
+_FLAT_WEIGHTS_MAGIC = b'DPFLATW1'
+_FLAT_WEIGHTS_ALIGNMENT = 64
+
+
+def _align(offset):
+    a = _FLAT_WEIGHTS_ALIGNMENT
+    return (offset + a - 1) // a * a
+
+
+def save_flat_weights(blobs, file_name, cfg_yaml=None):
+    """Save a dict of ndarrays (e.g., the 'blobs' of a weights file) in the
+    flat weights format (see load_flat_weights).
+    """
+    index = {}
+    arrays = []
+    offset = 0
+    for name in sorted(blobs.keys()):
+        if not isinstance(blobs[name], np.ndarray):
+            logger.warning(
+                'Blob {} with type {} is not saved in the flat weights '
+                'file'.format(name, type(blobs[name])))
+            continue
+        blob = np.ascontiguousarray(blobs[name])
+        offset = _align(offset)
+        index[name] = {
+            'dtype': blob.dtype.str,
+            'shape': list(blob.shape),
+            'offset': offset
+        }
+        arrays.append((offset, blob))
+        offset += blob.nbytes
+    header = json.dumps({'cfg': cfg_yaml, 'index': index}).encode('utf-8')
+    data_start = _align(len(_FLAT_WEIGHTS_MAGIC) + 8 + len(header))
+
+    file_name = os.path.abspath(file_name)
+    tmp_file_name = file_name + '.tmp'
+    with open(tmp_file_name, 'wb') as f:
+        f.write(_FLAT_WEIGHTS_MAGIC)
+        f.write(struct.pack(b'<Q', len(header)))
+        f.write(header)
+        for blob_offset, blob in arrays:
+            f.seek(data_start + blob_offset)
+            f.write(blob.tobytes())
+    # Readers memory mapping the previous version of the file are not affected
+    os.rename(tmp_file_name, file_name)
+
+
+def is_flat_weights_file(file_name):
+    with open(file_name, 'rb') as f:
+        return f.read(len(_FLAT_WEIGHTS_MAGIC)) == _FLAT_WEIGHTS_MAGIC
+
+
+def load_flat_weights(file_name):
+    """Load a weights file saved with save_flat_weights. Returns a dict with the
+    same 'cfg' and 'blobs' keys as a pickled weights file ('cfg' is left out if
+    the file was saved without a cfg, e.g., ImageNet weights). The blobs are
+    read-only ndarrays backed by a memory mapping of the file: nothing is read
+    until a blob is used and the pages are shared by all processes that load
+    the same file.
+    """
+    with open(file_name, 'rb') as f:
+        magic = f.read(len(_FLAT_WEIGHTS_MAGIC))
+        assert magic == _FLAT_WEIGHTS_MAGIC, \
+            '{} is not a flat weights file'.format(file_name)
+        header_len = struct.unpack(b'<Q', f.read(8))[0]
+        header = json.loads(f.read(header_len).decode('utf-8'))
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data_start = _align(len(_FLAT_WEIGHTS_MAGIC) + 8 + header_len)
+    blobs = {}
+    for name, info in header['index'].items():
+        dtype = np.dtype(str(info['dtype']))
+        shape = tuple(info['shape'])
+        count = int(np.prod(shape))
+        if count == 0:
+            blobs[name] = np.zeros(shape, dtype=dtype)
+            continue
+        blobs[name] = np.frombuffer(
+            buf, dtype=dtype, count=count, offset=data_start + info['offset']
+        ).reshape(shape)
+    if header['cfg'] is None:
+        return {'blobs': blobs}
+    return {'cfg': header['cfg'], 'blobs': blobs}
+
+
 def cache_url(url_or_file, cache_dir):
     """Download the file specified by the URL to the cache_dir and return the
     path to the cached file. If the argument is not a URL, simply return it as
@@ -127,6 +223,15 @@ def _get_file_md5sum(file_name):
     return hash_obj.hexdigest()
 
 
+def get_file_sha1sum(file_name):
+    """Compute the sha1 hash of a (possibly large) file."""
+    hash_obj = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            hash_obj.update(chunk)
+    return hash_obj.hexdigest()
+
+
 def _get_reference_md5sum(url):
     """By convention the md5 hash for url is stored in url + '.md5sum'."""
     url_md5sum = url + '.md5sum'
@@ -149,6 +149,70 @@ def heatmaps_to_keypoints(maps, rois):
     return xy_preds
 
 
+def heatmaps_to_keypoints_fast(maps, rois):
+    """Fast approximation of heatmaps_to_keypoints computed for all RoIs at
+    once (same output). Heatmaps are not resized to the RoI size: the argmax of
+    each heatmap is refined to sub-pixel accuracy by fitting a quadratic to its
+    3x3 neighborhood, and the probability of the peak is computed as if the
+    heatmap had been resized (each heatmap pixel is counted with the area it
+    would cover in the resized heatmap).
+    """
+    num_rois, num_keypoints, map_height, map_width = maps.shape
+    widths = rois[:, 2] - rois[:, 0]
+    heights = rois[:, 3] - rois[:, 1]
+    widths = np.maximum(widths, 1)
+    heights = np.maximum(heights, 1)
+    min_size = cfg.KRCNN.INFERENCE_MIN_SIZE
+    roi_map_widths = np.maximum(np.ceil(widths), min_size)
+    roi_map_heights = np.maximum(np.ceil(heights), min_size)
+
+    pos = maps.reshape(num_rois, num_keypoints, -1).argmax(axis=2)
+    x_int = pos % map_width
+    y_int = pos // map_width
+    roi_inds = np.arange(num_rois)[:, np.newaxis]
+    kp_inds = np.arange(num_keypoints)[np.newaxis, :]
+    peaks = maps[roi_inds, kp_inds, y_int, x_int]
+
+    def refine(prev_values, next_values, interior):
+        # Offset and value of the vertex of the parabola through the peak and
+        # its neighbors. Peaks on the heatmap border are not refined.
+        b = (next_values - prev_values) / 2.
+        a = (next_values + prev_values) / 2. - peaks
+        # a < 0 unless the neighbors are equal to the peak
+        valid = interior & (a < 0)
+        d = np.where(valid, -b / np.where(valid, 2. * a, -1.), 0.)
+        d = np.clip(d, -0.5, 0.5)
+        return d, b * d / 2.
+
+    # Neighbors are clamped to the heatmap
+    dx, dx_logit = refine(
+        maps[roi_inds, kp_inds, y_int, np.maximum(x_int - 1, 0)],
+        maps[roi_inds, kp_inds, y_int, np.minimum(x_int + 1, map_width - 1)],
+        (x_int > 0) & (x_int < map_width - 1)
+    )
+    dy, dy_logit = refine(
+        maps[roi_inds, kp_inds, np.maximum(y_int - 1, 0), x_int],
+        maps[roi_inds, kp_inds, np.minimum(y_int + 1, map_height - 1), x_int],
+        (y_int > 0) & (y_int < map_height - 1)
+    )
+    logits = peaks + dx_logit + dy_logit
+    pixel_areas = roi_map_widths * roi_map_heights / (map_width * map_height)
+    probs = 1. / (
+        np.exp(maps - logits[:, :, np.newaxis, np.newaxis]).sum(axis=(2, 3)) *
+        pixel_areas[:, np.newaxis]
+    )
+
+    xy_preds = np.zeros((num_rois, 4, num_keypoints), dtype=np.float32)
+    # Same continuous coordinates as in heatmaps_to_keypoints
+    xy_preds[:, 0, :] = (x_int + dx + 0.5) * \
+        (widths / map_width)[:, np.newaxis] + rois[:, 0:1]
+    xy_preds[:, 1, :] = (y_int + dy + 0.5) * \
+        (heights / map_height)[:, np.newaxis] + rois[:, 1:2]
+    xy_preds[:, 2, :] = logits
+    xy_preds[:, 3, :] = probs
+    return xy_preds
+
+
 def keypoints_to_heatmap_labels(keypoints, rois):
     """Encode keypoint location in the target heatmap for use in
     SoftmaxWithLoss.
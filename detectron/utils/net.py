@@ -25,6 +25,8 @@ from caffe2.python import workspace
 
 from detectron.core.config import cfg
 from detectron.core.config import load_cfg
+from detectron.utils.io import is_flat_weights_file
+from detectron.utils.io import load_flat_weights
 from detectron.utils.io import save_object
 import detectron.utils.c2 as c2_utils
 
@@ -41,17 +43,27 @@ def initialize_from_weights_file(model, weights_file, broadcast=True):
         broadcast_parameters(model)
 
 
-def initialize_gpu_from_weights_file(model, weights_file, gpu_id=0):
+def initialize_gpu_from_weights_file(
+    model, weights_file, gpu_id=0, cpu=False
+):
     """Initialize a network with ops on a specific GPU.
 
     If you use CUDA_VISIBLE_DEVICES to target specific GPUs, Caffe2 will
     automatically map logical GPU ids (starting from 0) to the physical GPUs
     specified in CUDA_VISIBLE_DEVICES.
+
+    If cpu is True, the weights are loaded into CPU memory under the name scope
+    of GPU gpu_id instead (for nets that run on CPU, see modeling.fused_net).
     """
     logger.info('Loading weights from: {}'.format(weights_file))
     ws_blobs = workspace.Blobs()
-    with open(weights_file, 'r') as f:
-        src_blobs = pickle.load(f)
+    if is_flat_weights_file(weights_file):
+        # Memory mapped float32 blobs: no unpickling and no copies before the
+        # blobs are fed to the workspace (astype below is a no-op)
+        src_blobs = load_flat_weights(weights_file)
+    else:
+        with open(weights_file, 'r') as f:
+            src_blobs = pickle.load(f)
     if 'cfg' in src_blobs:
         saved_cfg = load_cfg(src_blobs['cfg'])
         configure_bbox_reg_weights(model, saved_cfg)
@@ -63,7 +75,8 @@ def initialize_gpu_from_weights_file(model, weights_file, gpu_id=0):
     unscoped_param_names = OrderedDict()  # Print these out in model order
     for blob in model.params:
         unscoped_param_names[c2_utils.UnscopeName(str(blob))] = True
-    with c2_utils.NamedCudaScope(gpu_id):
+    device_scope = c2_utils.CpuScope() if cpu else c2_utils.CudaScope(gpu_id)
+    with c2_utils.GpuNameScope(gpu_id), device_scope:
         for unscoped_param_name in unscoped_param_names.keys():
             if (unscoped_param_name.find(']_') >= 0 and
                     unscoped_param_name not in src_blobs):
@@ -0,0 +1,165 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Post-training int8 quantization of Caffe2 nets.
+
+Activation ranges are collected by running the float net on calibration data
+(ActivationRangeObserver). The quantized net uses the Caffe2 DNNLOWP engine
+(uint8 activations, weights quantized by the operators on their first run) with
+static output quantization parameters derived from the collected ranges. Chains
+of quantized ops exchange int8 tensors; Quantize / Dequantize ops are inserted
+at the boundaries with the float ops.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import copy
+import numpy as np
+
+from caffe2.python import core
+from caffe2.python import utils as c2_py_utils
+from caffe2.python import workspace
+
+# Op types that are converted to the DNNLOWP engine
+QUANTIZABLE_OP_TYPES = ['Conv']
+
+
+class ActivationRangeObserver(object):
+    """Track the min / max values taken by a set of blobs."""
+
+    def __init__(self, blob_names):
+        self.blob_names = list(blob_names)
+        self.ranges = {}
+
+    def observe(self):
+        """Update the ranges with the current values of the blobs in the
+        workspace (i.e., call this after each run of the calibrated net).
+        """
+        for name in self.blob_names:
+            x = workspace.FetchBlob(name)
+            if x.size == 0:
+                continue
+            min_val, max_val = float(x.min()), float(x.max())
+            if name in self.ranges:
+                min_val = min(min_val, self.ranges[name][0])
+                max_val = max(max_val, self.ranges[name][1])
+            self.ranges[name] = (min_val, max_val)
+
+
+def choose_quantization_params(min_val, max_val, precision=8):
+    """Return the (scale, zero_point) of the asymmetric uint8 quantization of
+    the range [min_val, max_val]. The range is extended to include 0 so that 0
+    (e.g., zero padding) is exactly representable.
+    """
+    min_val = min(min_val, 0.)
+    max_val = max(max_val, 0.)
+    qmax = 2**precision - 1
+    scale = (max_val - min_val) / qmax
+    if scale == 0:
+        scale = 1.
+    zero_point = int(np.clip(np.round(-min_val / scale), 0, qmax))
+    return float(scale), zero_point
+
+
+def get_blobs_to_observe(net, op_inds):
+    """Blobs whose ranges are needed to quantize the ops op_inds of net."""
+    blob_names = []
+    for i in op_inds:
+        op = net.op[i]
+        if op.type not in QUANTIZABLE_OP_TYPES:
+            continue
+        for name in [op.input[0], op.output[0]]:
+            if name not in blob_names:
+                blob_names.append(name)
+    return blob_names
+
+
+def quantize_net(net, op_inds, ranges, name=None):
+    """Return a copy of the NetDef `net` where the quantizable ops among the
+    ops with indices op_inds run in int8. A Relu applied in-place to the output
+    of a quantized op is fused into it. `ranges` maps the blobs returned by
+    get_blobs_to_observe to their (min, max) values.
+    """
+    net = copy.deepcopy(net)
+    if name is not None:
+        net.name = name
+    op_inds = set(op_inds)
+    int8_blobs = set()
+    fused_relu_inds = set()
+    ops = []
+
+    def _int8_name(blob_name):
+        return blob_name + '_int8'
+
+    def _qparams(blob_name):
+        assert blob_name in ranges, \
+            'No activation range for blob {}'.format(blob_name)
+        scale, zero_point = choose_quantization_params(*ranges[blob_name])
+        return dict(Y_scale=scale, Y_zero_point=zero_point)
+
+    for i, op in enumerate(net.op):
+        is_quantized = i in op_inds and op.type in QUANTIZABLE_OP_TYPES
+        if i in fused_relu_inds:
+            # Fused into the producing op (see followed_by below)
+            continue
+        # Convert the inputs to the representation expected by the op
+        for j, blob_in in enumerate(op.input):
+            if is_quantized and j == 0:
+                if blob_in not in int8_blobs:
+                    ops.append(core.CreateOperator(
+                        'Quantize', [blob_in], [_int8_name(blob_in)],
+                        engine='DNNLOWP', device_option=op.device_option,
+                        **_qparams(blob_in)
+                    ))
+                    int8_blobs.add(blob_in)
+                op.input[j] = _int8_name(blob_in)
+            elif blob_in in int8_blobs:
+                ops.append(core.CreateOperator(
+                    'Dequantize', [_int8_name(blob_in)], [blob_in],
+                    engine='DNNLOWP', device_option=op.device_option
+                ))
+                int8_blobs.remove(blob_in)
+        if is_quantized:
+            blob_out = op.output[0]
+            op.output[0] = _int8_name(blob_out)
+            op.engine = 'DNNLOWP'
+            qparams = _qparams(blob_out)
+            op.arg.extend([
+                c2_py_utils.MakeArgument(k, v) for k, v in qparams.items()
+            ])
+            if _is_followed_by_inplace_relu(net, i, blob_out):
+                op.arg.extend(
+                    [c2_py_utils.MakeArgument('followed_by', 'Relu')]
+                )
+                fused_relu_inds.add(i + 1)
+            int8_blobs.add(blob_out)
+        else:
+            # A float op overwriting a blob invalidates its int8 version
+            int8_blobs.difference_update(op.output)
+        ops.append(op)
+
+    # Blobs that are read after the net (external outputs) must be float
+    for blob_name in net.external_output:
+        if blob_name in int8_blobs:
+            ops.append(core.CreateOperator(
+                'Dequantize', [_int8_name(blob_name)], [blob_name],
+                engine='DNNLOWP', device_option=ops[-1].device_option
+            ))
+    del net.op[:]
+    net.op.extend(ops)
+    return net
+
+
+def _is_followed_by_inplace_relu(net, i, blob_name):
+    return (
+        i + 1 < len(net.op) and net.op[i + 1].type == 'Relu' and
+        net.op[i + 1].input[0] == blob_name and
+        net.op[i + 1].output[0] == blob_name
+    )
@@ -267,3 +267,30 @@ def rle_masks_to_boxes(masks):
         boxes[i, :] = (x0, y0, x1, y1)
 
     return boxes, np.where(keep)[0]
+
+
+def box_mask_to_rle(mask, x0, y0, height, width):
+    """RLE encoding of a height x width image that is zero everywhere except
+    where the binary mask `mask` is pasted with its top left corner at
+    (x0, y0) (the mask must fit in the image). Same as encoding the full image
+    with mask_util.encode, but the full image is never built.
+    """
+    # Pixels are run length encoded in column-major order: find the start and
+    # end (exclusive) of the runs of ones of each column of the mask. They
+    # alternate because each column is padded with zeros.
+    padded_mask = np.zeros((mask.shape[1], mask.shape[0] + 2), dtype=np.int8)
+    padded_mask[:, 1:-1] = mask.T
+    cols, rows = np.nonzero(np.diff(padded_mask, axis=1))
+    inds = (x0 + cols) * height + y0 + rows
+    # If the mask spans the height of the image, a run ending at the bottom of
+    # a column continues at the top of the next column
+    merged = np.zeros(len(inds), dtype=np.bool_)
+    merged[1:-1:2] = merged[2::2] = inds[1:-1:2] == inds[2::2]
+    inds = inds[~merged]
+    # Counts alternate between zeros and ones, starting with zeros
+    counts = np.diff(np.hstack(([0], inds, [height * width])))
+    if len(inds) > 0 and inds[-1] == height * width:
+        counts = counts[:-1]
+    return mask_util.frPyObjects(
+        {'size': [height, width], 'counts': counts.tolist()}, height, width
+    )
@@ -8,6 +8,10 @@
 """Primitives for running multiple single-GPU jobs in parallel over subranges of
 data. These are used for running multi-GPU inference. Subprocesses are used to
 avoid the GIL since inference may involve non-trivial amounts of Python code.
+
+WorkerPool is an alternative to process_in_parallel: a pool of persistent
+worker processes (on GPU or CPU) that pull work items one at a time from a
+shared queue, which balances the load between the workers.
 """
 
 from __future__ import absolute_import
@@ -15,7 +19,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import atexit
+import multiprocessing
 import os
+import select
+import traceback
 import yaml
 import numpy as np
 import subprocess
@@ -123,3 +131,175 @@ def log_subprocess_output(i, p, output_dir, tag, start, end):
         with open(outfile, 'r') as f:
             print(''.join(f.readlines()))
     assert ret == 0, 'Range subprocess failed (exit code: {})'.format(ret)
+
+
+class WorkerPool(object):
+    """Pool of persistent worker processes.
+
+    Each worker calls `init_func(worker_id)` once (e.g., to load a model on the
+    GPU assigned to the worker) and then repeatedly pulls a work item from a
+    queue shared by all workers, calls `process_func(state, item)` with the
+    state returned by init_func and sends the result back to the parent over
+    its own pipe. Workers are forked, so init_func and process_func do not need
+    to be picklable; the work items and the results do.
+    """
+
+    # Seconds between checks that the workers are still alive while waiting for
+    # results
+    _POLL_INTERVAL = 10.
+
+    def __init__(self, tag, num_workers, init_func, process_func):
+        self.tag = tag
+        self._task_queue = multiprocessing.Queue()
+        # Id of the current imap_unordered call: the results of the work items
+        # left over by an interrupted call are dropped
+        self._call_id = 0
+        self._workers = []
+        self._conns = []
+        for worker_id in range(num_workers):
+            conn_recv, conn_send = multiprocessing.Pipe(duplex=False)
+            p = multiprocessing.Process(
+                target=_worker_loop,
+                args=(
+                    worker_id, init_func, process_func, self._task_queue,
+                    conn_send
+                )
+            )
+            p.daemon = True
+            p.start()
+            # Only the worker writes to the pipe
+            conn_send.close()
+            self._workers.append(p)
+            self._conns.append(conn_recv)
+        logger.info('{} pool: started {} workers'.format(tag, num_workers))
+
+    def imap_unordered(self, items):
+        """Process the work items in the pool. Yields (index of the item,
+        result) pairs in the order in which the results are received.
+        """
+        self._call_id += 1
+        call_id = self._call_id
+        for i, item in enumerate(items):
+            self._task_queue.put((call_id, i, item))
+        num_pending = len(items)
+        while num_pending > 0:
+            ready, _, _ = select.select(
+                self._conns, [], [], self._POLL_INTERVAL
+            )
+            if len(ready) == 0:
+                self._check_workers()
+                continue
+            for conn in ready:
+                try:
+                    msg = conn.recv()
+                except EOFError:
+                    self._check_workers()
+                    raise
+                kind, worker_id, payload = msg
+                if kind == 'error':
+                    raise RuntimeError(
+                        '{} pool: worker {} failed:\n{}'.format(
+                            self.tag, worker_id, payload
+                        )
+                    )
+                result_call_id, i, result = payload
+                if result_call_id != call_id:
+                    continue
+                num_pending -= 1
+                yield i, result
+
+    def close(self):
+        """Stop the workers."""
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for p in self._workers:
+            p.join()
+        for conn in self._conns:
+            conn.close()
+
+    def terminate(self):
+        """Stop the workers without waiting for their pending work items."""
+        for p in self._workers:
+            p.terminate()
+            p.join()
+        for conn in self._conns:
+            conn.close()
+
+    def _check_workers(self):
+        for worker_id, p in enumerate(self._workers):
+            assert p.is_alive(), \
+                '{} pool: worker {} died (exit code: {})'.format(
+                    self.tag, worker_id, p.exitcode
+                )
+
+
+def _worker_loop(worker_id, init_func, process_func, task_queue, conn):
+    try:
+        state = init_func(worker_id)
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            call_id, i, item = task
+            conn.send(
+                ('result', worker_id, (call_id, i, process_func(state, item)))
+            )
+    except Exception:
+        conn.send(('error', worker_id, traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+_WORKER_POOLS = {}
+
+
+def get_worker_pool(tag, key, init_func, process_func):
+    """Return the persistent worker pool for `key` (e.g., a weights file),
+    starting it with get_num_pool_workers() workers if needed. The workers of a
+    pool are reused across calls, e.g., when testing on several datasets.
+    """
+    if (tag, key) not in _WORKER_POOLS:
+        _WORKER_POOLS[(tag, key)] = WorkerPool(
+            tag, get_num_pool_workers(), init_func, process_func
+        )
+    return _WORKER_POOLS[(tag, key)]
+
+
+def close_worker_pool(tag, key, terminate=False):
+    """Stop the workers of the pool started by get_worker_pool for `key`, if
+    any. With terminate, pending work items are dropped (e.g., after a failure,
+    when the pool may be left with a dead worker).
+    """
+    pool = _WORKER_POOLS.pop((tag, key), None)
+    if pool is None:
+        return
+    if terminate:
+        pool.terminate()
+    else:
+        pool.close()
+
+
+def close_worker_pools(terminate=False):
+    """Stop the workers of all the pools started by get_worker_pool."""
+    for tag, key in list(_WORKER_POOLS.keys()):
+        close_worker_pool(tag, key, terminate=terminate)
+
+
+# The workers are not left running after an error in the parent process
+atexit.register(close_worker_pools, terminate=True)
+
+
+def get_num_pool_workers():
+    """Number of workers of a pool (see cfg.TEST.WORKER_POOL)."""
+    if cfg.TEST.WORKER_POOL.NUM_WORKERS > 0:
+        return cfg.TEST.WORKER_POOL.NUM_WORKERS
+    return cfg.NUM_GPUS
+
+
+def get_pool_worker_gpu_id(worker_id):
+    """GPU used by a pool worker. The gpu id only selects the name scope of the
+    model for CPU workers (TEST.FUSED_NET).
+    """
+    if cfg.TEST.FUSED_NET:
+        return 0
+    return worker_id % cfg.NUM_GPUS
@@ -21,6 +21,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import cv2  # NOQA (Must import before importing caffe2 due to bug in cv2)
+import cPickle as pickle
 import logging
 import numpy as np
 import os
@@ -34,6 +35,7 @@ from detectron.core.config import get_output_dir
 from detectron.datasets.roidb import combined_roidb_for_training
 from detectron.modeling import model_builder
 from detectron.utils import lr_policy
+from detectron.utils.io import save_object
 from detectron.utils.training_stats import TrainingStats
 import detectron.utils.env as envu
 import detectron.utils.net as nu
@@ -47,7 +49,7 @@ def train_model():
         # The final model was found in the output directory, so nothing to do
         return checkpoints
 
-    setup_model_for_training(model, weights_file, output_dir)
+    setup_model_for_training(model, weights_file, output_dir, start_iter)
     training_stats = TrainingStats(model)
     CHECKPOINT_PERIOD = int(cfg.TRAIN.SNAPSHOT_ITERS / cfg.NUM_GPUS)
 
@@ -66,6 +68,10 @@ def train_model():
                 output_dir, 'model_iter{}.pkl'.format(cur_iter)
             )
             nu.save_model_to_weights_file(checkpoints[cur_iter], model)
+            save_object(
+                model.roi_data_loader.get_sampler_state(cur_iter + 1),
+                get_loader_state_file(checkpoints[cur_iter])
+            )
 
         if cur_iter == start_iter + training_stats.LOG_PERIOD:
             # Reset the iteration timer to remove outliers from the first few
@@ -143,10 +149,15 @@ def optimize_memory(model):
         )
 
 
-def setup_model_for_training(model, weights_file, output_dir):
+def setup_model_for_training(model, weights_file, output_dir, start_iter=0):
     """Loaded saved weights and create the network in the C2 workspace."""
     logger = logging.getLogger(__name__)
     add_model_training_inputs(model)
+    if start_iter > 0:
+        # Resume the data order where the checkpoint was saved
+        model.roi_data_loader.set_sampler_state(
+            load_loader_state(weights_file), num_iters=start_iter
+        )
 
     if weights_file:
         # Override random weight initialization with weights from a saved model
@@ -176,6 +187,22 @@ def add_model_training_inputs(model):
     model_builder.add_training_inputs(model, roidb=roidb)
 
 
+def get_loader_state_file(weights_file):
+    """File with the data loader state saved with a checkpoint."""
+    return os.path.splitext(weights_file)[0] + '_loader.pkl'
+
+
+def load_loader_state(weights_file):
+    """Data loader state saved with a checkpoint, or None if there is none
+    (e.g., for checkpoints saved by older versions).
+    """
+    loader_state_file = get_loader_state_file(weights_file)
+    if not os.path.exists(loader_state_file):
+        return None
+    with open(loader_state_file, 'rb') as f:
+        return pickle.load(f)
+
+
 def dump_proto_files(model, output_dir):
     """Save prototxt descriptions of the training network and parameter
     initialization network."""
@@ -21,6 +21,8 @@ from detectron.core.config import cfg
 from detectron.utils.logging import log_json_stats
 from detectron.utils.logging import SmoothedValue
 from detectron.utils.timer import Timer
+import detectron.roi_data.profiler as loader_profiler
+import detectron.utils.blob as blob_utils
 import detectron.utils.net as nu
 
 
@@ -95,8 +97,17 @@ class TrainingStats(object):
             mb_qsize=int(
                 np.round(self.smoothed_mb_qsize.GetMedianValue())
             ),
-            mem=int(np.ceil(mem_usage / 1024 / 1024))
+            mem=int(np.ceil(mem_usage / 1024 / 1024)),
+            # Padding ratio of the image blobs since the last log
+            padding=blob_utils.get_padding_ratio(reset=True)
         )
+        if cfg.DATA_LOADER.PROFILE:
+            # Data loader stage times since the last log
+            loader_stats = loader_profiler.get_stats(reset=True)
+            stats['loader_stages'] = loader_stats
+            stats['loader_bottleneck'] = loader_profiler.get_bottleneck(
+                loader_stats
+            )
         for k, v in self.smoothed_losses_and_metrics.items():
             stats[k] = v.GetMedianValue()
         return stats
@@ -0,0 +1,459 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Convert a trained DensePose model (.pkl weights + yaml config) into a pair
+of Caffe2 protobufs (init_net and predict_net) optimized for CPU inference.
+
+The full inference pipeline (conv body, RPN, box head, box post-processing and
+all enabled RoI heads) is exported as a single net (see modeling.fused_net).
+The conversion:
+  - removes the device name scope (e.g., 'gpu_0/') and places all ops on CPU
+  - replaces the Detectron Python ops (proposal ops and the DistributeHeadRois
+    ops of the fused net) by Caffe2 C++ operators, so that the exported net
+    runs without Detectron; the conversion fails if any other Python op is left
+  - strips ops that are only useful during training (e.g., StopGradient)
+  - folds every AffineChannel (frozen BN) into the preceding Conv
+
+If a test image is given, the outputs of the converted net are compared with
+the outputs of the original (unconverted) net with compare_model and the CPU
+latency of both nets is reported.
+
+Example:
+    python2 tools/convert_densepose_cpu.py \\
+        --cfg configs/DensePose_ResNet50_FPN_s1x-e2e.yaml \\
+        --wts /path/to/model_final.pkl \\
+        --out_dir /tmp/densepose_cpu \\
+        --test_img /path/to/image.jpg
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import copy
+import cPickle as pickle
+import cv2  # NOQA (Must import before importing caffe2 due to bug in cv2)
+import logging
+import numpy as np
+import os
+import pprint
+import sys
+
+from caffe2.proto import caffe2_pb2
+from caffe2.python import core
+from caffe2.python import workspace
+
+from detectron.core.config import assert_and_infer_cfg
+from detectron.core.config import cfg
+from detectron.core.config import load_cfg
+from detectron.core.config import merge_cfg_from_file
+from detectron.core.config import merge_cfg_from_list
+from detectron.modeling import fused_net
+from detectron.modeling import model_builder
+from detectron.modeling.generate_anchors import generate_anchors
+from detectron.utils.io import is_flat_weights_file
+from detectron.utils.io import load_flat_weights
+from detectron.utils.logging import setup_logging
+from detectron.utils.timer import Timer
+import detectron.utils.blob as blob_utils
+import detectron.utils.c2 as c2_utils
+import detectron.utils.model_convert_utils as mutils
+import detectron.utils.net as net_utils
+
+c2_utils.import_detectron_ops()
+
+# OpenCL may be enabled by default in OpenCV3; disable it because it's not
+# thread safe and causes unwanted GPU memory allocations.
+cv2.ocl.setUseOpenCL(False)
+
+logger = logging.getLogger(__name__)
+
+# Input blobs of the exported net
+INPUT_BLOB_NAMES = ['data', 'im_info']
+
+# Ops that are the identity at inference time
+TRAINING_ONLY_OP_TYPES = ['StopGradient', 'Dropout']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Convert a DensePose model to CPU optimized protobufs'
+    )
+    parser.add_argument(
+        '--cfg',
+        dest='cfg',
+        help='cfg model file (/path/to/model_config.yaml)',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--wts',
+        dest='weights',
+        help='weights model file (/path/to/model_weights.pkl)',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--out_dir',
+        dest='out_dir',
+        help='output dir for the init_net and predict_net protobufs',
+        default='/tmp/densepose_cpu',
+        type=str
+    )
+    parser.add_argument(
+        '--test_img',
+        dest='test_img',
+        help='image used to check the converted net and to benchmark it',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--benchmark_iters',
+        dest='benchmark_iters',
+        help='number of timed iterations in the CPU latency benchmark',
+        default=20,
+        type=int
+    )
+    parser.add_argument(
+        '--no_fuse_affine',
+        dest='fuse_affine',
+        help='do not fold AffineChannel ops into the preceding Conv',
+        action='store_false'
+    )
+    parser.add_argument(
+        'opts',
+        help='See detectron/core/config.py for all options',
+        default=None,
+        nargs=argparse.REMAINDER
+    )
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+    return parser.parse_args()
+
+
+def load_model(weights_file):
+    """Build the fused inference net and load its weights on CPU. Returns the
+    net (as a NetDef with unscoped blob names) and a dict of weight blobs.
+    """
+    model = model_builder.create(cfg.MODEL.TYPE, train=False)
+    if is_flat_weights_file(weights_file):
+        src_blobs = load_flat_weights(weights_file)
+    else:
+        with open(weights_file, 'r') as f:
+            src_blobs = pickle.load(f)
+    if 'cfg' in src_blobs:
+        net_utils.configure_bbox_reg_weights(model, load_cfg(src_blobs['cfg']))
+    if 'blobs' in src_blobs:
+        src_blobs = src_blobs['blobs']
+    with c2_utils.NamedCudaScope(0):
+        net = fused_net.build_fused_inference_net(model)
+    net = unscope_net(net.Proto())
+
+    blobs = {}
+    for name in net.external_input:
+        if name in INPUT_BLOB_NAMES:
+            continue
+        assert name in src_blobs, \
+            'Blob {} not found in weights file {}'.format(name, weights_file)
+        blobs[name] = src_blobs[name].astype(np.float32, copy=False)
+    return net, blobs
+
+
+def unscope_net(net):
+    """Remove the device name scope from all blob names in the net."""
+    net = copy.deepcopy(net)
+
+    def _unscope(names):
+        unscoped = [c2_utils.UnscopeName(str(n)) for n in names]
+        del names[:]
+        names.extend(unscoped)
+
+    for op in net.op:
+        _unscope(op.input)
+        _unscope(op.output)
+    _unscope(net.external_input)
+    _unscope(net.external_output)
+    return net
+
+
+def convert_model(net, blobs, fuse_affine=True):
+    """Apply all CPU conversions (see module docstring) to the net."""
+    net = copy.deepcopy(net)
+    blobs = copy.deepcopy(blobs)
+    mutils.convert_op_in_proto(
+        net, [
+            lambda op: convert_python_proposal_ops(op, blobs),
+            convert_distribute_head_rois_op,
+        ]
+    )
+    python_ops = [op.name for op in net.op if op.type == 'Python']
+    assert len(python_ops) == 0, \
+        'Python ops {} have no C++ equivalent; the converted net could only ' \
+        'be run with the Detectron Python ops registered'.format(python_ops)
+    remove_training_only_ops(net)
+    # Anchors used by the C++ GenerateProposals ops are new external inputs
+    net.external_input.extend(
+        [b for b in blobs if b not in net.external_input]
+    )
+    if fuse_affine:
+        net, blobs = mutils.fuse_net_affine(net, blobs)
+    return net, blobs
+
+
+def convert_python_proposal_ops(op, blobs):
+    """Convert the Detectron Python ops GenerateProposalsOp and
+    CollectAndDistributeFpnRpnProposalsOp into the equivalent Caffe2 C++
+    operators. Returns None for any other op.
+    """
+    if op.type != 'Python':
+        return None
+    if op.name.startswith('GenerateProposalsOp'):
+        spatial_scale = mutils.get_op_arg_valf(op, 'spatial_scale', None)
+        assert spatial_scale is not None
+        anchors_name = op.output[0] + '_anchors'
+        blobs[anchors_name] = get_anchors(spatial_scale)
+        return core.CreateOperator(
+            'GenerateProposals',
+            list(op.input) + [anchors_name],
+            list(op.output),
+            spatial_scale=spatial_scale,
+            pre_nms_topN=cfg.TEST.RPN_PRE_NMS_TOP_N,
+            post_nms_topN=cfg.TEST.RPN_POST_NMS_TOP_N,
+            nms_thresh=cfg.TEST.RPN_NMS_THRESH,
+            min_size=cfg.TEST.RPN_MIN_SIZE,
+            correct_transform_coords=True
+        )
+    if op.name.startswith('CollectAndDistributeFpnRpnProposalsOp'):
+        return core.CreateOperator(
+            'CollectAndDistributeFpnRpnProposals',
+            list(op.input),
+            list(op.output),
+            roi_canonical_scale=cfg.FPN.ROI_CANONICAL_SCALE,
+            roi_canonical_level=cfg.FPN.ROI_CANONICAL_LEVEL,
+            roi_max_level=cfg.FPN.ROI_MAX_LEVEL,
+            roi_min_level=cfg.FPN.ROI_MIN_LEVEL,
+            rpn_max_level=cfg.FPN.RPN_MAX_LEVEL,
+            rpn_min_level=cfg.FPN.RPN_MIN_LEVEL,
+            rpn_post_nms_topN=cfg.TEST.RPN_POST_NMS_TOP_N
+        )
+    return None
+
+
+def convert_distribute_head_rois_op(op):
+    """Convert a DistributeHeadRoisOp of the fused net (see
+    ops.distribute_head_rois) into Caffe2 C++ operators. Returns None for any
+    other op.
+
+    The RoIs are the post-NMS boxes with a zero batch index column. Their FPN
+    levels are assigned by CollectAndDistributeFpnRpnProposals, given the RoIs
+    as a single RPN level with strictly decreasing scores (0, -1, -2, ...) so
+    that it keeps the RoIs in the order of the boxes.
+    """
+    if op.type != 'Python' or not op.name.startswith('DistributeHeadRoisOp'):
+        return None
+    boxes = op.input[0]
+    rois = op.output[0]
+    if cfg.FPN.MULTILEVEL_ROIS:
+        rois = rois + '_unsorted'
+    ops = [
+        core.CreateOperator(
+            'Slice', [boxes], [rois + '_x1'], starts=[0, 0], ends=[-1, 1]
+        ),
+        core.CreateOperator(
+            'ConstantFill', [rois + '_x1'], [rois + '_batch_inds'], value=0.
+        ),
+        core.CreateOperator(
+            'Concat', [rois + '_batch_inds', boxes],
+            [rois, rois + '_concat_dims'], axis=1
+        ),
+    ]
+    if not cfg.FPN.MULTILEVEL_ROIS:
+        return ops
+    scores = rois + '_scores'
+    ops += [
+        core.CreateOperator('Shape', [boxes], [scores + '_shape']),
+        core.CreateOperator(
+            'Slice', [scores + '_shape'], [scores + '_len'], starts=[0],
+            ends=[1]
+        ),
+        core.CreateOperator(
+            'Cast', [scores + '_len'], [scores + '_len'],
+            to=caffe2_pb2.TensorProto.INT32
+        ),
+        core.CreateOperator(
+            'LengthsRangeFill', [scores + '_len'], [scores + '_range']
+        ),
+        core.CreateOperator(
+            'Cast', [scores + '_range'], [scores + '_range'],
+            to=caffe2_pb2.TensorProto.FLOAT
+        ),
+        core.CreateOperator('Negative', [scores + '_range'], [scores]),
+        core.CreateOperator(
+            'CollectAndDistributeFpnRpnProposals',
+            [rois, scores],
+            list(op.output),
+            roi_canonical_scale=cfg.FPN.ROI_CANONICAL_SCALE,
+            roi_canonical_level=cfg.FPN.ROI_CANONICAL_LEVEL,
+            roi_max_level=cfg.FPN.ROI_MAX_LEVEL,
+            roi_min_level=cfg.FPN.ROI_MIN_LEVEL,
+            rpn_max_level=cfg.FPN.RPN_MIN_LEVEL,
+            rpn_min_level=cfg.FPN.RPN_MIN_LEVEL,
+            # Keep all the boxes
+            rpn_post_nms_topN=2**31 - 1
+        ),
+    ]
+    return ops
+
+
+def get_anchors(spatial_scale):
+    """Anchors of the RPN level with the given spatial scale (the same anchors
+    as the ones given to GenerateProposalsOp when building the model).
+    """
+    if cfg.FPN.FPN_ON and cfg.FPN.MULTILEVEL_RPN:
+        lvl = int(round(np.log2(1. / spatial_scale)))
+        sizes = (
+            cfg.FPN.RPN_ANCHOR_START_SIZE * 2.**(lvl - cfg.FPN.RPN_MIN_LEVEL),
+        )
+        aspect_ratios = cfg.FPN.RPN_ASPECT_RATIOS
+    else:
+        sizes = cfg.RPN.SIZES
+        aspect_ratios = cfg.RPN.ASPECT_RATIOS
+    anchors = generate_anchors(
+        stride=1. / spatial_scale, sizes=sizes, aspect_ratios=aspect_ratios
+    )
+    return anchors.astype(np.float32)
+
+
+def remove_training_only_ops(net):
+    """Remove ops that compute the identity at inference time by rewiring
+    their consumers to read the op input directly.
+    """
+    renames = {}
+    ops = []
+    for op in net.op:
+        for i, blob_in in enumerate(op.input):
+            if blob_in in renames:
+                op.input[i] = renames[blob_in]
+        if (
+            op.type in TRAINING_ONLY_OP_TYPES and len(op.input) == 1 and
+            op.output[0] not in net.external_output
+        ):
+            if op.output[0] != op.input[0]:
+                renames[op.output[0]] = op.input[0]
+            continue
+        ops.append(op)
+    del net.op[:]
+    net.op.extend(ops)
+
+
+def save_model(net, blobs, out_dir):
+    init_net = mutils.gen_init_net_from_blobs(blobs)
+    init_net.name = net.name + '_init'
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    for file_name, proto in [
+        ('model.pb', net), ('model_init.pb', init_net)
+    ]:
+        with open(os.path.join(out_dir, file_name), 'wb') as f:
+            f.write(proto.SerializeToString())
+    with open(os.path.join(out_dir, 'model.pbtxt'), 'w') as f:
+        f.write(str(net))
+    logger.info('Wrote {} ops ({} params) to {}'.format(
+        len(net.op), len(blobs), out_dir))
+
+
+def run_model(net, blobs, im, check_blobs=None, iters=0):
+    """Run the net on an image in a new workspace. Returns the check_blobs
+    fetched after the first run and the average run time over `iters` timed
+    runs.
+    """
+    workspace.ResetWorkspace()
+    cpu_device = core.DeviceOption(caffe2_pb2.CPU)
+    for name, blob in blobs.items():
+        workspace.FeedBlob(name, blob, device_option=cpu_device)
+    inputs = {}
+    inputs['data'], _, inputs['im_info'] = blob_utils.get_image_blob(
+        im, cfg.TEST.SCALE, cfg.TEST.MAX_SIZE
+    )
+    for name, blob in inputs.items():
+        workspace.FeedBlob(name, blob, device_option=cpu_device)
+    workspace.CreateNet(net)
+    workspace.RunNet(net.name)
+    ret = {b: workspace.FetchBlob(b) for b in (check_blobs or [])}
+    timer = Timer()
+    for _ in range(iters):
+        timer.tic()
+        workspace.RunNet(net.name)
+        timer.toc()
+    return ret, timer.average_time
+
+
+def verify_and_benchmark(orig, converted, im, iters):
+    orig_net, orig_blobs = orig
+    conv_net, conv_blobs = converted
+    check_blobs = [
+        b for b in conv_net.external_output
+        if b in orig_net.external_output
+    ]
+    times = {}
+
+    def _run(net, blobs, key):
+        def _model_func(test_image, check_blobs):
+            ret, times[key] = run_model(net, blobs, test_image, check_blobs)
+            return ret
+        return _model_func
+
+    # Compares the detections and the outputs of all RoI heads (IUV included)
+    mutils.compare_model(
+        _run(orig_net, orig_blobs, 'orig'),
+        _run(conv_net, conv_blobs, 'converted'),
+        im,
+        check_blobs
+    )
+    logger.info('Outputs of the converted net match: {}'.format(check_blobs))
+
+    _, times['orig'] = run_model(orig_net, orig_blobs, im, iters=iters)
+    _, times['converted'] = run_model(conv_net, conv_blobs, im, iters=iters)
+    logger.info('CPU latency over {} iters:'.format(iters))
+    logger.info(' | original:  {:.3f}s'.format(times['orig']))
+    logger.info(' | converted: {:.3f}s'.format(times['converted']))
+
+
+def main(args):
+    merge_cfg_from_file(args.cfg)
+    if args.opts is not None:
+        merge_cfg_from_list(args.opts)
+    cfg.NUM_GPUS = 1
+    assert_and_infer_cfg(cache_urls=False)
+    logger.info('Converting model with config:')
+    logger.info(pprint.pformat(cfg))
+
+    orig_net, orig_blobs = load_model(args.weights)
+    conv_net, conv_blobs = convert_model(
+        orig_net, orig_blobs, fuse_affine=args.fuse_affine
+    )
+    save_model(conv_net, conv_blobs, args.out_dir)
+
+    if args.test_img is not None:
+        im = cv2.imread(args.test_img)
+        assert im is not None, 'Could not read {}'.format(args.test_img)
+        verify_and_benchmark(
+            (orig_net, orig_blobs),
+            (conv_net, conv_blobs),
+            im,
+            args.benchmark_iters
+        )
+
+
+if __name__ == '__main__':
+    workspace.GlobalInit(['caffe2', '--caffe2_log_level=0'])
+    setup_logging(__name__)
+    args = parse_args()
+    main(args)
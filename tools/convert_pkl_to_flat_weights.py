@@ -0,0 +1,89 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Convert a pickled weights file (.pkl) into the flat, memory mappable weights
+format (see utils.io.save_flat_weights). The converted file can be used
+anywhere a weights file is expected (e.g., TEST.WEIGHTS) and loads without
+unpickling; processes on the same host share its pages.
+
+Floating point blobs are stored as float32 (the type they are fed with) and,
+unless --keep_momentum is given, the momentum blobs (which are only needed to
+resume training) are dropped.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import cPickle as pickle
+import logging
+import numpy as np
+import os
+import sys
+
+from detectron.utils.io import save_flat_weights
+from detectron.utils.logging import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Convert a .pkl weights file to the flat weights format'
+    )
+    parser.add_argument(
+        '--wts',
+        dest='weights',
+        help='weights model file (/path/to/model_weights.pkl)',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--output',
+        dest='output',
+        help='output file (default: weights file with a .wts extension)',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--keep_momentum',
+        dest='keep_momentum',
+        help='also convert the momentum blobs',
+        action='store_true'
+    )
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+    return parser.parse_args()
+
+
+def main(args):
+    with open(args.weights, 'r') as f:
+        src_blobs = pickle.load(f)
+    cfg_yaml = src_blobs.get('cfg', None)
+    if 'blobs' in src_blobs:
+        src_blobs = src_blobs['blobs']
+    blobs = {}
+    for name, blob in src_blobs.items():
+        if name.endswith('_momentum') and not args.keep_momentum:
+            continue
+        if isinstance(blob, np.ndarray) and blob.dtype.kind == 'f':
+            blob = blob.astype(np.float32, copy=False)
+        blobs[name] = blob
+    output = args.output
+    if output is None:
+        output = os.path.splitext(args.weights)[0] + '.wts'
+    save_flat_weights(blobs, output, cfg_yaml=cfg_yaml)
+    logger.info('Wrote {} blobs to {}'.format(len(blobs), output))
+
+
+if __name__ == '__main__':
+    setup_logging(__name__)
+    args = parse_args()
+    main(args)
@@ -0,0 +1,268 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+##############################################################################
+
+"""Post-training int8 quantization of the body UV (DensePose) head for CPU
+inference.
+
+The model is run on CPU as a fused inference net (see modeling.fused_net).
+Activation ranges of the body UV head convolutions are collected on the first
+--calib_images images of the first TEST.DATASETS dataset, the head convolutions
+are converted to int8 (see utils.quantization) and the int8 body UV head net is
+written to --out_dir. The float and the int8 models are then evaluated on the
+whole dataset and the body UV AP (GPS based, from denseposeCOCOeval) and the
+latencies of both models are reported.
+
+Example:
+    python2 tools/quantize_body_uv_head.py \\
+        --cfg configs/DensePose_ResNet50_FPN_s1x-e2e.yaml \\
+        --wts /path/to/model_final.pkl \\
+        --calib_images 300 \\
+        TEST.DATASETS "('dense_coco_2014_minival',)"
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import copy
+import cv2  # NOQA (Must import before importing caffe2 due to bug in cv2)
+import logging
+import os
+import sys
+
+from caffe2.python import core
+from caffe2.python import workspace
+
+from detectron.core.config import assert_and_infer_cfg
+from detectron.core.config import cfg
+from detectron.core.config import merge_cfg_from_file
+from detectron.core.config import merge_cfg_from_list
+from detectron.core.test import im_detect_all
+from detectron.datasets import task_evaluation
+from detectron.modeling import fused_net
+from detectron.utils.io import cache_url
+from detectron.utils.logging import setup_logging
+from detectron.utils.timer import Timer
+import detectron.core.test_engine as test_engine
+import detectron.utils.c2 as c2_utils
+import detectron.utils.quantization as quant_utils
+
+c2_utils.import_detectron_ops()
+
+# OpenCL may be enabled by default in OpenCV3; disable it because it's not
+# thread safe and causes unwanted GPU memory allocations.
+cv2.ocl.setUseOpenCL(False)
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Int8 quantization of the body UV head'
+    )
+    parser.add_argument(
+        '--cfg',
+        dest='cfg',
+        help='cfg model file (/path/to/model_config.yaml)',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--wts',
+        dest='weights',
+        help='weights model file (/path/to/model_weights.pkl)',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--calib_images',
+        dest='calib_images',
+        help='number of images used to collect activation ranges',
+        default=300,
+        type=int
+    )
+    parser.add_argument(
+        '--bench_iters',
+        dest='bench_iters',
+        help='number of timed runs of the body UV head in the benchmark',
+        default=50,
+        type=int
+    )
+    parser.add_argument(
+        '--out_dir',
+        dest='out_dir',
+        help='output dir for the int8 body UV head net',
+        default='/tmp/densepose_int8',
+        type=str
+    )
+    parser.add_argument(
+        'opts',
+        help='See detectron/core/config.py for all options',
+        default=None,
+        nargs=argparse.REMAINDER
+    )
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+    return parser.parse_args()
+
+
+def detect(model, roidb, num_images=None):
+    """Run im_detect_all on the (first num_images) images of the roidb. Yields
+    the image index and the detections of each image.
+    """
+    for i, entry in enumerate(roidb[:num_images]):
+        if 'has_no_densepose' in entry.keys():
+            continue
+        im = cv2.imread(entry['image'])
+        with c2_utils.NamedCudaScope(0):
+            cls_results = im_detect_all(model, im, None)
+        yield i, cls_results
+
+
+def calibrate(model, roidb, head_op_inds, num_images):
+    """Collect the activation ranges of the body UV head."""
+    observer = quant_utils.ActivationRangeObserver(
+        quant_utils.get_blobs_to_observe(
+            model.fused_net.Proto(), head_op_inds
+        )
+    )
+    for _, (cls_boxes, _, _, _) in detect(model, roidb, num_images):
+        # Blobs of the head are stale if the image has no detections
+        if sum(len(b) for b in cls_boxes[1:]) > 0:
+            observer.observe()
+    logger.info('Collected activation ranges for {} blobs'.format(
+        len(observer.ranges)))
+    return observer.ranges
+
+
+def evaluate(model, roidb, dataset, output_dir):
+    """Evaluate the model on the whole dataset. Returns the evaluation results
+    and the average inference time per image.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    num_classes = cfg.MODEL.NUM_CLASSES
+    all_boxes, all_segms, all_keyps, all_bodys = \
+        test_engine.empty_results(num_classes, len(roidb))
+    timer = Timer()
+    timer.tic()
+    for i, (cls_boxes, cls_segms, cls_keyps, cls_bodys) in detect(
+        model, roidb
+    ):
+        test_engine.extend_results(i, all_boxes, cls_boxes)
+        if cls_segms is not None:
+            test_engine.extend_results(i, all_segms, cls_segms)
+        if cls_keyps is not None:
+            test_engine.extend_results(i, all_keyps, cls_keyps)
+        if cls_bodys is not None:
+            test_engine.extend_results(i, all_bodys, cls_bodys)
+    timer.toc()
+    results = task_evaluation.evaluate_all(
+        dataset, all_boxes, all_segms, all_keyps, all_bodys, output_dir
+    )
+    return results[dataset.name], timer.total_time / len(roidb)
+
+
+def get_head_net(net, start, name):
+    """Net made of the ops of the fused net `net` from index `start` onwards,
+    i.e., the body UV head ops (used to benchmark the head on the RoIs of the
+    last image that went through the fused net).
+    """
+    head_net = core.Net(name)
+    head_net.Proto().op.extend(copy.deepcopy(net.op[start:]))
+    return head_net
+
+
+def benchmark_head(head_net, iters):
+    workspace.CreateNet(head_net)
+    workspace.RunNet(head_net.Proto().name)
+    timer = Timer()
+    for _ in range(iters):
+        timer.tic()
+        workspace.RunNet(head_net.Proto().name)
+        timer.toc()
+    return timer.average_time
+
+
+def main(args):
+    merge_cfg_from_file(args.cfg)
+    if args.opts is not None:
+        merge_cfg_from_list(args.opts)
+    cfg.NUM_GPUS = 1
+    cfg.TEST.FUSED_NET = True
+    args.weights = cache_url(args.weights, cfg.DOWNLOAD_CACHE)
+    assert_and_infer_cfg(cache_urls=False)
+    assert cfg.MODEL.BODY_UV_ON, 'The model has no body UV head'
+    assert core.IsOperatorWithEngine('Conv', 'DNNLOWP'), \
+        'Caffe2 was built without the DNNLOWP (int8) operators'
+
+    dataset_name, proposal_file = test_engine.get_inference_dataset(0)
+    roidb, dataset, _, _, _ = test_engine.get_roidb_and_dataset(
+        dataset_name, proposal_file, None
+    )
+    model = test_engine.initialize_model_from_cfg(args.weights)
+    float_net = model.fused_net
+    head_op_inds = fused_net.get_head_op_inds(float_net, model, 'body_uv_rois')
+
+    # The head ops are the last ops of the fused net (BODY_UV_ON is the last
+    # RoI head), which get_head_net relies on
+    assert head_op_inds[-1] == len(float_net.Proto().op) - 1
+    ranges = calibrate(model, roidb, head_op_inds, args.calib_images)
+    int8_net = core.Net(quant_utils.quantize_net(
+        float_net.Proto(), head_op_inds, ranges, name='fused_net_int8'
+    ))
+    workspace.CreateNet(int8_net)
+
+    # Quantization only rewrites the head ops so the head starts at the same
+    # op index in both nets
+    int8_head_net = get_head_net(
+        int8_net.Proto(), head_op_inds[0], 'body_uv_net_int8'
+    )
+    if not os.path.exists(args.out_dir):
+        os.makedirs(args.out_dir)
+    with open(os.path.join(args.out_dir, 'body_uv_net_int8.pb'), 'wb') as f:
+        f.write(int8_head_net.Proto().SerializeToString())
+    with open(os.path.join(args.out_dir, 'body_uv_net_int8.pbtxt'), 'w') as f:
+        f.write(str(int8_head_net.Proto()))
+    logger.info('Wrote int8 body UV head net to {}'.format(args.out_dir))
+
+    results = {}
+    im_times = {}
+    head_times = {}
+    for key, net, head_net in [
+        ('float', float_net, get_head_net(
+            float_net.Proto(), head_op_inds[0], 'body_uv_net_float')),
+        ('int8', int8_net, int8_head_net)
+    ]:
+        model.fused_net = net
+        output_dir = os.path.join(args.out_dir, key)
+        results[key], im_times[key] = evaluate(
+            model, roidb, dataset, output_dir
+        )
+        head_times[key] = benchmark_head(head_net, args.bench_iters)
+
+    logger.info('Body UV results (float -> int8):')
+    for metric, value in results['float']['body_uv'].items():
+        int8_value = results['int8']['body_uv'][metric]
+        logger.info(' | {}: {:.4f} -> {:.4f} ({:+.4f})'.format(
+            metric, value, int8_value, int8_value - value))
+    logger.info('CPU latency (float -> int8):')
+    logger.info(' | per image: {:.3f}s -> {:.3f}s'.format(
+        im_times['float'], im_times['int8']))
+    logger.info(' | body UV head: {:.3f}s -> {:.3f}s ({:.2f}x)'.format(
+        head_times['float'], head_times['int8'],
+        head_times['float'] / max(head_times['int8'], 1e-12)))
+
+
+if __name__ == '__main__':
+    workspace.GlobalInit(['caffe2', '--caffe2_log_level=0'])
+    setup_logging(__name__)
+    args = parse_args()
+    main(args)